@@ -0,0 +1,76 @@
+""" Compare the cost of indexing a newly added subtree one document at a
+time (``Catalog.index_doc`` per node, as the add subscriber used to) with
+indexing it in bulk (``Catalog.index_docs``), including the
+``is_catalogable`` check made for each node.
+
+Usage: python benchmarks/catalog_index_docs.py [sizes]
+
+e.g. python benchmarks/catalog_index_docs.py 10000,100000
+
+``size`` documents with random objectids (as the object map allocates
+them) are indexed in a catalog with two field indexes and a keyword index
+which already holds ``size`` other documents.  The best of three runs is
+printed.
+"""
+
+import random
+import sys
+import time
+
+from hypatia.field import FieldIndex
+from hypatia.keyword import KeywordIndex
+
+from pyramid.registry import Registry
+
+from substanced.catalog import (
+    Catalog,
+    is_catalogable,
+    )
+from substanced.content import ContentRegistry
+
+class Dummy(object):
+    def __init__(self, n):
+        self.color = n % 10
+        self.title = u'title %s' % n
+        self.allowed = ['system.Everyone', 'group:%s' % (n % 50)]
+
+def build(size):
+    catalog = Catalog()
+    catalog.add('color', FieldIndex('color'), send_events=False)
+    catalog.add('title', FieldIndex('title'), send_events=False)
+    catalog.add('allowed', KeywordIndex('allowed'), send_events=False)
+    docs = [(random.randint(0, 2**62), Dummy(n)) for n in range(size * 2)]
+    catalog.index_docs(docs[:size])
+    return catalog, docs[size:]
+
+def main(argv=sys.argv):
+    sizes = [10000, 100000]
+    if len(argv) > 1:
+        sizes = [int(x) for x in argv[1].split(',')]
+    registry = Registry()
+    registry.content = ContentRegistry(registry)
+    registry.content.add('Dummy', Dummy.__module__ + '.Dummy', Dummy,
+                         catalog=True)
+    print '%8s %-12s %12s' % ('size', 'method', 'seconds')
+    for size in sizes:
+        random.seed(size)
+        for name in ('index_doc', 'index_docs'):
+            best = None
+            for repeat in range(3):
+                catalog, docs = build(size)
+                start = time.time()
+                if name == 'index_doc':
+                    for docid, obj in docs:
+                        if is_catalogable(obj, registry):
+                            catalog.index_doc(docid, obj)
+                else:
+                    catalog.index_docs(
+                        [(docid, obj) for docid, obj in docs
+                         if is_catalogable(obj, registry)])
+                elapsed = time.time() - start
+                assert len(catalog.objectids) == size * 2
+                best = min(best or elapsed, elapsed)
+            print '%8s %-12s %12.3f' % (size, name, best)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+""" Compare filtering all the results of a catalog search by permission
+before showing their first page with filtering them lazily, when every
+document has to be loaded and checked.
+
+Usage: python benchmarks/catalog_lazy_permitted.py [sizes] [page_size]
+
+e.g. python benchmarks/catalog_lazy_permitted.py 10000,100000 20
+
+The tree built by ``catalog_permitted_search.py`` is searched for half of
+its documents, filtered by a permission checker which doesn't tell which
+principals and permission it checks (so the ``allowed`` index can't be
+used), and the first page of results is put in a ``Batch``.
+"""
+
+import sys
+import time
+
+from pyramid import testing
+from pyramid.authorization import ACLAuthorizationPolicy
+from pyramid.interfaces import IAuthorizationPolicy
+from pyramid.security import Authenticated, Everyone
+
+from substanced.catalog import PermissionChecker, Search
+from substanced.util import Batch
+
+from catalog_permitted_search import build
+
+def first_page(root, checker, lazy, page_size):
+    request = testing.DummyRequest(params={'batch_size':page_size})
+    request.url = 'http://example.com'
+    start = time.time()
+    search = Search(root, checker, lazy=lazy)
+    num, oids, resolver = search.search(color='red')
+    if lazy:
+        batch = Batch(oids, request)
+    else:
+        batch = Batch(list(oids), request)
+    return batch, time.time() - start
+
+def main(argv=sys.argv):
+    sizes = [10000, 100000]
+    page_size = 20
+    if len(argv) > 1:
+        sizes = [int(x) for x in argv[1].split(',')]
+    if len(argv) > 2:
+        page_size = int(argv[2])
+    config = testing.setUp()
+    policy = ACLAuthorizationPolicy()
+    config.registry.registerUtility(policy, IAuthorizationPolicy)
+    principals = [Everyone, Authenticated, 'bob'] + [
+        'group:%s' % n for n in range(5)]
+    permission_checker = PermissionChecker(policy, principals, 'view')
+    def checker(ob):
+        return permission_checker(ob)
+    print '%8s %12s %12s %8s' % ('size', 'eager (s)', 'lazy (s)', 'speedup')
+    try:
+        for size in sizes:
+            root = build(size, 0.01)
+            eager_batch, eager = first_page(root, checker, False, page_size)
+            lazy_batch, lazy = first_page(root, checker, True, page_size)
+            assert len(lazy_batch.items) == len(eager_batch.items)
+            print '%8s %12.3f %12.3f %7.1fx' % (
+                size, eager, lazy, eager / lazy)
+    finally:
+        testing.tearDown()
+
+if __name__ == '__main__':
+    main()
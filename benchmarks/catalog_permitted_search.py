@@ -0,0 +1,105 @@
+""" Compare filtering the results of a catalog search by the ``view``
+permission by loading and checking every document (what ``Search.allowed``
+always did) with filtering them with the catalog's ``allowed`` index.
+
+Usage: python benchmarks/catalog_permitted_search.py [sizes] [custom]
+
+e.g. python benchmarks/catalog_permitted_search.py 10000,100000 0.01
+
+A tree of ``size`` documents in folders of 100 documents is built in memory
+with a catalog holding a field index and an ``allowed`` keyword index.  Each
+folder allows a different group to view the documents it contains, and the
+``custom`` fraction of the documents have an ACL which denies one group.  A search
+matching half of the documents is then filtered for a user in five of the
+groups.
+"""
+
+import sys
+import time
+
+from hypatia.field import FieldIndex
+from hypatia.keyword import KeywordIndex
+from pyramid import testing
+from pyramid.authorization import ACLAuthorizationPolicy
+from pyramid.interfaces import IAuthorizationPolicy
+from pyramid.security import Allow, Authenticated, Deny, Everyone
+
+from substanced.catalog import Catalog, PermissionChecker, Search
+from substanced.catalog.discriminators import get_allowed_to_view
+from substanced.folder import Folder
+from substanced.objectmap import ObjectMap
+
+GROUPS = 50
+
+class Content(object):
+    def __init__(self, n):
+        self.color = n % 2 and 'red' or 'blue'
+
+def build(size, custom):
+    root = Folder()
+    objectmap = root.__objectmap__ = ObjectMap(root)
+    objectmap.add(root, (u'',))
+    services = Folder()
+    root.add('__services__', services, send_events=False, reserved_names=())
+    objectmap.add(services, (u'', u'__services__'))
+    catalog = Catalog()
+    services.add('catalog', catalog, send_events=False)
+    objectmap.add(catalog, (u'', u'__services__', u'catalog'))
+    catalog.add('color', FieldIndex('color'), send_events=False)
+    catalog.add('allowed', KeywordIndex(get_allowed_to_view),
+                send_events=False)
+    every = custom and int(1 / custom) or None
+    folder = None
+    for n in range(size):
+        if n % 100 == 0:
+            name = u'f%s' % n
+            folder = Folder()
+            group = 'group:%s' % (n / 100 % GROUPS)
+            folder.__acl__ = [(Allow, group, 'view')]
+            root.add(name, folder, send_events=False)
+            objectmap.add(folder, (u'', name))
+        obj = Content(n)
+        if every and n % every == 0:
+            obj.__acl__ = [(Deny, 'group:0', 'view'), (Allow, Everyone, 'view')]
+        name = u'o%s' % n
+        folder.add(name, obj, send_events=False)
+        oid = objectmap.add(obj, (u'', folder.__name__, name))
+        catalog.index_doc(oid, obj)
+    return root
+
+def filtered(root, checker):
+    search = Search(root, checker, use_permission_indexes=True)
+    start = time.time()
+    num, oids, resolver = search.search(color='red')
+    return num, time.time() - start
+
+def main(argv=sys.argv):
+    sizes = [10000, 100000]
+    custom = 0.01
+    if len(argv) > 1:
+        sizes = [int(x) for x in argv[1].split(',')]
+    if len(argv) > 2:
+        custom = float(argv[2])
+    config = testing.setUp()
+    policy = ACLAuthorizationPolicy()
+    config.registry.registerUtility(policy, IAuthorizationPolicy)
+    principals = [Everyone, Authenticated, 'bob'] + [
+        'group:%s' % n for n in range(5)]
+    checker = PermissionChecker(policy, principals, 'view')
+    def post_filter(ob):
+        return checker(ob)
+    print '%8s %8s %12s %12s %8s' % (
+        'size', 'allowed', 'load (s)', 'index (s)', 'speedup')
+    try:
+        for size in sizes:
+            root = build(size, custom)
+            num1, loading = filtered(root, post_filter)
+            num2, indexed = filtered(root, checker)
+            assert num1 == num2, (num1, num2)
+            print '%8s %8s %12.3f %12.3f %7.1fx' % (
+                size, num1, loading, indexed, loading / indexed)
+    finally:
+        testing.tearDown()
+
+if __name__ == '__main__':
+    main()
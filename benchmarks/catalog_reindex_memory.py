@@ -0,0 +1,108 @@
+""" Measure the peak memory used by ``Catalog.reindex`` as the number of
+objects in the catalog grows.
+
+Usage: python benchmarks/catalog_reindex_memory.py [sizes] [max_memory]
+
+e.g. python benchmarks/catalog_reindex_memory.py 10000,50000,100000 100
+
+A FileStorage database holding a tree of ``size`` objects (in folders of
+100 objects each, each object carrying a kilobyte of text) and a catalog
+with a field index is built in a temporary directory.  It is then reindexed
+in a fresh process, which reports its peak resident set size and the time
+taken.  The peak should stay roughly the same whatever the size.
+"""
+
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import transaction
+from hypatia.field import FieldIndex
+from persistent import Persistent
+from ZODB import DB
+from ZODB.FileStorage import FileStorage
+
+from substanced.catalog import Catalog
+from substanced.folder import Folder
+from substanced.objectmap import ObjectMap
+
+class Content(Persistent):
+    def __init__(self, n):
+        self.color = n % 2 and 'red' or 'blue'
+        self.text = u'x' * 1024
+
+def build(filename, size):
+    db = DB(FileStorage(filename))
+    conn = db.open()
+    root = Folder()
+    conn.root()['app'] = root
+    objectmap = root.__objectmap__ = ObjectMap(root)
+    objectmap.add(root, (u'',))
+    catalog = Catalog()
+    root.add('catalog', catalog, send_events=False)
+    objectmap.add(catalog, (u'', u'catalog'))
+    catalog.add('color', FieldIndex('color'), send_events=False)
+    folder = None
+    for n in range(size):
+        if n % 100 == 0:
+            name = u'f%s' % n
+            folder = Folder()
+            root.add(name, folder, send_events=False)
+            objectmap.add(folder, (u'', name))
+        obj = Content(n)
+        folder.add(u'o%s' % n, obj, send_events=False)
+        oid = objectmap.add(obj, (u'', folder.__name__, u'o%s' % n))
+        catalog.objectids.insert(oid)
+        if n % 1000 == 999:
+            transaction.commit()
+            conn.cacheMinimize()
+    transaction.commit()
+    db.close()
+
+def reindex(filename, max_memory, queue):
+    db = DB(FileStorage(filename))
+    conn = db.open()
+    catalog = conn.root()['app']['catalog']
+    start = time.time()
+    catalog.reindex(output=False, max_memory=max_memory)
+    elapsed = time.time() - start
+    db.close()
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((peak, elapsed))
+
+def run(target, *args):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=target, args=args + (queue,))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def main(argv=sys.argv):
+    sizes = [10000, 50000, 100000]
+    max_memory = None
+    if len(argv) > 1:
+        sizes = [int(x) for x in argv[1].split(',')]
+    if len(argv) > 2:
+        max_memory = int(argv[2])
+    print '%8s %12s %12s' % ('size', 'peak MB', 'seconds')
+    for size in sizes:
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'Data.fs')
+            process = multiprocessing.Process(
+                target=build, args=(filename, size))
+            process.start()
+            process.join()
+            peak, elapsed = run(reindex, filename, max_memory)
+            print '%8s %12s %12.2f' % (size, peak, elapsed)
+        finally:
+            shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+""" Compare the cost of unindexing a subtree from a catalog one document at
+a time (``Catalog.unindex_doc``, as the removal subscriber used to) with
+unindexing it in bulk (``Catalog.unindex_docs``).
+
+Usage: python benchmarks/catalog_unindex_docs.py [sizes] [fractions]
+
+e.g. python benchmarks/catalog_unindex_docs.py 20000,200000 0.1,0.5
+
+A catalog of ``size`` documents with a field index (ten distinct values), a
+keyword index in which every document shares a keyword (like the principals
+of an ``allowed`` index) and a path index is built, and the first
+``fraction`` of its documents are unindexed.
+"""
+
+import sys
+import time
+
+from hypatia.field import FieldIndex
+from hypatia.keyword import KeywordIndex
+
+from substanced.catalog import Catalog
+from substanced.catalog.indexes import PathIndex
+
+class Dummy(object):
+    def __init__(self, n):
+        self.color = n % 10
+        self.allowed = ['system.Everyone', 'group:%s' % (n % 50)]
+
+def build(size):
+    catalog = Catalog()
+    catalog.add('color', FieldIndex('color'), send_events=False)
+    catalog.add('allowed', KeywordIndex('allowed'), send_events=False)
+    catalog.add('path', PathIndex(), send_events=False)
+    for n in range(size):
+        catalog.index_doc(n, Dummy(n))
+    return catalog
+
+def main(argv=sys.argv):
+    sizes = [20000, 200000]
+    fractions = [0.1, 0.5]
+    if len(argv) > 1:
+        sizes = [int(x) for x in argv[1].split(',')]
+    if len(argv) > 2:
+        fractions = [float(x) for x in argv[2].split(',')]
+    print '%8s %8s %-14s %12s' % ('size', 'removed', 'method', 'seconds')
+    for size in sizes:
+        for fraction in fractions:
+            removed = range(int(size * fraction))
+            for name in ('unindex_doc', 'unindex_docs'):
+                catalog = build(size)
+                start = time.time()
+                if name == 'unindex_doc':
+                    for docid in removed:
+                        catalog.unindex_doc(docid)
+                else:
+                    catalog.unindex_docs(removed)
+                elapsed = time.time() - start
+                assert len(catalog.objectids) == size - len(removed)
+                assert catalog['allowed']._num_docs() == size - len(removed)
+                print '%8s %8s %-14s %12.3f' % (
+                    size, len(removed), name, elapsed)
+
+if __name__ == '__main__':
+    main()
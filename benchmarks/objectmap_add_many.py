@@ -0,0 +1,64 @@
+""" Compare adding a large subtree to an object map one object at a time
+with ``ObjectMap.add`` against adding it in one pass with
+``ObjectMap.add_many``.
+
+Usage: python benchmarks/objectmap_add_many.py [sizes] [depths]
+
+e.g. python benchmarks/objectmap_add_many.py 1000,10000,50000 1,4,16
+
+For each depth, a folder with ``size`` children is added at the bottom of a
+chain of folders ``/d0/d1/...``, and the time taken by each approach is
+reported.
+"""
+
+import sys
+import time
+
+from substanced.objectmap import ObjectMap
+
+class Dummy(object):
+    pass
+
+def build(depth):
+    objectmap = ObjectMap(Dummy())
+    base = (u'',)
+    objectmap.add(Dummy(), base)
+    for i in range(depth):
+        base = base + (u'd%s' % i,)
+        objectmap.add(Dummy(), base)
+    return objectmap, base
+
+def subtree(base, size):
+    folder = base + (u'imported',)
+    nodes = [(Dummy(), folder + (u'item%s' % i,)) for i in range(size)]
+    nodes.append((Dummy(), folder))
+    return nodes
+
+def add_each(objectmap, nodes):
+    for obj, path_tuple in nodes:
+        objectmap.add(obj, path_tuple)
+
+def add_many(objectmap, nodes):
+    objectmap.add_many(nodes)
+
+def main(argv=sys.argv):
+    sizes = [1000, 10000, 50000]
+    depths = [1, 4, 16]
+    if len(argv) > 1:
+        sizes = [int(x) for x in argv[1].split(',')]
+    if len(argv) > 2:
+        depths = [int(x) for x in argv[2].split(',')]
+    print '%8s %8s %12s %12s' % ('depth', 'size', 'add', 'add_many')
+    for depth in depths:
+        for size in sizes:
+            timings = []
+            for func in (add_each, add_many):
+                objectmap, base = build(depth)
+                nodes = subtree(base, size)
+                start = time.time()
+                func(objectmap, nodes)
+                timings.append(time.time() - start)
+            print '%8s %8s %12.4f %12.4f' % ((depth, size) + tuple(timings))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+""" Stress test concurrent adds to one folder of an object map stored in a
+local FileStorage, reporting how many transactions had to be retried
+because of a ``ConflictError``.
+
+Usage: python benchmarks/objectmap_conflicts.py [threads] [adds] [existing]
+           [allocator]
+
+e.g. python benchmarks/objectmap_conflicts.py 8 200 20000 block
+
+The parent starts out with ``existing`` children.  Each of ``threads``
+threads then opens its own connection and adds ``adds`` distinct children
+under the same parent, one transaction per child, retrying on conflict.
+``allocator`` is ``random`` (the default) or ``block``.
+
+With tree set level sets, the time taken grows only slightly with the
+number of existing children.  The retries don't go away: most of them are read
+conflicts on the interior nodes of the ``pathindex``, ``path_to_objectid``
+and ``objectid_to_path`` BTrees, which every writer traverses and which a
+bucket split in any of them changes.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import transaction
+from ZODB.DB import DB
+from ZODB.FileStorage import FileStorage
+from ZODB.POSException import ConflictError
+
+from substanced.objectmap import (
+    ObjectMap,
+    BlockObjectidAllocator,
+    )
+
+class Dummy(object):
+    pass
+
+PARENT = (u'', u'parent')
+
+def setup(db, existing, allocator):
+    conn = db.open()
+    root = conn.root()
+    objectmap = ObjectMap(Dummy())
+    if allocator == 'block':
+        objectmap.objectid_allocator = BlockObjectidAllocator()
+    objectmap.add(Dummy(), (u'',))
+    objectmap.add(Dummy(), PARENT)
+    for i in range(existing):
+        objectmap.add(Dummy(), PARENT + (u'existing%s' % i,))
+    root['objectmap'] = objectmap
+    transaction.commit()
+    conn.close()
+
+def work(db, threadnum, adds, retries):
+    tm = transaction.TransactionManager()
+    conn = db.open(transaction_manager=tm)
+    for i in range(adds):
+        path_tuple = PARENT + (u't%s-%s' % (threadnum, i),)
+        while True:
+            tm.begin()
+            objectmap = conn.root()['objectmap']
+            objectmap.add(Dummy(), path_tuple)
+            try:
+                tm.commit()
+            except ConflictError:
+                tm.abort()
+                retries[threadnum] += 1
+            else:
+                break
+    conn.close()
+
+def main(argv=sys.argv):
+    threads = 8
+    adds = 200
+    existing = 100
+    allocator = 'random'
+    if len(argv) > 1:
+        threads = int(argv[1])
+    if len(argv) > 2:
+        adds = int(argv[2])
+    if len(argv) > 3:
+        existing = int(argv[3])
+    if len(argv) > 4:
+        allocator = argv[4]
+    tempdir = tempfile.mkdtemp()
+    try:
+        db = DB(FileStorage(os.path.join(tempdir, 'Data.fs')))
+        setup(db, existing, allocator)
+        retries = [0] * threads
+        workers = [threading.Thread(target=work, args=(db, n, adds, retries))
+                   for n in range(threads)]
+        start = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - start
+        conn = db.open()
+        objectmap = conn.root()['objectmap']
+        children = len(objectmap.pathlookup(PARENT, depth=1,
+                                            include_origin=False))
+        assert children == existing + threads * adds, children
+        conn.close()
+        db.close()
+    finally:
+        shutil.rmtree(tempdir)
+    print '%8s %8s %10s %10s %10s' % (
+        'threads', 'commits', 'retries', 'seconds', 'allocator')
+    print '%8s %8s %10s %10.2f %10s' % (
+        threads, threads * adds, sum(retries), elapsed, allocator)
+
+if __name__ == '__main__':
+    main()
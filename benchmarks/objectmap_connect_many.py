@@ -0,0 +1,54 @@
+""" Compare connecting many users to one group one reference at a time with
+``ObjectMap.connect`` and all at once with
+``ObjectMap.connect_many_sources``, and disconnecting them again.
+
+Usage: python benchmarks/objectmap_connect_many.py [sizes]
+
+e.g. python benchmarks/objectmap_connect_many.py 1000,10000,50000
+"""
+
+import sys
+import time
+
+from substanced.objectmap import ObjectMap
+
+class Dummy(object):
+    pass
+
+def build(size):
+    objectmap = ObjectMap(Dummy())
+    objectmap.add(Dummy(), (u'',))
+    group = objectmap.add(Dummy(), (u'', u'group'))
+    users = objectmap.add_many(
+        [(Dummy(), (u'', u'user%s' % i)) for i in range(size)])
+    return objectmap, group, users
+
+def main(argv=sys.argv):
+    sizes = [1000, 10000, 50000]
+    if len(argv) > 1:
+        sizes = [int(x) for x in argv[1].split(',')]
+    print '%8s %-24s %12s' % ('size', 'method', 'seconds')
+    for size in sizes:
+        objectmap, group, users = build(size)
+        start = time.time()
+        for user in users:
+            objectmap.connect(user, group, 'member')
+        print '%8s %-24s %12.4f' % (size, 'connect', time.time() - start)
+        start = time.time()
+        for user in users:
+            objectmap.disconnect(user, group, 'member')
+        print '%8s %-24s %12.4f' % (size, 'disconnect', time.time() - start)
+        objectmap, group, users = build(size)
+        start = time.time()
+        objectmap.connect_many_sources(users, group, 'member')
+        print '%8s %-24s %12.4f' % (
+            size, 'connect_many_sources', time.time() - start)
+        assert objectmap.count_sources(group, 'member') == size
+        start = time.time()
+        objectmap.disconnect_many_sources(users, group, 'member')
+        print '%8s %-24s %12.4f' % (
+            size, 'disconnect_many_sources', time.time() - start)
+        assert objectmap.count_sources(group, 'member') == 0
+
+if __name__ == '__main__':
+    main()
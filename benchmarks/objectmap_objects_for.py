@@ -0,0 +1,71 @@
+""" Compare resolving a page of objectids one at a time with
+``ObjectMap.object_for`` against resolving them in one call to
+``ObjectMap.objects_for``.
+
+Usage: python benchmarks/objectmap_objects_for.py [page] [folders] [depth]
+
+e.g. python benchmarks/objectmap_objects_for.py 500 5 8
+
+``folders`` folders, each containing ``page`` items, are created at the
+bottom of a chain of ``depth`` folders, and a page of ``page`` objectids
+picked at random from all of the items is resolved.
+"""
+
+import random
+import sys
+import time
+
+from pyramid.testing import DummyResource
+from substanced.objectmap import ObjectMap
+
+def build(page, folders, depth):
+    root = DummyResource()
+    objectmap = ObjectMap(root)
+    objectmap.add(root, (u'',))
+    base = root
+    path_tuple = (u'',)
+    for i in range(depth):
+        name = u'd%s' % i
+        base[name] = DummyResource()
+        base = base[name]
+        path_tuple = path_tuple + (name,)
+        objectmap.add(base, path_tuple)
+    objectids = []
+    for i in range(folders):
+        name = u'f%s' % i
+        folder = base[name] = DummyResource()
+        objectmap.add(folder, path_tuple + (name,))
+        for j in range(page):
+            itemname = u'item%s' % j
+            item = folder[itemname] = DummyResource()
+            objectids.append(
+                objectmap.add(item, path_tuple + (name, itemname)))
+    return objectmap, random.sample(objectids, page)
+
+def one_at_a_time(objectmap, objectids):
+    return [objectmap.object_for(oid) for oid in objectids]
+
+def batched(objectmap, objectids):
+    return list(objectmap.objects_for(objectids))
+
+def main(argv=sys.argv):
+    page, folders, depth = 500, 5, 8
+    if len(argv) > 1:
+        page = int(argv[1])
+    if len(argv) > 2:
+        folders = int(argv[2])
+    if len(argv) > 3:
+        depth = int(argv[3])
+    objectmap, objectids = build(page, folders, depth)
+    print '%14s %12s' % ('approach', 'seconds')
+    results = []
+    for func in (one_at_a_time, batched):
+        start = time.time()
+        for i in range(10):
+            result = func(objectmap, objectids)
+        print '%14s %12.4f' % (func.__name__, (time.time() - start) / 10)
+        results.append(result)
+    assert results[0] == results[1]
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+""" Compare the cost of a root-level path query combined with a selective
+field query when the path query is answered by ``ObjectMap.pathlookup``
+(which builds the set of every objectid under the path before it is
+intersected) and when it is answered by ``ObjectMap.pathintersect`` (which
+filters the field query's result instead), as ``PathIndex.apply`` and
+``PathIndex.apply_intersect`` do.
+
+Usage: python benchmarks/objectmap_pathintersect.py [sizes] [matches]
+
+e.g. python benchmarks/objectmap_pathintersect.py 10000,100000 10,1000
+
+A tree of ``size`` objects is built in folders of 100 objects each under
+the root, and ``matches`` of them are given a distinct value in a field
+index.  The query asks for the objects with that value under the root.
+"Materialized" is the number of objectids held in intermediate sets built
+to answer the query (8 bytes each).
+"""
+
+import sys
+import time
+
+from hypatia.field import FieldIndex
+
+from substanced.objectmap import ObjectMap
+
+class Dummy(object):
+    pass
+
+def build(size, matches):
+    objectmap = ObjectMap(Dummy())
+    index = FieldIndex('color')
+    objectmap.add(Dummy(), (u'',))
+    every = max(size // matches, 1)
+    n = 0
+    folder = None
+    while n < size:
+        if n % 100 == 0:
+            folder = (u'', u'f%s' % n)
+            objectmap.add(Dummy(), folder)
+        obj = Dummy()
+        oid = objectmap.add(obj, folder + (u'o%s' % n,))
+        obj.color = n % every == 0 and 'red' or 'blue'
+        index.index_doc(oid, obj)
+        n += 1
+    return objectmap, index
+
+def timeit(fn, repeat=5):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        result = fn()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def main(argv=sys.argv):
+    sizes = [10000, 100000]
+    matches = [10, 1000]
+    if len(argv) > 1:
+        sizes = [int(x) for x in argv[1].split(',')]
+    if len(argv) > 2:
+        matches = [int(x) for x in argv[2].split(',')]
+    print '%8s %8s %-14s %12s %14s' % (
+        'size', 'matches', 'method', 'msec', 'materialized')
+    for size in sizes:
+        for match in matches:
+            objectmap, index = build(size, match)
+            IF = objectmap.family.IF
+            red = index.applyEq('red')
+
+            def lookup():
+                pathset = objectmap.pathlookup((u'',))
+                return len(pathset), IF.weightedIntersection(red, pathset)[1]
+
+            def intersect():
+                return 0, objectmap.pathintersect(red, (u'',))
+
+            expected = None
+            for name, fn in (('pathlookup', lookup),
+                             ('pathintersect', intersect)):
+                elapsed, (built, result) = timeit(fn)
+                result = list(result)
+                if expected is None:
+                    expected = result
+                assert result == expected
+                print '%8s %8s %-14s %12.3f %14s' % (
+                    size, len(red), name, elapsed * 1000, built)
+
+if __name__ == '__main__':
+    main()
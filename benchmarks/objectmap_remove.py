@@ -0,0 +1,55 @@
+""" Measure how the cost of ``ObjectMap.remove`` scales with the size of the
+removed subtree and with its depth in the tree.
+
+Usage: python benchmarks/objectmap_remove.py [sizes] [depths]
+
+e.g. python benchmarks/objectmap_remove.py 100,1000,10000 1,4,16
+
+For each depth, a chain of folders ``/d0/d1/...`` is built, and a folder
+with ``size`` children is added at the bottom of the chain next to an
+unrelated sibling folder of the same size.  The time taken to remove the
+first folder (and its children) is reported.
+"""
+
+import sys
+import time
+
+from substanced.objectmap import ObjectMap
+
+class Dummy(object):
+    pass
+
+def build(depth, size):
+    objectmap = ObjectMap(Dummy())
+    base = (u'',)
+    objectmap.add(Dummy(), base)
+    for i in range(depth):
+        base = base + (u'd%s' % i,)
+        objectmap.add(Dummy(), base)
+    for name in (u'victim', u'sibling'):
+        folder = base + (name,)
+        objectmap.add(Dummy(), folder)
+        for i in range(size):
+            objectmap.add(Dummy(), folder + (u'item%s' % i,))
+    return objectmap, base + (u'victim',)
+
+def main(argv=sys.argv):
+    sizes = [100, 1000, 10000]
+    depths = [1, 4, 16]
+    if len(argv) > 1:
+        sizes = [int(x) for x in argv[1].split(',')]
+    if len(argv) > 2:
+        depths = [int(x) for x in argv[2].split(',')]
+    print '%8s %8s %12s %14s' % ('depth', 'size', 'seconds', 'usec/object')
+    for depth in depths:
+        for size in sizes:
+            objectmap, victim = build(depth, size)
+            start = time.time()
+            removed = objectmap.remove(victim)
+            elapsed = time.time() - start
+            assert len(removed) == size + 1
+            print '%8s %8s %12.4f %14.2f' % (
+                depth, size, elapsed, elapsed * 1e6 / len(removed))
+
+if __name__ == '__main__':
+    main()
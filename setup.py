@@ -32,6 +32,7 @@ install_requires = [
     'colander',
     'deform_bootstrap',
     'repoze.evolution',
+    'repoze.lru',
     'pyramid_zodbconn',
     'pyramid_mailer',
     'cryptacular',
@@ -71,6 +72,7 @@ setup(name='substanced',
       [console_scripts]
       sd_evolve = substanced.scripts.evolve:main
       sd_reindex = substanced.scripts.reindex:main
+      sd_objectmap_check = substanced.scripts.objectmap_check:main
       [pyramid.scaffold]
       substanced=substanced.scaffolds:SubstanceDProjectTemplate
       """,
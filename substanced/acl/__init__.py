@@ -4,8 +4,20 @@ from pyramid.security import (
     ALL_PERMISSIONS,
     )
 
+from ..catalog import reindex_permissions
+
 NO_INHERIT = (Deny, Everyone, ALL_PERMISSIONS) # API
 
+def set_acl(resource, acl):
+    """ Set the ACL of ``resource`` to ``acl`` and reindex ``resource`` and
+    the objects under it in the catalog indexes which depend on their ACLs
+    (see :func:`substanced.catalog.reindex_permissions`).  Code which
+    changes ACLs should use this rather than setting ``__acl__`` itself,
+    or the permission indexes used to filter search results become
+    stale."""
+    resource.__acl__ = acl
+    reindex_permissions(resource)
+
 def includeme(config): # pragma: no cover
     config.scan('.views')
     
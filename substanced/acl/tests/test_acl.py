@@ -0,0 +1,18 @@
+import unittest
+import mock
+
+from pyramid import testing
+
+class Test_set_acl(unittest.TestCase):
+    def _callFUT(self, resource, acl):
+        from .. import set_acl
+        return set_acl(resource, acl)
+
+    def test_it(self):
+        from pyramid.security import Allow
+        resource = testing.DummyResource()
+        acl = [(Allow, 'bob', 'view')]
+        with mock.patch('substanced.acl.reindex_permissions') as reindex:
+            self._callFUT(resource, acl)
+        self.assertEqual(resource.__acl__, acl)
+        reindex.assert_called_once_with(resource)
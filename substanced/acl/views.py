@@ -8,18 +8,17 @@ from pyramid.security import (
 from ..content import (
     find_service,
     )
-from ..catalog import is_catalogable
 from ..objectmap import find_objectmap
 from ..sdi import (
     mgmt_view,
     check_csrf_token,
     )
-from ..util import (
-    postorder,
-    oid_of,
-    )
+from ..util import oid_of
 
-from . import NO_INHERIT
+from . import (
+    NO_INHERIT,
+    set_acl,
+    )
 
 def get_workflow(*arg, **kw):
     return # XXX
@@ -131,14 +130,7 @@ def acl_edit_view(context, request):
 
     if acl != original_acl:
         context.__custom_acl__ = acl # added so we can find customized obs later
-        context.__acl__ = acl
-        catalog = find_service(context, 'catalog')
-        if catalog is not None:
-            allowed = catalog.get('allowed')
-            if allowed is not None:
-                for node in postorder(context):
-                    if is_catalogable(node, request.registry):
-                        catalog.reindex_doc(oid_of(node), node)
+        set_acl(context, acl)
 
     workflow = get_context_workflow(context)
     if workflow is not None:
@@ -1,9 +1,17 @@
+import datetime
+import itertools
 import logging
+import operator
+import os
+import re
+import time
 
 import transaction
 
 import BTrees
 
+from ZODB.POSException import ConflictError
+
 from zope.interface import implementer
 
 from hypatia.catalog import CatalogQuery
@@ -11,6 +19,7 @@ from hypatia.catalog import CatalogQuery
 from pyramid.traversal import resource_path
 from pyramid.threadlocal import get_current_registry
 from pyramid.security import effective_principals
+from pyramid.settings import asbool
 from pyramid.interfaces import IAuthorizationPolicy
 
 from ..interfaces import (
@@ -21,12 +30,95 @@ from ..interfaces import (
 from ..content import (
     service,
     find_service,
+    find_services,
     )
 from ..folder import Folder
 from ..objectmap import find_objectmap
 
+from .discriminators import (
+    DENIED,
+    get_allowed_to_view,
+    )
+from .indexes import (
+    NOT_INDEXED,
+    PermissionIndex,
+    can_reindex_value,
+    index_docs,
+    reindex_doc_value,
+    remove_docids,
+    unindex_docs,
+    )
+
 logger = logging.getLogger(__name__) # API
 
+def _memory_use():
+    # The resident set size of this process in megabytes, or ``None`` if it
+    # can't be found
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+def _batches(iterable, size):
+    # Yield lists of at most ``size`` items of ``iterable``
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def _serial_of(resource):
+    # the serial of the loaded revision of ``resource``, or ``None`` if it
+    # isn't persistent
+    activate = getattr(resource, '_p_activate', None)
+    if activate is None:
+        return None
+    activate()
+    return resource._p_serial
+
+def compute_reindex_values(catalog, shard, indexes=None, path_re=None):
+    """ Compute the values the indexes of ``catalog`` would store for each
+    of its objectids in ``shard``, a ``(min, max)`` tuple of objectids, as
+    returned by :meth:`Catalog.objectid_shards`.  Used by
+    :meth:`Catalog.reindex` in a worker process with a database connection
+    of its own, which may be a different one than the catalog's.
+
+    Returns a list of ``(objectid, path, serial, values)`` tuples.  ``path``
+    is the path of the object, or ``None`` if it can't be found (in which
+    case ``serial`` and ``values`` are ``None``).  ``serial`` is the
+    ``_p_serial`` of the revision of the object the values were computed
+    from (``None`` if it isn't persistent).  ``values`` maps the name of
+    each index which can reindex a precomputed value (see
+    :func:`substanced.catalog.indexes.can_reindex_value`) to the value it
+    would index; an index the object wouldn't be indexed in is left out.
+    Objects whose path doesn't match ``path_re`` are left out."""
+    objectmap = find_objectmap(catalog)
+    names = catalog._reindex_names(indexes)
+    objectids = list(catalog.objectids.keys(*shard))
+    resources = objectmap.objects_for(objectids)
+    results = []
+    for objectid, resource in itertools.izip(objectids, resources):
+        if resource is None:
+            results.append((objectid, None, None, None))
+            continue
+        path = resource_path(resource)
+        if path_re is not None and path_re.match(path) is None:
+            continue
+        serial = _serial_of(resource)
+        values = {}
+        for name in names:
+            index = catalog[name]
+            if not can_reindex_value(index):
+                continue
+            value = index.discriminate(resource, _marker)
+            if value is not _marker:
+                values[name] = value
+        results.append((objectid, path, serial, values))
+    return results
+
 @service(
     'Catalog',
     icon='icon-search',
@@ -38,6 +130,11 @@ class Catalog(Folder):
     
     family = BTrees.family64
     transaction = transaction
+    clock = time.time # for testing
+    memory_use = staticmethod(_memory_use) # for testing
+    reindex_checkpoint = None
+    index_docs_batch_size = 1000
+    _v_reindex_stats = None
     
     def __init__(self, family=None):
         Folder.__init__(self)
@@ -66,6 +163,27 @@ class Catalog(Folder):
             index.index_doc(docid, obj)
         self.objectids.insert(docid)
 
+    def index_docs(self, docs):
+        """Register each ``(docid, obj)`` pair in the iterable ``docs`` in
+        the indexes of this catalog, as if ``index_doc`` had been called for
+        each of them.  The documents are sorted by docid (the last object of
+        a docid given more than once wins) and indexed in batches of
+        ``index_docs_batch_size``, a whole batch at a time in one index after
+        the other (see :func:`substanced.catalog.indexes.index_docs`)."""
+        unique = []
+        for doc in sorted(docs, key=operator.itemgetter(0)):
+            _assertint(doc[0])
+            if unique and unique[-1][0] == doc[0]:
+                unique[-1] = doc
+            else:
+                unique.append(doc)
+        docs = unique
+        indexes = list(self.values())
+        for batch in _batches(docs, self.index_docs_batch_size):
+            for index in indexes:
+                index_docs(index, batch)
+            self.objectids.update([docid for docid, obj in batch])
+
     def unindex_doc(self, docid):
         """Unregister the document represented by docid from indexes of
         this catalog."""
@@ -77,19 +195,273 @@ class Catalog(Folder):
         except KeyError:
             pass
 
-    def reindex_doc(self, docid, obj):
+    def unindex_docs(self, docids):
+        """Unregister every document in the sequence ``docids`` from the
+        indexes of this catalog.  Equivalent to calling ``unindex_doc`` for
+        each of them, but each index removes the whole set of docids at
+        once (see :func:`substanced.catalog.indexes.unindex_docs`)."""
+        IF = self.family.IF
+        if not isinstance(docids, (IF.Set, IF.TreeSet)):
+            docids = list(docids)
+            for docid in docids:
+                _assertint(docid)
+            docids = IF.Set(docids)
+        for index in self.values():
+            unindex_docs(index, docids)
+        remove_docids(self.objectids, docids, self.family)
+
+    def reindex_doc(self, docid, obj, attributes=None, registry=None):
         """ Reindex the document referenced by docid using the object
         passed in as ``obj`` (typically just does the equivalent of
         ``unindex_doc``, then ``index_doc``, but specialized indexes
-        can override the method that this API calls to do less work. """
+        can override the method that this API calls to do less work.
+
+        If ``attributes`` is not ``None``, it should be a sequence of the
+        names of the attributes of ``obj`` which have changed since it was
+        last indexed.  An index is then skipped if the
+        ``index_dependencies`` metadata of the content type of ``obj`` (see
+        :func:`index_dependencies`) says that its value depends only on
+        other attributes.  The number of index updates done and skipped are
+        counted (see :meth:`reindex_stats`)."""
         _assertint(docid)
-        for index in self.values():
+        dependencies = None
+        if attributes is not None:
+            dependencies = index_dependencies(obj, registry)
+            attributes = set(attributes)
+        stats = self._get_reindex_stats()
+        for name, index in self.items():
+            depends_on = dependencies and dependencies.get(name)
+            if depends_on is not None and attributes.isdisjoint(depends_on):
+                stats['skipped'] += 1
+                continue
             index.reindex_doc(docid, obj)
+            stats['reindexed'] += 1
         if not docid in self.objectids:
             self.objectids.insert(docid)
 
+    def _get_reindex_stats(self):
+        stats = self._v_reindex_stats
+        if stats is None:
+            stats = self._v_reindex_stats = {'reindexed':0, 'skipped':0}
+        return stats
+
+    def reindex_stats(self):
+        """ Return a dictionary with the keys ``reindexed`` and ``skipped``:
+        the number of index updates done and skipped by ``reindex_doc``
+        (because the attributes the index depends on didn't change) since
+        this catalog was loaded by its database connection."""
+        return dict(self._get_reindex_stats())
+
+    def _reindex_names(self, indexes=None):
+        if indexes is None:
+            return list(self.keys())
+        return list(indexes)
+
+    def objectid_shards(self, size, after=None):
+        """ Divide the objectids of this catalog into ranges of at most
+        ``size`` objectids each.  Returns a list of ``(min, max)`` tuples,
+        each of which can be passed to ``self.objectids.keys`` to obtain the
+        objectids in the range.  If ``after`` is not ``None``, only the
+        objectids greater than ``after`` are divided."""
+        shards = []
+        first = last = None
+        n = 0
+        for objectid in self._objectids_after(after):
+            if first is None:
+                first = objectid
+            last = objectid
+            n += 1
+            if n == size:
+                shards.append((first, last))
+                first = None
+                n = 0
+        if first is not None:
+            shards.append((first, last))
+        return shards
+
+    def reindex_values(self, objectid, values, indexes=None, resource=None):
+        """ Reindex the document ``objectid`` in the indexes named by
+        ``indexes`` (all of them if it's ``None``) using ``values``, a
+        dictionary of precomputed index values as returned by
+        :func:`compute_reindex_values` (see
+        :func:`substanced.catalog.indexes.reindex_doc_value`).  Indexes
+        which can't reindex precomputed values reindex ``resource``
+        instead, as do all of them if ``values`` is ``None``."""
+        _assertint(objectid)
+        for name in self._reindex_names(indexes):
+            index = self[name]
+            if values is not None and can_reindex_value(index):
+                reindex_doc_value(
+                    index, objectid, values.get(name, NOT_INDEXED))
+            else:
+                index.reindex_doc(objectid, resource)
+        if not objectid in self.objectids:
+            self.objectids.insert(objectid)
+
+    def _apply_reindex_batch(self, batch, indexes, output):
+        # Apply a batch of values computed by ``compute_reindex_values``;
+        # returns the resources which had to be loaded to do so.  Each
+        # object is loaded to check that it hasn't changed since its values
+        # were computed; if it has, it is reindexed from the object.
+        objectmap = find_objectmap(self)
+        found = []
+        for objectid, path, serial, values in batch:
+            if path is not None:
+                found.append((objectid, path, serial, values))
+                continue
+            upath = objectmap.path_for(objectid)
+            if upath is None:
+                output and output(
+                    'error: no path for objectid %s in object map' %
+                    objectid)
+            else:
+                output and output(
+                    'error: object at path %s not found' % u'/'.join(upath))
+        resources = objectmap.objects_for(
+            [objectid for objectid, path, serial, values in found])
+        loaded = []
+        for (objectid, path, serial, values), resource in itertools.izip(
+                found, resources):
+            if resource is None:
+                output and output(
+                    'error: object at path %s not found' % path)
+                continue
+            loaded.append(resource)
+            if _serial_of(resource) != serial:
+                output and output(
+                    '%s changed since its values were computed, reindexing '
+                    'it' % path)
+                values = None
+            self.reindex_values(objectid, values, indexes, resource)
+        return loaded
+
+    def _objectids_after(self, after):
+        if after is None:
+            return self.objectids
+        return self.objectids.keys(min=after, excludemin=True)
+
+    def _set_reindex_checkpoint(self, objectid, indexes, path_re, processed):
+        if indexes is not None:
+            indexes = tuple(indexes)
+        if path_re is not None:
+            path_re = (path_re.pattern, path_re.flags)
+        self.reindex_checkpoint = {
+            'objectid':objectid,
+            'indexes':indexes,
+            'path_re':path_re,
+            'processed':processed,
+            }
+
+    def _resume_reindex(self, indexes, path_re):
+        # Return the checkpoint to resume from along with the parameters of
+        # the run which recorded it.
+        checkpoint = self.reindex_checkpoint
+        if checkpoint is None:
+            return None, indexes, path_re
+        if indexes is not None:
+            if tuple(indexes) != checkpoint['indexes']:
+                raise ValueError(
+                    'indexes %s differ from those of the interrupted '
+                    'reindex (%s)' % (indexes, checkpoint['indexes']))
+        if path_re is not None:
+            if (path_re.pattern, path_re.flags) != checkpoint['path_re']:
+                raise ValueError(
+                    'path_re %r differs from that of the interrupted reindex '
+                    '(%r)' % (path_re.pattern, checkpoint['path_re'][0]))
+        indexes = checkpoint['indexes']
+        path_re = checkpoint['path_re']
+        if path_re is not None:
+            path_re = re.compile(*path_re)
+        return checkpoint, indexes, path_re
+
+    def _release_resources(self, resources):
+        # Turn ``resources`` and the folders above them back into ghosts
+        # once they've been committed (or aborted) and let the connection's
+        # cache shrink to its target size, so a reindex doesn't hold on to
+        # every object it has loaded.
+        seen = set()
+        for resource in resources:
+            while resource is not None and id(resource) not in seen:
+                seen.add(id(resource))
+                deactivate = getattr(resource, '_p_deactivate', None)
+                if deactivate is not None:
+                    deactivate()
+                resource = getattr(resource, '__parent__', None)
+        jar = self._p_jar
+        if jar is not None:
+            jar.cacheGC()
+
+    def _check_memory(self, max_memory, output):
+        # Ghostify every unmodified object in the connection's cache if
+        # this process uses more than ``max_memory`` megabytes; returns
+        # true if it did.
+        used = self.memory_use()
+        if used is None or used <= max_memory:
+            return False
+        output and output(
+            'using %s MB (more than %s MB), minimizing the cache' % (
+                used, max_memory))
+        jar = self._p_jar
+        if jar is not None:
+            jar.cacheMinimize()
+        return True
+
+    def _reindex_progress(self, processed, total, elapsed, started):
+        # ``started`` objects had already been processed when this run began
+        done = processed - started
+        rate = elapsed and done / float(elapsed) or 0
+        msg = 'processed %s of %s objects (%.1f objects/second' % (
+            processed, total, rate)
+        if rate and processed < total:
+            remaining = datetime.timedelta(
+                seconds=int((total - processed) / rate))
+            msg += ', about %s remaining' % remaining
+        return msg + ')'
+
+    def _reindex_parallel(self, mapper, dry_run, commit_interval, indexes,
+                          path_re, output, checkpoint, max_memory=None,
+                          attempts=3):
+        after = processed = None
+        if checkpoint is not None:
+            after = checkpoint['objectid']
+            processed = checkpoint['processed']
+        processed = started = processed or 0
+        shards = self.objectid_shards(commit_interval, after)
+        total = started + sum(
+            [len(self.objectids.keys(*shard)) for shard in shards])
+        start = self.clock()
+        for shard, batch in itertools.izip(
+                shards, mapper(shards, indexes, path_re)):
+            processed += len(self.objectids.keys(*shard))
+            for attempt in range(attempts):
+                loaded = self._apply_reindex_batch(batch, indexes, output)
+                if max_memory is not None:
+                    self._check_memory(max_memory, output)
+                if processed < total:
+                    self._set_reindex_checkpoint(
+                        shard[1], indexes, path_re, processed)
+                else:
+                    self.reindex_checkpoint = None
+                try:
+                    if dry_run:
+                        output and output('*** aborting ***')
+                        self.transaction.abort()
+                    else:
+                        output and output('*** committing ***')
+                        self.transaction.commit()
+                    break
+                except ConflictError:
+                    self.transaction.abort()
+                    if attempt == attempts - 1:
+                        raise
+                    output and output('*** conflict, retrying batch ***')
+            self._release_resources(loaded)
+            output and output(self._reindex_progress(
+                processed, total, self.clock() - start, started))
+
     def reindex(self, dry_run=False, commit_interval=200, indexes=None, 
-                path_re=None, output=None):
+                path_re=None, output=None, mapper=None, resume=False,
+                max_memory=None):
 
         """\
         Reindex all objects in the catalog using the existing set of
@@ -98,9 +470,18 @@ class Catalog(Folder):
         If ``dry_run`` is ``True``, do no actual work but send what would be
         changed to the logger.
 
-        ``commit_interval`` controls the number of objects indexed between
+        ``commit_interval`` controls the number of objects processed between
         each call to ``transaction.commit()`` (to control memory
-        consumption).
+        consumption).  Each batch of ``commit_interval`` objects is loaded
+        in path order, so the objects in a folder are loaded together, and
+        once it has been committed the objects in it and the folders above
+        them are turned back into ghosts.
+
+        ``max_memory``, if not ``None``, is a number of megabytes.  Whenever
+        the process uses more memory than that while reindexing a batch (or,
+        with a ``mapper``, once a shard has been applied), every object in
+        the database connection's cache which hasn't been changed is turned
+        back into a ghost.
 
         ``indexes``, if not ``None``, should be a list of index names that
         should be reindexed.  If ``indexes`` is ``None``, all indexes are
@@ -117,61 +498,265 @@ class Catalog(Folder):
         the reindex.  If ``False`` is passed, no output is done.  If ``None``
         is passed (the default), the output will wind up in the
         ``substanced.catalog`` Python logger output at ``info`` level.
+
+        ``mapper``, if not ``None``, reindexes in parallel.  The objectids
+        of the catalog are divided into shards of ``commit_interval``
+        objectids (see :meth:`objectid_shards`), and ``mapper`` is called
+        with the list of shards, ``indexes`` and ``path_re``.  It must
+        return an iterable of the results of calling
+        :func:`compute_reindex_values` for each shard with ``indexes`` and
+        ``path_re``, typically computed by a pool of worker
+        processes each with a database connection of its own.  The results
+        are applied to the indexes one shard at a time as they arrive, each
+        in a transaction of its own which is retried if it conflicts, and
+        progress is reported after each of them.  Each object is loaded to
+        check that it hasn't changed since its values were computed (by
+        comparing its ``_p_serial``); one that has is reindexed from the
+        object instead.  Indexes which can't reindex precomputed values
+        (see :func:`substanced.catalog.indexes.can_reindex_value`) reindex
+        the object too.
+
+        Each commit records the last objectid it covers and the parameters
+        of the reindex in ``reindex_checkpoint``, which is cleared once
+        every object has been processed.  If ``resume`` is ``True``, a
+        reindex which was interrupted carries on from its checkpoint using
+        the ``indexes`` and ``path_re`` it was started with (passing
+        different ones is an error).  If there is no checkpoint, nothing is
+        done.  Progress is reported after each commit, with an estimate of
+        the time remaining.
         """
         if output is None: # pragma: no cover
             output = logger.info
 
-        def commit_or_abort():
+        checkpoint = None
+        if resume:
+            checkpoint, indexes, path_re = self._resume_reindex(
+                indexes, path_re)
+            if checkpoint is None:
+                output and output('no interrupted reindex to resume')
+                return
+            output and output(
+                'resuming reindex after objectid %s' % checkpoint['objectid'])
+
+        if indexes is not None:
+            output and output('reindexing only indexes %s' % str(indexes))
+
+        if mapper is not None:
+            return self._reindex_parallel(
+                mapper, dry_run, commit_interval, indexes, path_re, output,
+                checkpoint, max_memory)
+
+        after = None
+        started = 0
+        if checkpoint is not None:
+            after = checkpoint['objectid']
+            started = checkpoint['processed']
+        objectids = self._objectids_after(after)
+        total = started + len(objectids)
+        progress = {'objectid':None, 'processed':started}
+        start = self.clock()
+
+        def commit_or_abort(finished=False):
+            if finished:
+                self.reindex_checkpoint = None
+            else:
+                self._set_reindex_checkpoint(
+                    progress['objectid'], indexes, path_re,
+                    progress['processed'])
             if dry_run:
                 output and output('*** aborting ***')
                 self.transaction.abort()
             else:
                 output and output('*** committing ***')
                 self.transaction.commit()
+            output and output(self._reindex_progress(
+                progress['processed'], total, self.clock() - start, started))
 
-        if indexes is not None:
-            output and output('reindexing only indexes %s' % str(indexes))
-
-        i = 1
         objectmap = find_objectmap(self)
-        for objectid in self.objectids:
-            resource = objectmap.object_for(objectid)
-            if resource is None:
-                path = objectmap.path_for(objectid)
-                if path is None:
+
+        def path_order(objectid):
+            return objectmap.path_for(objectid) or ()
+
+        for batch in _batches(objectids, commit_interval):
+            progress['objectid'] = batch[-1]
+            progress['processed'] += len(batch)
+            batch.sort(key=path_order)
+            resources = objectmap.objects_for(batch)
+            loaded = []
+            minimized = False
+            for objectid, resource in itertools.izip(batch, resources):
+                if resource is None:
+                    path = objectmap.path_for(objectid)
+                    if path is None:
+                        output and output(
+                            'error: no path for objectid %s in object map' % 
+                            objectid)
+                        continue
+                    upath = u'/'.join(path)
                     output and output(
-                        'error: no path for objectid %s in object map' % 
-                        objectid)
+                        'error: object at path %s not found' % upath)
                     continue
-                upath = u'/'.join(path)
-                output and output('error: object at path %s not found' % upath)
-                continue
-            path = resource_path(resource)
-            if path_re is not None and path_re.match(path) is None:
-                continue
-            output and output('reindexing %s' % path)
-
-            if indexes is None:
-                self.reindex_doc(objectid, resource)
+                loaded.append(resource)
+                path = resource_path(resource)
+                if path_re is not None and path_re.match(path) is None:
+                    continue
+                output and output('reindexing %s' % path)
+
+                if indexes is None:
+                    self.reindex_doc(objectid, resource)
+                else:
+                    for index in indexes:
+                        self[index].reindex_doc(objectid, resource)
+                if max_memory is not None and not minimized:
+                    minimized = self._check_memory(max_memory, output)
+            resources = None
+            commit_or_abort(finished=progress['processed'] == total)
+            self._release_resources(loaded)
+
+        if progress['processed'] == started:
+            commit_or_abort(finished=True)
+
+def permission_indexes_enabled(registry):
+    """ Return true if the ``substanced.catalog_permission_indexes`` setting
+    of ``registry`` is true.  Permitted searches then filter their results
+    with the catalog's permission indexes rather than by checking each
+    document (see :meth:`Search.allowed_index`).  It should only be turned
+    on once the permission indexes of existing catalogs have been reindexed,
+    and the permission indexes must be kept current (see
+    :func:`reindex_permissions`)."""
+    settings = getattr(registry, 'settings', None) or {}
+    return asbool(settings.get('substanced.catalog_permission_indexes', False))
+
+class PermissionChecker(object):
+    """ Callable which returns true if ``principals`` have ``permission``
+    on the object it's passed according to ``authz_policy``."""
+    def __init__(self, authz_policy, principals, permission):
+        self.authz_policy = authz_policy
+        self.principals = principals
+        self.permission = permission
+
+    def __call__(self, ob):
+        return self.authz_policy.permits(ob, self.principals, self.permission)
+
+class PermittedResults(object):
+    """ A lazy sequence of the objectids in ``oids`` (in the same order)
+    which ``checker`` allows.  Permissions are only checked as objectids are
+    consumed, by iterating over the sequence, slicing it or calling
+    :meth:`at_least`, and each objectid is checked at most once.
+
+    ``resolve_many`` is a callable like
+    :meth:`substanced.catalog.Search.resolve_many`.  If ``permitted`` (a set
+    of the objectids known to be allowed) is passed, only the objectids in
+    ``custom`` are resolved and checked, the others are allowed if they're
+    in ``permitted``.  When some objectids need to be found, ``lookahead``
+    more are looked for at the same time.
+
+    The number of objectids allowed isn't known until the sequence is
+    exhausted, so it has no length."""
+    def __init__(self, oids, checker, resolve_many, permitted=None,
+                 custom=None, lookahead=0):
+        self.checker = checker
+        self.resolve_many = resolve_many
+        self.permitted = permitted
+        self.custom = custom
+        self.lookahead = lookahead
+        self.exhausted = False
+        self.checked = 0 # the number of objects loaded and checked
+        self._oids = iter(oids)
+        self._found = []
+
+    def _fill(self, n):
+        # find allowed objectids until there are n of them; each objectid
+        # yields at most one, so that many objectids are taken at a time
+        found = self._found
+        if n is not None:
+            n += self.lookahead
+        while not self.exhausted and (n is None or len(found) < n):
+            wanted = n is None and 100 or n - len(found)
+            batch = list(itertools.islice(self._oids, wanted))
+            if len(batch) < wanted:
+                self.exhausted = True
+            checked = batch
+            if self.permitted is not None:
+                permitted = self.permitted
+                custom = self.custom or ()
+                accepted = set()
+                checked = []
+                for oid in batch:
+                    if oid in custom:
+                        checked.append(oid)
+                    elif oid in permitted:
+                        accepted.add(oid)
             else:
-                for index in indexes:
-                    self[index].reindex_doc(objectid, resource)
-            if i % commit_interval == 0: # pragma: no cover
-                commit_or_abort()
-            i+=1
-        if i:
-            commit_or_abort()
+                accepted = ()
+            if checked:
+                self.checked += len(checked)
+                resources = self.resolve_many(checked)
+                accepted = set(accepted)
+                for oid, ob in itertools.izip(checked, resources):
+                    if ob is not None and self.checker(ob):
+                        accepted.add(oid)
+            found.extend([oid for oid in batch if oid in accepted])
+
+    def at_least(self, n):
+        """ Return the number of objectids allowed if it's less than ``n``,
+        otherwise ``n`` or more: no more objects than it takes to tell are
+        checked (besides the lookahead)."""
+        self._fill(n)
+        return len(self._found)
+
+    def __iter__(self):
+        i = 0
+        found = self._found
+        while True:
+            if i >= len(found):
+                if self.exhausted:
+                    return
+                self._fill(i + 1)
+                continue
+            yield found[i]
+            i += 1
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            stop = key.stop
+            if key.start is not None and key.start < 0:
+                stop = None
+            if stop is not None and stop < 0:
+                stop = None
+            self._fill(stop)
+        elif key < 0:
+            self._fill(None)
+        else:
+            self._fill(key + 1)
+        return self._found[key]
+
+    def __nonzero__(self):
+        return bool(self.at_least(1))
 
 class Search(object):
-    """ Catalog query helper """
+    """ Catalog query helper.
+
+    ``query``, ``search`` and ``sort`` return a ``(num, oids, resolver)``
+    tuple.  If ``lazy`` is true and there is a permission checker, ``oids``
+    is a :class:`PermittedResults` sequence whose objectids are only checked
+    as they are consumed, and ``num`` is ``None``: how many of them are
+    allowed isn't known (see :meth:`PermittedResults.at_least`)."""
 
     CatalogQuery = CatalogQuery
     
     family = BTrees.family64
     
-    def __init__(self, context, permission_checker=None, family=None):
+    def __init__(self, context, permission_checker=None, family=None,
+                 lazy=False, lookahead=0, use_permission_indexes=None):
         self.context = context
         self.permission_checker = permission_checker
+        self.lazy = lazy
+        self.lookahead = lookahead
+        if use_permission_indexes is None:
+            use_permission_indexes = permission_indexes_enabled(
+                get_current_registry())
+        self.use_permission_indexes = use_permission_indexes
         self.catalog = find_service(self.context, 'catalog')
         self.objectmap = find_objectmap(self.context)
         if family is not None:
@@ -183,37 +768,134 @@ class Search(object):
             logger.warn('Resource for objectid %s missing' % (objectid,))
         return resource
 
+    def resolve_many(self, objectids):
+        """ Return a generator which yields the resource (or ``None``) for
+        each objectid in ``objectids`` in order, like calling ``resolver``
+        for each of them, but traversing to the folder containing each
+        resource only once (see
+        :meth:`substanced.objectmap.ObjectMap.objects_for`)."""
+        objectids = list(objectids)
+        resources = self.objectmap.objects_for(objectids)
+        for objectid, resource in itertools.izip(objectids, resources):
+            if resource is None:
+                logger.warn('Resource for objectid %s missing' % (objectid,))
+            yield resource
+
+    def allowed_index(self):
+        """ Return an index of the catalog which can tell which documents
+        the permission checker allows, or ``None``.  The checker must tell
+        which principals and permission it checks (like
+        :class:`PermissionChecker`).  The index is a
+        :class:`substanced.catalog.indexes.PermissionIndex` of the
+        permission, or, for the ``view`` permission, the catalog's
+        ``allowed`` keyword index of the principals returned by
+        :func:`substanced.catalog.discriminators.get_allowed_to_view`.
+
+        Indexes are only used if ``use_permission_indexes`` was true when
+        the helper was created, which it is by default if the
+        ``substanced.catalog_permission_indexes`` setting is true (see
+        :func:`permission_indexes_enabled`)."""
+        if not self.use_permission_indexes:
+            return None
+        checker = self.permission_checker
+        principals = getattr(checker, 'principals', None)
+        permission = getattr(checker, 'permission', None)
+        if principals is None or permission is None:
+            return None
+        if self.catalog is None:
+            return None
+        for index in self.catalog.values():
+            if (isinstance(index, PermissionIndex) and
+                permission in index.permissions):
+                return index
+        if permission != 'view':
+            return None
+        index = self.catalog.get('allowed')
+        if getattr(index, 'discriminator', None) is not get_allowed_to_view:
+            return None
+        return index
+
+    def _indexed_permitted(self, index):
+        # the documents ``index`` says the checker allows, and the documents
+        # whose ACL denies the permission to some principals, which must be
+        # checked anyway
+        checker = self.permission_checker
+        principals = list(checker.principals)
+        if isinstance(index, PermissionIndex):
+            return (index.allows(principals, checker.permission),
+                    index.denied(checker.permission))
+        if principals:
+            permitted = index.applyAny(principals)
+        else:
+            permitted = self.family.IF.Set()
+        return permitted, index.applyEq(DENIED)
+
     def allowed(self, oids):
+        """ Return the number of objectids in ``oids`` that the permission
+        checker allows and a set of them.  When there's an index of the
+        permission (see :meth:`allowed_index`), the objectids are filtered
+        by intersecting them with the documents the principals are allowed
+        to access; only the documents whose effective ACL denies the
+        permission to some principals are then checked by loading them.
+        Otherwise every document is loaded and checked."""
         checker = self.permission_checker
-        result = self.family.IF.Set()
-        resolver = self.resolver
-        for oid in oids:
-            ob = resolver(oid)
+        IF = self.family.IF
+        index = self.allowed_index()
+        if index is None:
+            result = IF.Set()
+            checked = oids
+        else:
+            if not isinstance(oids, (IF.Set, IF.TreeSet)):
+                oids = IF.Set(oids)
+            permitted, custom = self._indexed_permitted(index)
+            custom = IF.intersection(oids, custom)
+            result = IF.difference(IF.intersection(oids, permitted), custom)
+            checked = custom
+        checked = list(checked)
+        for oid, ob in itertools.izip(checked, self.resolve_many(checked)):
             if ob is None:
                 continue
             if checker(ob):
                 result.insert(oid)
         return len(result), result
 
+    def permitted_results(self, oids):
+        """ Return a :class:`PermittedResults` sequence of the objectids in
+        ``oids`` that the permission checker allows, in the same order.  An
+        index of the permission is used like in :meth:`allowed` if
+        possible."""
+        index = self.allowed_index()
+        permitted = custom = None
+        if index is not None:
+            permitted, custom = self._indexed_permitted(index)
+        return PermittedResults(
+            oids, self.permission_checker, self.resolve_many, permitted,
+            custom, self.lookahead)
+
+    def _filter(self, num, oids):
+        if self.permission_checker is None:
+            return num, oids
+        if self.lazy:
+            # the number of objectids allowed isn't known yet
+            return None, self.permitted_results(oids)
+        return self.allowed(oids)
+
     def query(self, q, **kw):
         num, oids = self.CatalogQuery(
             self.catalog, family=self.family).query(q, **kw)
-        if self.permission_checker is not None:
-            num, oids = self.allowed(oids)
+        num, oids = self._filter(num, oids)
         return num, oids, self.resolver
 
     def search(self, **kw):
         num, oids = self.CatalogQuery(
             self.catalog, family=self.family).search(**kw)
-        if self.permission_checker:
-            num, oids = self.allowed(oids)
+        num, oids = self._filter(num, oids)
         return num, oids, self.resolver
 
     def sort(self, *arg, **kw):
         num, oids = self.CatalogQuery(
             self.catalog, family=self.family).sort(*arg, **kw)
-        if self.permission_checker:
-            num, oids = self.allowed(oids)
+        num, oids = self._filter(num, oids)
         return num, oids, self.resolver
     
 class _catalog_request_api(object):
@@ -234,19 +916,22 @@ class _catalog_request_api(object):
             else:
                 principals = effective_principals(self.request)
                 permission =  permitted
-            def permitted(ob):
-                return authz_policy.permits(ob, principals, permission)
+            permitted = PermissionChecker(authz_policy, principals, permission)
         return permitted
 
 class query_catalog(_catalog_request_api):
     def __call__(self, *arg, **kw):
         checker = self._get_permission_checker(kw)
-        return self.Search(self.context, checker).query(*arg, **kw)
+        lazy = kw.pop('lazy', False)
+        return self.Search(self.context, checker, lazy=lazy).query(*arg, **kw)
 
 class search_catalog(_catalog_request_api):
     def __call__(self, **kw):
         checker = self._get_permission_checker(kw)
-        return self.Search(self.context, checker).search(**kw)
+        lazy = kw.pop('lazy', False)
+        return self.Search(self.context, checker, lazy=lazy).search(**kw)
+
+_marker = object()
 
 def _assertint(docid):
     if not isinstance(docid, (int, long)):
@@ -258,6 +943,51 @@ def is_catalogable(resource, registry=None):
         registry = get_current_registry()
     return bool(registry.content.metadata(resource, 'catalog', False))
 
+def index_dependencies(resource, registry=None):
+    """ Return the ``index_dependencies`` metadata of the content type of
+    ``resource``: a dictionary mapping the name of an index to a sequence
+    of the names of the attributes of the resource its value depends on, or
+    ``None``.  An index which isn't named depends on every attribute."""
+    if registry is None:
+        registry = get_current_registry()
+    return registry.content.metadata(resource, 'index_dependencies', None)
+
+def _depends_on_permissions(index):
+    return (isinstance(index, PermissionIndex) or
+            getattr(index, 'discriminator', None) is get_allowed_to_view)
+
+def reindex_permissions(resource):
+    """ Reindex ``resource`` and every object under it in the indexes which
+    depend on their ACLs (the
+    :class:`substanced.catalog.indexes.PermissionIndex` indexes and the
+    keyword indexes of
+    :func:`substanced.catalog.discriminators.get_allowed_to_view`) of each
+    catalog in the lineage of ``resource`` that indexes them.  Must be
+    called when the ACL of ``resource`` changes, as the objects under it
+    inherit it; :func:`substanced.acl.set_acl` sets an ACL and calls it.
+    Searches filtered with the permission indexes (see
+    :func:`permission_indexes_enabled`) return stale results for the objects
+    under an ACL changed without calling it."""
+    catalogs = find_services(resource, 'catalog')
+    if not catalogs:
+        return
+    objectmap = find_objectmap(resource)
+    if objectmap is None:
+        return
+    objectids = objectmap.pathlookup(resource)
+    for catalog in catalogs:
+        indexes = [ index for index in catalog.values()
+                    if _depends_on_permissions(index) ]
+        if not indexes:
+            continue
+        oids = list(catalog.family.IF.intersection(
+            objectids, catalog.objectids))
+        for oid, node in itertools.izip(oids, objectmap.objects_for(oids)):
+            if node is None:
+                continue
+            for index in indexes:
+                index.reindex_doc(oid, node)
+
 class CatalogablePredicate(object):
     is_catalogable = staticmethod(is_catalogable) # for testing
     
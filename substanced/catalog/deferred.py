@@ -0,0 +1,133 @@
+""" Defer catalog indexing to the end of the transaction.
+
+When the ``substanced.catalog_deferred_indexing`` setting is true, the
+catalog subscribers don't index, reindex or unindex objects as events are
+sent.  Instead they record what should be done in an ``IndexingQueue``
+attached to the current transaction, which coalesces the operations on the
+same object in the same catalog and applies them just before the
+transaction commits.  An object which is modified five times is thus
+reindexed once, and an object which is added and then modified is only
+indexed.
+
+Queries made in the same transaction don't see the queued changes unless
+the queue is processed first (see ``flush_indexing_queue``).
+"""
+
+import weakref
+
+import transaction
+
+from pyramid.settings import asbool
+
+ADD = 'add'
+MODIFY = 'modify'
+REMOVE = 'remove'
+
+# {transaction:IndexingQueue}
+_queues = weakref.WeakKeyDictionary()
+
+def deferred_indexing(registry):
+    """ Return true if the ``substanced.catalog_deferred_indexing`` setting
+    of ``registry`` is true """
+    settings = getattr(registry, 'settings', None) or {}
+    return asbool(settings.get('substanced.catalog_deferred_indexing', False))
+
+class IndexingQueue(object):
+    """ The catalog operations queued in a transaction """
+    def __init__(self, registry=None):
+        self.registry = registry
+        # {(id(catalog), objectid):[catalog, objectid, op, obj, attributes]}
+        self.operations = {}
+        self.order = []
+
+    def __len__(self):
+        return len(self.operations)
+
+    def _queue(self, catalog, objectid, op, obj=None, attributes=None):
+        key = (id(catalog), objectid)
+        entry = self.operations.get(key)
+        if entry is None:
+            self.operations[key] = [catalog, objectid, op, obj, attributes]
+            self.order.append(key)
+            return
+        queued = entry[2]
+        if op == MODIFY:
+            if queued == MODIFY:
+                if entry[4] is None or attributes is None:
+                    entry[4] = None
+                else:
+                    entry[4] = set(entry[4]) | set(attributes)
+                entry[3] = obj
+            elif queued == ADD:
+                # the object will be indexed from scratch anyway
+                entry[3] = obj
+            # a removed object stays removed
+            return
+        entry[2] = op
+        entry[3] = obj
+        entry[4] = None
+
+    def add(self, catalog, objectid, obj):
+        """ Queue the indexing of ``obj`` in ``catalog`` """
+        self._queue(catalog, objectid, ADD, obj)
+
+    def modify(self, catalog, objectid, obj, attributes=None):
+        """ Queue the reindexing of ``obj`` in ``catalog``; ``attributes``
+        are the names of the attributes which changed, or ``None``"""
+        self._queue(catalog, objectid, MODIFY, obj, attributes)
+
+    def remove(self, catalog, objectid):
+        """ Queue the unindexing of ``objectid`` from ``catalog`` """
+        self._queue(catalog, objectid, REMOVE)
+
+    def process(self):
+        """ Apply the queued operations, in the order in which the objects
+        were first queued, and empty the queue """
+        while self.order:
+            order = self.order
+            operations = self.operations
+            self.order = []
+            self.operations = {}
+            # the removals from each catalog are done all at once; the
+            # operations on different objects don't depend on each other
+            removals = {}
+            for key in order:
+                catalog, objectid, op, obj, attributes = operations[key]
+                if op == REMOVE:
+                    removals.setdefault(id(catalog), [catalog, []])
+                    removals[id(catalog)][1].append(objectid)
+            for catalog, objectids in removals.values():
+                IF = catalog.family.IF
+                objectids = IF.intersection(
+                    IF.Set(objectids), catalog.objectids)
+                if objectids:
+                    catalog.unindex_docs(objectids)
+            for key in order:
+                catalog, objectid, op, obj, attributes = operations[key]
+                if op == ADD:
+                    catalog.index_doc(objectid, obj)
+                elif op == MODIFY:
+                    catalog.reindex_doc(
+                        objectid, obj, attributes=attributes,
+                        registry=self.registry)
+
+def get_indexing_queue(registry, txn=None):
+    """ Return the indexing queue of the transaction ``txn`` (the current
+    transaction if it's ``None``), creating it and arranging for it to be
+    processed before the transaction commits if it doesn't exist yet """
+    if txn is None:
+        txn = transaction.get()
+    queue = _queues.get(txn)
+    if queue is None:
+        queue = _queues[txn] = IndexingQueue(registry)
+        txn.addBeforeCommitHook(queue.process)
+    return queue
+
+def flush_indexing_queue(txn=None):
+    """ Apply the operations queued in the transaction ``txn`` (the current
+    transaction if it's ``None``) now rather than when it commits """
+    if txn is None:
+        txn = transaction.get()
+    queue = _queues.get(txn)
+    if queue is not None:
+        queue.process()
@@ -3,8 +3,14 @@ import datetime
 from zope.interface import providedBy
 from zope.interface.declarations import Declaration
 
+from pyramid.compat import is_nonstr_iter
 from pyramid.location import lineage
-from pyramid.security import principals_allowed_by_permission
+from pyramid.security import (
+    AllPermissionsList,
+    Deny,
+    Everyone,
+    principals_allowed_by_permission,
+    )
 
 from ..util import coarse_datetime_repr
 
@@ -87,14 +93,55 @@ def get_modified_date(obj, default):
 class NoWay(object):
     pass
 
+# indexed along with the principals allowed to view an object whose effective
+# ACL denies the permission to some principals (see ``has_deny_aces``)
+DENIED = 'substanced.denied'
+
+def has_deny_aces(obj, permissions=None):
+    """ Return true if the effective ACL of ``obj`` (the ACEs of ``obj`` and
+    of its parents, up to the first one which denies every permission to
+    everyone) has an ACE which denies one of ``permissions`` (or any
+    permission if it's ``None``) to a principal other than ``Everyone``.
+    The principals which have a permission according to such an ACL (e.g.
+    one which denies the permission to a group but allows it to everyone
+    else) can't always be expressed as a list of principals."""
+    for node in lineage(obj):
+        try:
+            acl = node.__acl__
+        except AttributeError:
+            continue
+        if callable(acl):
+            acl = acl()
+        for action, principal, ace_permissions in acl:
+            if action != Deny:
+                continue
+            if principal == Everyone:
+                if isinstance(ace_permissions, AllPermissionsList):
+                    # nothing above this ACE is effective
+                    return False
+                continue
+            if permissions is None:
+                return True
+            if not is_nonstr_iter(ace_permissions):
+                ace_permissions = [ace_permissions]
+            for permission in permissions:
+                if permission in ace_permissions:
+                    return True
+    return False
+
 def get_allowed_to_view(obj, default):
     """ Useful as a KeywordIndex discriminator.  Looks up the principals
     allowed by the ``view`` permission against the object and indexes them if
-    any are found."""
+    any are found.  The ``DENIED`` marker is indexed too if the effective
+    ACL of the object denies the ``view`` permission to some principals (see
+    :func:`has_deny_aces`), as the principals allowed may then not be
+    expressible as a list of principals."""
     principals = principals_allowed_by_permission(obj, 'view')
     if not principals:
         # An empty value tells the catalog to match anything, whereas when
         # there are no principals with permission to view we want for there
         # to be no matches.
         principals = [NoWay()]
+    if has_deny_aces(obj, ('view',)):
+        principals = list(principals) + [DENIED]
     return principals
@@ -1,6 +1,8 @@
+import functools
 import re
 
 import BTrees
+from BTrees.Length import Length
 from persistent import Persistent
 
 from zope.interface import implementer
@@ -10,9 +12,17 @@ from hypatia.interfaces import IIndex
 
 from pyramid.traversal import resource_path_tuple
 from pyramid.compat import url_unquote_text
+from pyramid.security import principals_allowed_by_permission
 from pyramid.settings import asbool
 
 from ..objectmap import find_objectmap
+from .discriminators import has_deny_aces
+
+_marker = object()
+
+# the value passed to ``reindex_doc_value`` for a document which the index's
+# ``discriminate`` method says isn't indexed
+NOT_INDEXED = _marker
 
 PATH_WITH_OPTIONS = re.compile(r'\[(.+?)\](.+?)$')
 
@@ -38,9 +48,22 @@ class PathIndex(BaseIndexMixin, Persistent):
     def unindex_doc(self, docid):
         pass
 
+    def index_docs(self, docs):
+        pass
+
+    def unindex_docs(self, docids):
+        pass
+
     def reindex_doc(self, docid, obj):
         pass
 
+    def reindex_doc_value(self, docid, value):
+        pass
+
+    def discriminate(self, obj, default):
+        # paths are kept by the objectmap, not by this index
+        return default
+
     def docids(self):
         return self.__parent__.objectids
 
@@ -111,7 +134,7 @@ class PathIndex(BaseIndexMixin, Persistent):
                     obj_or_path,))
         return path_tuple, depth, include_origin
 
-    def apply(self, obj_path_or_dict):
+    def _parse_query(self, obj_path_or_dict):
         if isinstance(obj_path_or_dict, dict):
             path_tuple, depth, include_origin = self._parse_path(
                 obj_path_or_dict['path'])
@@ -121,6 +144,20 @@ class PathIndex(BaseIndexMixin, Persistent):
         else:
             path_tuple, depth, include_origin = self._parse_path(
                 obj_path_or_dict)
+        return path_tuple, depth, include_origin
+
+    def count(self, obj_path_or_dict):
+        """ Return the number of object identifiers ``apply`` would return
+        for the same query, using the counts kept by the objectmap rather
+        than computing the result set."""
+        path_tuple, depth, include_origin = self._parse_query(
+            obj_path_or_dict)
+        objectmap = find_objectmap(self.__parent__)
+        return objectmap.count_under(path_tuple, depth, include_origin)
+
+    def apply(self, obj_path_or_dict):
+        path_tuple, depth, include_origin = self._parse_query(
+            obj_path_or_dict)
 
         rs = self.search(path_tuple, depth, include_origin)
 
@@ -131,12 +168,482 @@ class PathIndex(BaseIndexMixin, Persistent):
 
     applyEq = apply
 
+    def apply_intersect(self, query, docids):
+        """ Return the object identifiers in ``docids`` matched by
+        ``query``.  The set of every object identifier under the path is
+        never built: ``docids`` is filtered by the objectmap instead."""
+        if docids is None:
+            return self.apply(query)
+        path_tuple, depth, include_origin = self._parse_query(query)
+        objectmap = find_objectmap(self.__parent__)
+        return objectmap.pathintersect(
+            docids, path_tuple, depth, include_origin)
+
+@implementer(IIndex)
+class PermissionIndex(BaseIndexMixin, Persistent):
+    """ Indexes the principals which have each of ``permissions`` on the
+    indexed objects, according to the authorization policy, so that the
+    documents on which any of a set of principals has one of the permissions
+    can be found with a single set union (see :meth:`allows`).
+
+    A query is a ``(principals, permission)`` tuple, or a dictionary with
+    ``principals`` and ``permission`` keys.
+
+    Like the :func:`substanced.catalog.discriminators.get_allowed_to_view`
+    keyword index, it also remembers, for each permission, which documents
+    have an effective ACL that denies it to some principals (see
+    :meth:`denied`).
+
+    The values of a document depend on the ACLs of all its ancestors, so the
+    object and everything under it must be reindexed whenever an ACL
+    changes, with :func:`substanced.catalog.reindex_permissions` (which
+    :func:`substanced.acl.set_acl` calls) or else searches filtered with the
+    index return stale results."""
+    family = BTrees.family64
+
+    def __init__(self, permissions, family=None):
+        if family is not None:
+            self.family = family
+        self.permissions = tuple(permissions)
+        self.reset()
+
+    def reset(self):
+        # {permission:{principal:docids}}
+        self._fwd_index = self.family.OO.BTree()
+        # {docid:((permission, principals), ...)}
+        self._rev_index = self.family.IO.BTree()
+        # {permission:docids}
+        self._denied = self.family.OO.BTree()
+        self._not_indexed = self.family.IF.TreeSet()
+        self._num_docs = Length(0)
+
+    def discriminate(self, obj, default):
+        principals = {}
+        for permission in self.permissions:
+            principals[permission] = tuple(
+                principals_allowed_by_permission(obj, permission))
+        denied = tuple([ permission for permission in self.permissions
+                         if has_deny_aces(obj, (permission,)) ])
+        return principals, denied
+
+    def index_doc(self, docid, obj):
+        self.reindex_doc_value(docid, self.discriminate(obj, NOT_INDEXED))
+
+    def reindex_doc_value(self, docid, value):
+        """ Reindex ``docid`` with ``value``, a value returned by
+        :meth:`discriminate` (possibly in another process), or
+        :data:`NOT_INDEXED`."""
+        self.unindex_doc(docid)
+        if value is NOT_INDEXED:
+            self._not_indexed.insert(docid)
+            return
+        principals, denied = value
+        entries = []
+        for permission in self.permissions:
+            allowed = principals.get(permission)
+            if not allowed:
+                continue
+            fwd = self._fwd_index.get(permission)
+            if fwd is None:
+                fwd = self._fwd_index[permission] = self.family.OO.BTree()
+            for principal in allowed:
+                docids = fwd.get(principal)
+                if docids is None:
+                    docids = fwd[principal] = self.family.IF.TreeSet()
+                docids.insert(docid)
+            entries.append((permission, tuple(allowed)))
+        for permission in denied:
+            docids = self._denied.get(permission)
+            if docids is None:
+                docids = self._denied[permission] = self.family.IF.TreeSet()
+            docids.insert(docid)
+        self._rev_index[docid] = (tuple(entries), tuple(denied))
+        self._num_docs.change(1)
+
+    def unindex_doc(self, docid):
+        try:
+            self._not_indexed.remove(docid)
+        except KeyError:
+            pass
+        value = self._rev_index.get(docid)
+        if value is None:
+            return
+        entries, denied = value
+        for permission, allowed in entries:
+            fwd = self._fwd_index.get(permission)
+            if fwd is None:
+                continue
+            for principal in allowed:
+                docids = fwd.get(principal)
+                if docids is None:
+                    continue
+                try:
+                    docids.remove(docid)
+                except KeyError:
+                    pass
+                if not docids:
+                    del fwd[principal]
+        for permission in denied:
+            docids = self._denied.get(permission)
+            if docids is None:
+                continue
+            try:
+                docids.remove(docid)
+            except KeyError:
+                pass
+            if not docids:
+                del self._denied[permission]
+        del self._rev_index[docid]
+        self._num_docs.change(-1)
+
+    def indexed(self):
+        return self._rev_index.keys()
+
+    def not_indexed(self):
+        return self._not_indexed
+
+    def _check_permission(self, permission):
+        if permission not in self.permissions:
+            raise ValueError(
+                'The %r permission is not indexed by this index' % permission)
+
+    def denied(self, permission):
+        """ Return the set of the documents whose effective ACL denies
+        ``permission`` to some principals (see
+        :func:`substanced.catalog.discriminators.has_deny_aces`).  The
+        principals which have the permission according to such an ACL can't
+        always be expressed as a list of principals, so callers should check
+        the permission on these documents themselves.  Raises a
+        :exc:`ValueError` if ``permission`` isn't one of the permissions of
+        the index."""
+        self._check_permission(permission)
+        docids = self._denied.get(permission)
+        if docids is None:
+            return self.family.IF.Set()
+        return docids
+
+    def allows(self, principals, permission):
+        """ Return the set of the documents on which any of ``principals``
+        has ``permission``.  Raises a :exc:`ValueError` if ``permission``
+        isn't one of the permissions of the index."""
+        self._check_permission(permission)
+        fwd = self._fwd_index.get(permission)
+        if fwd is None:
+            return self.family.IF.Set()
+        sets = []
+        for principal in principals:
+            docids = fwd.get(principal)
+            if docids is not None:
+                sets.append(docids)
+        return self.family.IF.multiunion(sets)
+
+    def apply(self, query):
+        if isinstance(query, dict):
+            principals = query['principals']
+            permission = query['permission']
+        else:
+            principals, permission = query
+        return self.allows(principals, permission)
+
+    applyEq = apply
+
 # API below, do not remove
 from hypatia.field import FieldIndex
 from hypatia.facet import FacetIndex
 from hypatia.keyword import KeywordIndex
 from hypatia.text import TextIndex
 
+# sets of at most this many docids are removed one docid at a time
+_REMOVE_IN_PLACE_MAX = 64
+
+def remove_docids(docids, removed, family=BTrees.family64):
+    """ Remove the members of the set ``removed`` from the tree set (or set)
+    ``docids`` in place and return how many were removed.  When ``removed``
+    is small (64 members or less), each of them is looked up and removed in
+    ``docids``, so that only the buckets holding them are touched however
+    large ``docids`` is.  Larger sets are intersected with ``docids``, which
+    is rebuilt from the set difference of the two when they are a large
+    part of it."""
+    if len(removed) <= _REMOVE_IN_PLACE_MAX:
+        count = 0
+        for docid in removed:
+            if docid in docids:
+                docids.remove(docid)
+                count += 1
+        return count
+    IF = family.IF
+    common = IF.intersection(docids, removed)
+    count = len(common)
+    if count * 4 >= len(docids):
+        remaining = IF.difference(docids, common)
+        docids.clear()
+        docids.update(remaining)
+    else:
+        for docid in common:
+            docids.remove(docid)
+    return count
+
+def _unindex_forward(index, groups):
+    # Remove the docids in each ``{key:IF.Set}`` of ``groups`` from the
+    # forward index set of ``key``, dropping sets which become empty.
+    fwd_index = index._fwd_index
+    for key, removed in groups.items():
+        docids = fwd_index.get(key)
+        if docids is None:
+            continue
+        remove_docids(docids, removed, index.family)
+        if not docids:
+            del fwd_index[key]
+
+def _field_unindex_docs(index, docids):
+    remove_docids(index._not_indexed, docids, index.family)
+    rev_index = index._rev_index
+    groups = index.family.OO.BTree()
+    count = 0
+    for docid in docids:
+        value = rev_index.get(docid, _marker)
+        if value is _marker:
+            continue
+        del rev_index[docid]
+        removed = groups.get(value)
+        if removed is None:
+            removed = groups[value] = index.family.IF.Set()
+        removed.insert(docid)
+        count += 1
+    _unindex_forward(index, groups)
+    if count:
+        index._num_docs.change(-count)
+
+def _keyword_unindex_docs(index, docids):
+    remove_docids(index._not_indexed, docids, index.family)
+    rev_index = index._rev_index
+    groups = index.family.OO.BTree()
+    count = 0
+    for docid in docids:
+        words = rev_index.get(docid)
+        if words is None:
+            continue
+        del rev_index[docid]
+        for word in words:
+            removed = groups.get(word)
+            if removed is None:
+                removed = groups[word] = index.family.IF.Set()
+            removed.insert(docid)
+        count += 1
+    _unindex_forward(index, groups)
+    if count:
+        index._num_docs.change(-count)
+
+def _field_reindex_value(index, docid, value):
+    # ``FieldIndex.index_doc`` with a precomputed value
+    if value is NOT_INDEXED:
+        index.unindex_doc(docid)
+        index._not_indexed.add(docid)
+        return
+    if docid in index._not_indexed:
+        index._not_indexed.remove(docid)
+    rev_index = index._rev_index
+    if docid in rev_index:
+        if docid in index._fwd_index.get(value, ()):
+            return
+        index.unindex_doc(docid)
+    docids = index._fwd_index.get(value)
+    if docids is None:
+        docids = index._fwd_index[value] = index.family.IF.TreeSet()
+    docids.insert(docid)
+    index._num_docs.change(1)
+    rev_index[docid] = value
+
+def _keyword_reindex_value(index, docid, value):
+    # ``KeywordIndex.index_doc`` with a precomputed value
+    if value is NOT_INDEXED:
+        index.unindex_doc(docid)
+        index._not_indexed.add(docid)
+        return
+    if docid in index._not_indexed:
+        index._not_indexed.remove(docid)
+    if isinstance(value, basestring):
+        raise TypeError('seq argument must be a list/tuple of strings')
+    old_kw = index._rev_index.get(docid)
+    if not value:
+        if old_kw:
+            index.unindex_doc(docid)
+        return
+    new_kw = index.family.OO.Set(index.normalize(value))
+    if old_kw is None:
+        index._insert_forward(docid, new_kw)
+        index._insert_reverse(docid, new_kw)
+        index._num_docs.change(1)
+        return
+    for word in index.family.OO.difference(old_kw, new_kw):
+        docids = index._fwd_index[word]
+        docids.remove(docid)
+        if not docids:
+            del index._fwd_index[word]
+    index._insert_forward(docid, index.family.OO.difference(new_kw, old_kw))
+    index._insert_reverse(docid, new_kw)
+
+# Only these exact classes: a subclass may index its values differently
+_value_reindexers = {
+    FieldIndex: _field_reindex_value,
+    KeywordIndex: _keyword_reindex_value,
+    }
+
+def _value_reindexer(index):
+    # a callable of ``(docid, value)`` which reindexes a document of
+    # ``index``, or ``None``
+    method = getattr(index, 'reindex_doc_value', None)
+    if method is not None:
+        return method
+    reindexer = _value_reindexers.get(type(index))
+    if reindexer is not None:
+        return functools.partial(reindexer, index)
+    return None
+
+def can_reindex_value(index):
+    """ Return true if :func:`reindex_doc_value` can reindex a document of
+    ``index`` with a precomputed value."""
+    return (callable(getattr(index, 'discriminate', None)) and
+            _value_reindexer(index) is not None)
+
+def reindex_doc_value(index, docid, value):
+    """ Reindex the document ``docid`` in ``index`` with ``value``, a value
+    returned by the index's ``discriminate`` method (possibly in another
+    process), or :data:`NOT_INDEXED` if it isn't indexed.  The index's own
+    ``reindex_doc_value(docid, value)`` method is called if it has one (like
+    :class:`PermissionIndex`); field and keyword indexes are reindexed
+    here.  Raises a :exc:`ValueError` for other indexes (see
+    :func:`can_reindex_value`), which must reindex the object itself."""
+    reindexer = _value_reindexer(index)
+    if reindexer is None:
+        raise ValueError(
+            '%r cannot be reindexed with a precomputed value' % (index,))
+    reindexer(docid, value)
+
+def _field_index_docs(index, docs):
+    # ``FieldIndex.index_doc`` for each of ``docs``; the documents which
+    # the index doesn't know yet are inserted a forward index set at a time
+    rev_index = index._rev_index
+    not_indexed = index._not_indexed
+    groups = {}
+    entries = []
+    unindexed = []
+    for docid, obj in docs:
+        if docid in rev_index or docid in not_indexed:
+            index.index_doc(docid, obj)
+            continue
+        value = index.discriminate(obj, _marker)
+        if value is _marker:
+            unindexed.append(docid)
+            continue
+        try:
+            added = groups.setdefault(value, [])
+        except TypeError: # unhashable, yet a valid BTree key
+            index.index_doc(docid, obj)
+            continue
+        added.append(docid)
+        entries.append((docid, value))
+    TreeSet = index.family.IF.TreeSet
+    fwd_index = index._fwd_index
+    for value in sorted(groups):
+        docids = fwd_index.get(value)
+        if docids is None:
+            fwd_index[value] = TreeSet(groups[value])
+        else:
+            docids.update(groups[value])
+    rev_index.update(entries)
+    not_indexed.update(unindexed)
+    if entries:
+        index._num_docs.change(len(entries))
+
+def _keyword_index_docs(index, docs):
+    # ``KeywordIndex.index_doc`` for each of ``docs``; the documents which
+    # the index doesn't know yet are inserted a forward index set at a time
+    rev_index = index._rev_index
+    not_indexed = index._not_indexed
+    groups = index.family.OO.BTree()
+    entries = []
+    unindexed = []
+    for docid, obj in docs:
+        if docid in rev_index or docid in not_indexed:
+            index.index_doc(docid, obj)
+            continue
+        seq = index.discriminate(obj, _marker)
+        if seq is _marker:
+            unindexed.append(docid)
+            continue
+        if isinstance(seq, basestring):
+            raise TypeError('seq argument must be a list/tuple of strings')
+        if not seq:
+            continue
+        words = index.family.OO.Set(index.normalize(seq))
+        for word in words:
+            added = groups.get(word)
+            if added is None:
+                added = groups[word] = []
+            added.append(docid)
+        entries.append((docid, words))
+    IF = index.family.IF
+    fwd_index = index._fwd_index
+    for word, added in groups.items():
+        docids = fwd_index.get(word)
+        if docids is None:
+            docids = fwd_index[word] = IF.Set()
+        docids.update(added)
+        if (not isinstance(docids, IF.TreeSet) and
+                len(docids) >= index.tree_threshold):
+            fwd_index[word] = IF.TreeSet(docids)
+    rev_index.update(entries)
+    not_indexed.update(unindexed)
+    if entries:
+        index._num_docs.change(len(entries))
+
+# Only these exact classes: a subclass may index its documents differently
+_bulk_indexers = {
+    FieldIndex: _field_index_docs,
+    KeywordIndex: _keyword_index_docs,
+    }
+
+def index_docs(index, docs):
+    """ Index every ``(docid, obj)`` pair of the sequence ``docs`` in
+    ``index``, as ``index.index_doc(docid, obj)`` would.  Each docid must
+    appear only once.  If the index has an ``index_docs`` method, it is
+    called with ``docs``.  Field and keyword indexes compute the value of
+    every document first, then add the documents they didn't know yet to
+    each of their forward index sets at once and to their reverse index in
+    a single update.  Other indexes have their ``index_doc`` method called
+    for each document."""
+    bulk = getattr(index, 'index_docs', None)
+    if bulk is not None:
+        return bulk(docs)
+    bulk = _bulk_indexers.get(type(index))
+    if bulk is not None:
+        return bulk(index, docs)
+    for docid, obj in docs:
+        index.index_doc(docid, obj)
+
+# Only these exact classes: a subclass may unindex its documents differently
+_bulk_unindexers = {
+    FieldIndex: _field_unindex_docs,
+    KeywordIndex: _keyword_unindex_docs,
+    FacetIndex: _keyword_unindex_docs,
+    }
+
+def unindex_docs(index, docids):
+    """ Unindex every docid in the set ``docids`` from ``index``.  If the
+    index has an ``unindex_docs`` method, it is called with ``docids``.  The
+    entries of field, keyword and facet indexes are removed a whole set at
+    a time.  Other indexes (including subclasses of those) have their
+    ``unindex_doc`` method called for each docid."""
+    bulk = getattr(index, 'unindex_docs', None)
+    if bulk is not None:
+        return bulk(docids)
+    bulk = _bulk_unindexers.get(type(index))
+    if bulk is not None:
+        return bulk(index, docids)
+    for docid in docids:
+        index.unindex_doc(docid)
+
 # pyflakes:
 FieldIndex = FieldIndex
 FacetIndex = FacetIndex
@@ -14,6 +14,10 @@ from ..util import (
     )
 
 from . import is_catalogable
+from .deferred import (
+    deferred_indexing,
+    get_indexing_queue,
+    )
 
 @subscribe_added()
 def object_added(event):
@@ -21,41 +25,72 @@ def object_added(event):
     children in every catalog service in the lineage of the object. Depends
     upon the fact that ``substanced.objectmap.object_will_be_added`` to
     assign an ``__objectid__`` to the object and its children will have been
-    fired before this gets fired.
+    fired before this gets fired.  If indexing is deferred (see
+    :mod:`substanced.catalog.deferred`), the objects are indexed when the
+    transaction commits.
     """
     obj = event.object
     catalogs = find_services(obj, 'catalog')
     if not catalogs:
         return
-    for node in postorder(obj):
-        if is_catalogable(node, event.registry):
-            objectid = oid_of(node)
+    docs = [(oid_of(node), node) for node in postorder(obj)
+            if is_catalogable(node, event.registry)]
+    if deferred_indexing(event.registry):
+        queue = get_indexing_queue(event.registry)
+        for objectid, node in docs:
             for catalog in catalogs:
-                catalog.index_doc(objectid, node)
+                queue.add(catalog, objectid, node)
+        return
+    for catalog in catalogs:
+        catalog.index_docs(docs)
 
 @subscribe_will_be_removed()
 def object_will_be_removed(event):
     """ Unindex an object and its children from every catalog service object's
     lineage; an :class:`substanced.event.ObjectWillBeRemoved` event
-    subscriber"""
+    subscriber.  If indexing is deferred, the objects are unindexed when the
+    transaction commits."""
     obj = event.object
     objectmap = find_objectmap(obj)
     catalogs = find_services(obj, 'catalog')
     if objectmap is None or not catalogs:
         return
+    queue = None
+    if deferred_indexing(event.registry):
+        queue = get_indexing_queue(event.registry)
     objectids = objectmap.pathlookup(obj)
     for catalog in catalogs:
-        for oid in catalog.family.IF.intersection(objectids, catalog.objectids):
-            catalog.unindex_doc(oid)
+        if queue is None:
+            # each removed objectid is looked up in the catalog's objectids;
+            # intersecting the two sets would walk every one of them
+            indexed = catalog.objectids
+            catalog.unindex_docs(catalog.family.IF.Set(
+                [oid for oid in objectids if oid in indexed]))
+        else:
+            # objects whose indexing is still queued aren't in the catalog's
+            # objectids yet, so the removal of every object is queued; the
+            # queue only unindexes the ones which are indexed by then
+            for oid in objectids:
+                queue.remove(catalog, oid)
 
 @subscribe_modified()
 def object_modified(event):
     """ Reindex a single object (non-recursive) in every catalog service in
     the object's lineage; an :class:`substanced.event.ObjectModifed` event
-    subscriber"""
+    subscriber.  Only the indexes which depend on the ``attributes`` of the
+    event (if it has any) are reindexed.  If indexing is deferred, the
+    object is reindexed (once) when the transaction commits."""
     obj = event.object
+    attributes = getattr(event, 'attributes', None)
     catalogs = find_services(obj, 'catalog')
+    queue = None
+    if catalogs and deferred_indexing(event.registry):
+        queue = get_indexing_queue(event.registry)
     for catalog in catalogs:
         objectid = oid_of(obj)
-        catalog.reindex_doc(objectid, obj)
+        if queue is None:
+            catalog.reindex_doc(
+                objectid, obj, attributes=attributes, registry=event.registry)
+        else:
+            queue.modify(catalog, objectid, obj, attributes)
 
@@ -102,6 +102,48 @@ class TestCatalog(unittest.TestCase):
         catalog['name'] = idx
         self.assertRaises(ValueError, catalog.index_doc, 'abc', 'value')
 
+    def test_index_docs(self):
+        inst = self._makeOne()
+        inst.index_docs_batch_size = 2
+        L = []
+        class Index(DummyIndex):
+            def index_doc(self, docid, value):
+                L.append((self.arg[0], docid, value))
+        inst['a'] = Index('a')
+        inst['b'] = Index('b')
+        inst.index_docs([(3, 'three'), (1, 'one'), (2, 'two')])
+        self.assertEqual(L, [('a', 1, 'one'), ('a', 2, 'two'),
+                             ('b', 1, 'one'), ('b', 2, 'two'),
+                             ('a', 3, 'three'), ('b', 3, 'three')])
+        self.assertEqual(list(inst.objectids), [1, 2, 3])
+
+    def test_index_docs_same_docid_twice(self):
+        inst = self._makeOne()
+        L = []
+        class Index(DummyIndex):
+            def index_doc(self, docid, value):
+                L.append((docid, value))
+        inst['a'] = Index('a')
+        inst.index_docs([(2, 'two'), (1, 'one'), (2, 'deux')])
+        self.assertEqual(L, [(1, 'one'), (2, 'deux')])
+
+    def test_index_docs_field_index(self):
+        from hypatia.field import FieldIndex
+        inst = self._makeOne()
+        inst['color'] = FieldIndex('color')
+        red = testing.DummyResource(color='red')
+        blue = testing.DummyResource(color='blue')
+        inst.index_docs([(3, red), (1, blue), (2, red)])
+        self.assertEqual(list(inst['color'].applyEq('red')), [2, 3])
+        self.assertEqual(list(inst['color'].applyEq('blue')), [1])
+        self.assertEqual(list(inst.objectids), [1, 2, 3])
+
+    def test_index_docs_not_int(self):
+        inst = self._makeOne()
+        inst['a'] = DummyIndex()
+        self.assertRaises(ValueError, inst.index_docs, [(1, 'one'), ('x', 2)])
+        self.assertEqual(list(inst.objectids), [])
+
     def test_unindex_doc_indexes(self):
         catalog = self._makeOne()
         idx = DummyIndex()
@@ -120,6 +162,29 @@ class TestCatalog(unittest.TestCase):
         inst.unindex_doc(1)
         self.assertEqual(list(inst.objectids), [])
 
+    def test_unindex_docs(self):
+        from hypatia.field import FieldIndex
+        inst = self._makeOne()
+        inst['color'] = FieldIndex('color')
+        inst['other'] = DummyIndex()
+        for docid in range(5):
+            inst.index_doc(docid, testing.DummyModel(color=docid % 2))
+        inst.unindex_docs([1, 2, 3, 10])
+        self.assertEqual(list(inst.objectids), [0, 4])
+        self.assertEqual(list(inst['color'].applyEq(0)), [0, 4])
+        self.assertEqual(list(inst['color'].applyEq(1)), [])
+        self.assertEqual(inst['other'].unindexed, 10)
+
+    def test_unindex_docs_set(self):
+        inst = self._makeOne()
+        inst.objectids.update([1, 2])
+        inst.unindex_docs(self.family.IF.Set([1]))
+        self.assertEqual(list(inst.objectids), [2])
+
+    def test_unindex_docs_not_int(self):
+        inst = self._makeOne()
+        self.assertRaises(ValueError, inst.unindex_docs, ['abc'])
+
     def test_reindex_doc_indexes(self):
         catalog = self._makeOne()
         idx = DummyIndex()
@@ -138,6 +203,52 @@ class TestCatalog(unittest.TestCase):
         inst = self._makeOne()
         inst.reindex_doc(1, object())
         self.assertEqual(list(inst.objectids), [1])
+
+    def _makeDependentIndexes(self, inst):
+        inst['title'] = DummyIndex()
+        inst['texts'] = DummyIndex()
+        inst['other'] = DummyIndex()
+        registry = Dummy()
+        registry.content = DummyContentMetadata(
+            {'index_dependencies':{'title':('title',),
+                                   'texts':('title', 'body')}})
+        return registry
+
+    def test_reindex_doc_with_attributes(self):
+        inst = self._makeOne()
+        registry = self._makeDependentIndexes(inst)
+        inst.reindex_doc(1, 'value', attributes=['body'], registry=registry)
+        self.assertFalse(hasattr(inst['title'], 'reindexed_docid'))
+        self.assertEqual(inst['texts'].reindexed_docid, 1)
+        self.assertEqual(inst['other'].reindexed_docid, 1)
+        self.assertEqual(inst.reindex_stats(), {'reindexed':2, 'skipped':1})
+        self.assertEqual(list(inst.objectids), [1])
+
+    def test_reindex_doc_with_no_attributes(self):
+        inst = self._makeOne()
+        registry = self._makeDependentIndexes(inst)
+        inst.reindex_doc(1, 'value', attributes=(), registry=registry)
+        self.assertEqual(inst['other'].reindexed_docid, 1)
+        self.assertEqual(inst.reindex_stats(), {'reindexed':1, 'skipped':2})
+
+    def test_reindex_doc_attributes_unknown(self):
+        inst = self._makeOne()
+        registry = self._makeDependentIndexes(inst)
+        inst.reindex_doc(1, 'value', registry=registry)
+        self.assertEqual(inst['title'].reindexed_docid, 1)
+        self.assertEqual(inst.reindex_stats(), {'reindexed':3, 'skipped':0})
+
+    def test_reindex_doc_with_attributes_no_dependencies(self):
+        inst = self._makeOne()
+        inst['title'] = DummyIndex()
+        registry = Dummy()
+        registry.content = DummyContentMetadata({})
+        inst.reindex_doc(1, 'value', attributes=['body'], registry=registry)
+        self.assertEqual(inst['title'].reindexed_docid, 1)
+
+    def test_reindex_stats_empty(self):
+        inst = self._makeOne()
+        self.assertEqual(inst.reindex_stats(), {'reindexed':0, 'skipped':0})
         
     def test_reindex(self):
         a = testing.DummyModel()
@@ -145,6 +256,7 @@ class TestCatalog(unittest.TestCase):
         transaction = DummyTransaction()
         inst = self._makeOne()
         inst.transaction = transaction
+        inst.clock = DummyClock()
         objectmap = DummyObjectMap({1:[a, (u'', u'a')]})
         site = _makeSite(catalog=inst, objectmap=objectmap)
         site['a'] = a
@@ -155,7 +267,8 @@ class TestCatalog(unittest.TestCase):
         self.assertEqual(L, [(1, a)])
         self.assertEqual(out,
                           ["reindexing /a",
-                          '*** committing ***'])
+                          '*** committing ***',
+                          'processed 1 of 1 objects (1.0 objects/second)'])
         self.assertEqual(transaction.committed, 1)
 
     def test_reindex_with_missing_path(self):
@@ -167,6 +280,7 @@ class TestCatalog(unittest.TestCase):
             )
         inst = self._makeOne()
         inst.transaction = transaction
+        inst.clock = DummyClock()
         site = _makeSite(catalog=inst, objectmap=objectmap)
         site['a'] = a
         inst.objectids = [1, 2]
@@ -177,7 +291,8 @@ class TestCatalog(unittest.TestCase):
         self.assertEqual(out,
                           ["reindexing /a",
                           "error: object at path /b not found",
-                          '*** committing ***'])
+                          '*** committing ***',
+                          'processed 2 of 2 objects (2.0 objects/second)'])
         self.assertEqual(transaction.committed, 1)
 
     def test_reindex_with_missing_objectid(self):
@@ -187,6 +302,7 @@ class TestCatalog(unittest.TestCase):
         objectmap = DummyObjectMap()
         inst = self._makeOne()
         inst.transaction = transaction
+        inst.clock = DummyClock()
         site = _makeSite(catalog=inst, objectmap=objectmap)
         site['a'] = a
         inst.objectids = [1]
@@ -195,7 +311,8 @@ class TestCatalog(unittest.TestCase):
         self.assertEqual(L, [])
         self.assertEqual(out,
                           ["error: no path for objectid 1 in object map",
-                          '*** committing ***'])
+                          '*** committing ***',
+                          'processed 1 of 1 objects (1.0 objects/second)'])
         self.assertEqual(transaction.committed, 1)
         
         
@@ -207,6 +324,7 @@ class TestCatalog(unittest.TestCase):
         transaction = DummyTransaction()
         inst = self._makeOne()
         inst.transaction = transaction
+        inst.clock = DummyClock()
         site = _makeSite(catalog=inst, objectmap=objectmap)
         site['a'] = a
         site['b'] = b
@@ -220,7 +338,8 @@ class TestCatalog(unittest.TestCase):
         self.assertEqual(L, [(1, a)])
         self.assertEqual(out,
                           ['reindexing /a',
-                          '*** committing ***'])
+                          '*** committing ***',
+                          'processed 2 of 2 objects (2.0 objects/second)'])
         self.assertEqual(transaction.committed, 1)
 
     def test_reindex_dryrun(self):
@@ -231,6 +350,7 @@ class TestCatalog(unittest.TestCase):
         transaction = DummyTransaction()
         inst = self._makeOne()
         inst.transaction = transaction
+        inst.clock = DummyClock()
         site = _makeSite(catalog=inst, objectmap=objectmap)
         site['a'] = a
         site['b'] = b
@@ -242,7 +362,8 @@ class TestCatalog(unittest.TestCase):
         self.assertEqual(out,
                          ['reindexing /a',
                           'reindexing /b',
-                          '*** aborting ***'])
+                          '*** aborting ***',
+                          'processed 2 of 2 objects (2.0 objects/second)'])
         self.assertEqual(transaction.aborted, 1)
         self.assertEqual(transaction.committed, 0)
 
@@ -253,6 +374,7 @@ class TestCatalog(unittest.TestCase):
         transaction = DummyTransaction()
         inst = self._makeOne()
         inst.transaction = transaction
+        inst.clock = DummyClock()
         site = _makeSite(catalog=inst, objectmap=objectmap)
         site['a'] = a
         inst.objectids = [1]
@@ -265,10 +387,416 @@ class TestCatalog(unittest.TestCase):
         self.assertEqual(out,
                           ["reindexing only indexes ('index',)",
                           'reindexing /a',
-                          '*** committing ***'])
+                          '*** committing ***',
+                          'processed 1 of 1 objects (1.0 objects/second)'])
         self.assertEqual(transaction.committed, 1)
         self.assertEqual(L, [(1,a)])
-    
+
+    def test_reindex_batches_in_path_order(self):
+        a = DummyPersistentModel()
+        b = DummyPersistentModel()
+        c = DummyPersistentModel()
+        L = []
+        objectmap = DummyObjectMap({1: [b, (u'', u'b')],
+                                    2: [c, (u'', u'b', u'c')],
+                                    3: [a, (u'', u'a')]})
+        inst = self._makeOne()
+        inst.transaction = DummyTransaction()
+        inst.clock = DummyClock()
+        jar = DummyJar()
+        inst._p_jar = jar
+        site = _makeSite(catalog=inst, objectmap=objectmap)
+        site['a'] = a
+        site['b'] = b
+        b['c'] = c
+        for objectid in (1, 2, 3):
+            inst.objectids.insert(objectid)
+        inst.reindex_doc = lambda objectid, model: L.append(objectid)
+        inst.reindex(commit_interval=2, output=False)
+        self.assertEqual(L, [1, 2, 3])
+        self.assertEqual(inst.transaction.committed, 2)
+        self.assertEqual(a.deactivated, 1)
+        self.assertEqual(b.deactivated, 1) # not again as the parent of c
+        self.assertEqual(c.deactivated, 1)
+        self.assertEqual(jar.gced, 2)
+
+    def test_reindex_sorts_batch_by_path(self):
+        a = testing.DummyModel()
+        b = testing.DummyModel()
+        L = []
+        objectmap = DummyObjectMap({1: [b, (u'', u'b')], 2: [a, (u'', u'a')]})
+        inst = self._makeOne()
+        inst.transaction = DummyTransaction()
+        site = _makeSite(catalog=inst, objectmap=objectmap)
+        site['a'] = a
+        site['b'] = b
+        inst.objectids = [1, 2]
+        inst.reindex_doc = lambda objectid, model: L.append(objectid)
+        inst.reindex(output=False)
+        self.assertEqual(L, [2, 1])
+
+    def test_reindex_max_memory(self):
+        a = testing.DummyModel()
+        b = testing.DummyModel()
+        objectmap = DummyObjectMap({1: [a, (u'', u'a')], 2: [b, (u'', u'b')]})
+        inst = self._makeOne()
+        inst.transaction = DummyTransaction()
+        inst.clock = DummyClock()
+        inst.memory_use = lambda: 200
+        jar = DummyJar()
+        inst._p_jar = jar
+        site = _makeSite(catalog=inst, objectmap=objectmap)
+        site['a'] = a
+        site['b'] = b
+        inst.objectids = [1, 2]
+        inst.reindex_doc = lambda objectid, model: None
+        out = []
+        inst.reindex(max_memory=100, output=out.append)
+        self.assertEqual(
+            out[:3],
+            ['reindexing /a',
+             'using 200 MB (more than 100 MB), minimizing the cache',
+             'reindexing /b'])
+        self.assertEqual(jar.minimized, 1) # once per batch
+
+    def test_reindex_max_memory_not_exceeded(self):
+        a = testing.DummyModel()
+        objectmap = DummyObjectMap({1: [a, (u'', u'a')]})
+        inst = self._makeOne()
+        inst.transaction = DummyTransaction()
+        inst.memory_use = lambda: None
+        jar = DummyJar()
+        inst._p_jar = jar
+        site = _makeSite(catalog=inst, objectmap=objectmap)
+        site['a'] = a
+        inst.objectids = [1]
+        inst.reindex_doc = lambda objectid, model: None
+        inst.reindex(max_memory=100, output=False)
+        self.assertEqual(jar.minimized, 0)
+
+    def test_reindex_with_mapper_releases_loaded_resources(self):
+        from .. import compute_reindex_values
+        inst = self._makeParallel()
+        inst['other'] = DummyIndex()
+        jar = DummyJar()
+        inst._p_jar = jar
+        def mapper(L, indexes, path_re):
+            return [compute_reindex_values(inst, shard) for shard in L]
+        inst.reindex(mapper=mapper, output=False)
+        self.assertEqual(jar.gced, 1)
+
+    def test_reindex_with_mapper_object_changed(self):
+        from .. import compute_reindex_values
+        inst = self._makeParallel()
+        a = inst.__parent__.__parent__['a']
+        a._p_activate = lambda: None
+        a._p_serial = 'old'
+        def mapper(L, indexes, path_re):
+            results = [compute_reindex_values(inst, shard) for shard in L]
+            a.color = 'purple'
+            a._p_serial = 'new'
+            return results
+        out = []
+        inst.reindex(mapper=mapper, output=out.append)
+        self.assertTrue(
+            '/a changed since its values were computed, reindexing it' in out)
+        self.assertEqual(list(inst['color'].applyEq('purple')), [1])
+        self.assertEqual(list(inst['color'].applyEq('green')), [])
+
+    def test_reindex_with_mapper_max_memory(self):
+        from .. import compute_reindex_values
+        inst = self._makeParallel()
+        inst.memory_use = lambda: 200
+        jar = DummyJar()
+        inst._p_jar = jar
+        def mapper(L, indexes, path_re):
+            return [compute_reindex_values(inst, shard) for shard in L]
+        inst.reindex(commit_interval=2, mapper=mapper, max_memory=100,
+                     output=False)
+        self.assertEqual(jar.minimized, 2) # once per shard
+
+    def test_reindex_values_no_values(self):
+        from hypatia.field import FieldIndex
+        a = testing.DummyModel(color='red')
+        inst = self._makeOne()
+        inst['color'] = FieldIndex('color')
+        inst.reindex_values(1, None, resource=a)
+        self.assertEqual(list(inst['color'].applyEq('red')), [1])
+
+    def test_objectid_shards(self):
+        inst = self._makeOne()
+        for objectid in (1, 2, 5, 7, 9):
+            inst.objectids.insert(objectid)
+        self.assertEqual(inst.objectid_shards(2), [(1, 2), (5, 7), (9, 9)])
+        self.assertEqual(inst.objectid_shards(5), [(1, 9)])
+
+    def test_objectid_shards_empty(self):
+        inst = self._makeOne()
+        self.assertEqual(inst.objectid_shards(2), [])
+
+    def test_reindex_values(self):
+        from hypatia.field import FieldIndex
+        a = testing.DummyModel(color='red')
+        inst = self._makeOne()
+        inst['color'] = FieldIndex('color')
+        inst['other'] = DummyIndex()
+        inst.index_doc(1, a)
+        inst.reindex_values(1, {'color':'blue'}, resource=a)
+        self.assertEqual(list(inst['color'].applyEq('blue')), [1])
+        self.assertEqual(list(inst['color'].applyEq('red')), [])
+        self.assertEqual(inst['other'].reindexed_ob, a)
+        self.assertEqual(list(inst.objectids), [1])
+
+    def test_reindex_values_not_indexed(self):
+        from hypatia.field import FieldIndex
+        a = testing.DummyModel(color='red')
+        inst = self._makeOne()
+        inst['color'] = FieldIndex('color')
+        inst.index_doc(1, a)
+        inst.reindex_values(1, {})
+        self.assertEqual(list(inst['color'].applyEq('red')), [])
+        self.assertEqual(list(inst['color'].not_indexed()), [1])
+
+    def _makeParallel(self, transaction=None):
+        from hypatia.field import FieldIndex
+        a = testing.DummyModel(color='red')
+        b = testing.DummyModel(color='blue')
+        objectmap = DummyObjectMap(
+            {1: [a, (u'', u'a')], 2: [b, (u'', u'b')], 3: [None, (u'', u'c')]}
+            )
+        inst = self._makeOne()
+        inst.transaction = transaction or DummyTransaction()
+        inst.clock = DummyClock()
+        site = _makeSite(catalog=inst, objectmap=objectmap)
+        site['a'] = a
+        site['b'] = b
+        inst['color'] = FieldIndex('color')
+        for objectid in (1, 2, 3):
+            inst.objectids.insert(objectid)
+        a.color = 'green'
+        return inst
+
+    def test_reindex_with_mapper(self):
+        from .. import compute_reindex_values
+        inst = self._makeParallel()
+        shards = []
+        def mapper(L, indexes, path_re):
+            shards.extend(L)
+            return [compute_reindex_values(inst, shard) for shard in L]
+        out = []
+        inst.reindex(commit_interval=2, mapper=mapper, output=out.append)
+        self.assertEqual(shards, [(1, 2), (3, 3)])
+        self.assertEqual(list(inst['color'].applyEq('green')), [1])
+        self.assertEqual(list(inst['color'].applyEq('blue')), [2])
+        self.assertEqual(
+            out,
+            ['*** committing ***',
+             'processed 2 of 3 objects (2.0 objects/second, '
+             'about 0:00:00 remaining)',
+             'error: object at path /c not found',
+             '*** committing ***',
+             'processed 3 of 3 objects (1.5 objects/second)'])
+        self.assertEqual(inst.transaction.committed, 2)
+        self.assertEqual(inst.reindex_checkpoint, None)
+
+    def test_reindex_with_mapper_dryrun_and_indexes(self):
+        from .. import compute_reindex_values
+        inst = self._makeParallel()
+        inst['other'] = DummyIndex()
+        def mapper(L, indexes, path_re):
+            return [compute_reindex_values(inst, shard, indexes)
+                    for shard in L]
+        out = []
+        inst.reindex(dry_run=True, indexes=('other',), mapper=mapper,
+                     output=out.append)
+        self.assertEqual(out[0], "reindexing only indexes ('other',)")
+        self.assertEqual(out[2], '*** aborting ***')
+        self.assertEqual(inst['other'].reindexed_docid, 2)
+        self.assertEqual(list(inst['color'].applyEq('green')), [])
+        self.assertEqual(inst.transaction.aborted, 1)
+        self.assertEqual(inst.transaction.committed, 0)
+
+    def test_reindex_with_mapper_conflict(self):
+        from .. import compute_reindex_values
+        inst = self._makeParallel(DummyConflictingTransaction(1))
+        def mapper(L, indexes, path_re):
+            return [compute_reindex_values(inst, shard) for shard in L]
+        out = []
+        inst.reindex(mapper=mapper, output=out.append)
+        self.assertTrue('*** conflict, retrying batch ***' in out)
+        self.assertEqual(inst.transaction.committed, 1)
+        self.assertEqual(inst.transaction.aborted, 1)
+        self.assertEqual(list(inst['color'].applyEq('green')), [1])
+
+    def test_reindex_with_mapper_conflict_gives_up(self):
+        from ZODB.POSException import ConflictError
+        from .. import compute_reindex_values
+        inst = self._makeParallel(DummyConflictingTransaction(3))
+        def mapper(L, indexes, path_re):
+            return [compute_reindex_values(inst, shard) for shard in L]
+        self.assertRaises(
+            ConflictError, inst.reindex, mapper=mapper, output=False)
+        self.assertEqual(inst.transaction.aborted, 3)
+
+    def test_reindex_records_checkpoint(self):
+        a = testing.DummyModel()
+        b = testing.DummyModel()
+        objectmap = DummyObjectMap({1: [a, (u'', u'a')], 2: [b, (u'', u'b')]})
+        inst = self._makeOne()
+        checkpoints = []
+        class Transaction(DummyTransaction):
+            def commit(self):
+                checkpoints.append(inst.reindex_checkpoint)
+        inst.transaction = Transaction()
+        inst.clock = DummyClock()
+        site = _makeSite(catalog=inst, objectmap=objectmap)
+        site['a'] = a
+        site['b'] = b
+        inst.objectids.insert(1)
+        inst.objectids.insert(2)
+        inst['index'] = DummyIndex()
+        out = []
+        inst.reindex(commit_interval=1, indexes=['index'],
+                     path_re=re.compile('/', re.I), output=out.append)
+        self.assertEqual(
+            checkpoints,
+            [{'objectid':1, 'indexes':('index',), 'path_re':('/', re.I),
+              'processed':1},
+             None])
+        self.assertEqual(
+            out[3], 'processed 1 of 2 objects (1.0 objects/second, '
+                    'about 0:00:01 remaining)')
+
+    def test_reindex_resume(self):
+        a = testing.DummyModel()
+        b = testing.DummyModel()
+        L = []
+        objectmap = DummyObjectMap({1: [a, (u'', u'a')], 2: [b, (u'', u'b')]})
+        inst = self._makeOne()
+        inst.transaction = DummyTransaction()
+        inst.clock = DummyClock()
+        site = _makeSite(catalog=inst, objectmap=objectmap)
+        site['a'] = a
+        site['b'] = b
+        inst.objectids.insert(1)
+        inst.objectids.insert(2)
+        index = DummyIndex()
+        inst['index'] = index
+        index.reindex_doc = lambda objectid, model: L.append((objectid, model))
+        inst.reindex_checkpoint = {'objectid':1, 'indexes':('index',),
+                                   'path_re':('/', 0), 'processed':1}
+        out = []
+        inst.reindex(resume=True, output=out.append)
+        self.assertEqual(L, [(2, b)])
+        self.assertEqual(out,
+                         ['resuming reindex after objectid 1',
+                          "reindexing only indexes ('index',)",
+                          'reindexing /b',
+                          '*** committing ***',
+                          'processed 2 of 2 objects (1.0 objects/second)'])
+        self.assertEqual(inst.reindex_checkpoint, None)
+
+    def test_reindex_resume_without_checkpoint(self):
+        inst = self._makeOne()
+        inst.transaction = DummyTransaction()
+        out = []
+        inst.reindex(resume=True, output=out.append)
+        self.assertEqual(out, ['no interrupted reindex to resume'])
+        self.assertEqual(inst.transaction.committed, 0)
+
+    def test_reindex_resume_with_other_indexes(self):
+        inst = self._makeOne()
+        inst.reindex_checkpoint = {'objectid':1, 'indexes':('index',),
+                                   'path_re':None, 'processed':1}
+        self.assertRaises(ValueError, inst.reindex, resume=True,
+                          indexes=['other'], output=False)
+
+    def test_reindex_resume_with_other_path_re(self):
+        inst = self._makeOne()
+        inst.reindex_checkpoint = {'objectid':1, 'indexes':None,
+                                   'path_re':('/a', 0), 'processed':1}
+        self.assertRaises(ValueError, inst.reindex, resume=True,
+                          path_re=re.compile('/b'), output=False)
+
+    def test_reindex_with_mapper_resume(self):
+        from .. import compute_reindex_values
+        inst = self._makeParallel()
+        inst.reindex_checkpoint = {'objectid':1, 'indexes':None,
+                                   'path_re':None, 'processed':1}
+        shards = []
+        checkpoints = []
+        def mapper(L, indexes, path_re):
+            shards.extend(L)
+            for shard in L:
+                checkpoints.append(inst.reindex_checkpoint)
+                yield compute_reindex_values(inst, shard)
+        out = []
+        inst.reindex(commit_interval=1, resume=True, mapper=mapper,
+                     output=out.append)
+        self.assertEqual(shards, [(2, 2), (3, 3)])
+        self.assertEqual(checkpoints[1], {'objectid':2, 'indexes':None,
+                                          'path_re':None, 'processed':2})
+        self.assertEqual(inst.reindex_checkpoint, None)
+        self.assertEqual(list(inst['color'].applyEq('green')), [])
+        self.assertEqual(out[-1],
+                         'processed 3 of 3 objects (1.0 objects/second)')
+
+class Test_compute_reindex_values(unittest.TestCase):
+    def _callFUT(self, catalog, shard, indexes=None, path_re=None):
+        from .. import compute_reindex_values
+        return compute_reindex_values(catalog, shard, indexes, path_re)
+
+    def _makeCatalog(self):
+        from hypatia.field import FieldIndex
+        from .. import Catalog
+        from ..indexes import PathIndex
+        a = testing.DummyModel(color='red')
+        b = testing.DummyModel()
+        objectmap = DummyObjectMap(
+            {1: [a, (u'', u'a')], 2: [b, (u'', u'b')], 3: [None, (u'', u'c')]}
+            )
+        catalog = Catalog()
+        site = _makeSite(catalog=catalog, objectmap=objectmap)
+        site['a'] = a
+        site['b'] = b
+        catalog['color'] = FieldIndex('color')
+        catalog['path'] = PathIndex()
+        catalog['other'] = DummyIndex()
+        for objectid in (1, 2, 3):
+            catalog.objectids.insert(objectid)
+        return catalog
+
+    def test_it(self):
+        catalog = self._makeCatalog()
+        result = self._callFUT(catalog, (1, 3))
+        self.assertEqual(result, [(1, '/a', None, {'color':'red'}),
+                                  (2, '/b', None, {}),
+                                  (3, None, None, None)])
+
+    def test_shard(self):
+        catalog = self._makeCatalog()
+        result = self._callFUT(catalog, (2, 3))
+        self.assertEqual(result, [(2, '/b', None, {}), (3, None, None, None)])
+
+    def test_indexes(self):
+        catalog = self._makeCatalog()
+        result = self._callFUT(catalog, (1, 1), indexes=('other',))
+        self.assertEqual(result, [(1, '/a', None, {})])
+
+    def test_path_re(self):
+        catalog = self._makeCatalog()
+        result = self._callFUT(catalog, (1, 2), path_re=re.compile('/b'))
+        self.assertEqual(result, [(2, '/b', None, {})])
+
+    def test_serial(self):
+        catalog = self._makeCatalog()
+        a = catalog.__parent__.__parent__['a']
+        a._p_activate = lambda: setattr(a, 'activated', True)
+        a._p_serial = 'serial'
+        result = self._callFUT(catalog, (1, 1))
+        self.assertEqual(result, [(1, '/a', 'serial', {'color':'red'})])
+        self.assertTrue(a.activated)
+
 class TestSearch(unittest.TestCase):
     family = BTrees.family64
     
@@ -356,6 +884,14 @@ class TestSearch(unittest.TestCase):
         results = map(resolver, objectids)
         self.assertEqual(results, [None])
 
+    def test_resolve_many(self):
+        ob = object()
+        objectmap = DummyObjectMap({1:[ob, (u'',)], 2:[None, (u'', u'a')]})
+        site = _makeSite(objectmap=objectmap, catalog=DummyCatalog())
+        adapter = self._makeOne(site)
+        self.assertEqual(list(adapter.resolve_many(iter([2, 1, 3]))),
+                         [None, ob, None])
+
     def test_query_unfound_objectid(self):
         catalog = DummyCatalog()
         objectmap = DummyObjectMap({})
@@ -445,6 +981,277 @@ class TestSearch(unittest.TestCase):
         self.assertEqual(num, 0)
         self.assertEqual(list(objectids), [])
 
+    def _registerAuthorizationPolicy(self):
+        from pyramid.authorization import ACLAuthorizationPolicy
+        from pyramid.interfaces import IAuthorizationPolicy
+        self.config.registry.registerUtility(
+            ACLAuthorizationPolicy(), IAuthorizationPolicy)
+        settings = self.config.registry.settings
+        settings['substanced.catalog_permission_indexes'] = 'true'
+
+    def _indexDocs(self, index, acls):
+        # ``denies`` adds an ACE which denies every permission to a group
+        from pyramid.security import Deny, ALL_PERMISSIONS
+        obs = {}
+        for oid, (acl, denies) in acls.items():
+            if denies:
+                acl = [(Deny, 'group:denied', ALL_PERMISSIONS)] + acl
+            ob = testing.DummyResource(__acl__=acl)
+            index.index_doc(oid, ob)
+            obs[oid] = [ob, (u'', str(oid))]
+        return obs
+
+    def _makeAllowedIndex(self, acls):
+        from hypatia.keyword import KeywordIndex
+        from ..discriminators import get_allowed_to_view
+        self._registerAuthorizationPolicy()
+        index = KeywordIndex(get_allowed_to_view)
+        return index, self._indexDocs(index, acls)
+
+    def _makeChecker(self, principals, permission='view', result=False):
+        checker = DummyPermissionChecker(principals, permission, result)
+        return checker
+
+    def test_allowed_index_not_enabled(self):
+        index, obs = self._makeAllowedIndex({})
+        self.config.registry.settings = {}
+        catalog = DummyCatalog({'allowed':index})
+        site = _makeSite(catalog=catalog)
+        adapter = self._makeOne(site, self._makeChecker(['bob']))
+        self.assertEqual(adapter.use_permission_indexes, False)
+        self.assertEqual(adapter.allowed_index(), None)
+
+    def test_allowed_index_enabled_explicitly(self):
+        index, obs = self._makeAllowedIndex({})
+        self.config.registry.settings = {}
+        catalog = DummyCatalog({'allowed':index})
+        site = _makeSite(catalog=catalog)
+        adapter = self._getTargetClass()(
+            site, self._makeChecker(['bob']), use_permission_indexes=True)
+        self.assertTrue(adapter.allowed_index() is index)
+
+    def test_allowed_index_with_function_checker(self):
+        index, obs = self._makeAllowedIndex({})
+        catalog = DummyCatalog({'allowed':index})
+        site = _makeSite(catalog=catalog)
+        adapter = self._makeOne(site, lambda ob: True)
+        self.assertEqual(adapter.allowed_index(), None)
+
+    def test_allowed_index_other_permission(self):
+        index, obs = self._makeAllowedIndex({})
+        catalog = DummyCatalog({'allowed':index})
+        site = _makeSite(catalog=catalog)
+        adapter = self._makeOne(site, self._makeChecker(['bob'], 'edit'))
+        self.assertEqual(adapter.allowed_index(), None)
+
+    def test_allowed_index_other_discriminator(self):
+        from hypatia.keyword import KeywordIndex
+        catalog = DummyCatalog({'allowed':KeywordIndex('allowed')})
+        site = _makeSite(catalog=catalog)
+        adapter = self._makeOne(site, self._makeChecker(['bob']))
+        self.assertEqual(adapter.allowed_index(), None)
+
+    def test_allowed_index_no_index(self):
+        site = _makeSite(catalog=DummyCatalog())
+        adapter = self._makeOne(site, self._makeChecker(['bob']))
+        self.assertEqual(adapter.allowed_index(), None)
+
+    def test_allowed_index(self):
+        index, obs = self._makeAllowedIndex({})
+        catalog = DummyCatalog({'allowed':index})
+        site = _makeSite(catalog=catalog)
+        adapter = self._makeOne(site, self._makeChecker(['bob']))
+        self.assertTrue(adapter.allowed_index() is index)
+
+    def test_allowed_with_allowed_index(self):
+        from pyramid.security import Allow, Deny, Everyone
+        index, obs = self._makeAllowedIndex({
+            1:([(Allow, 'bob', 'view')], False),
+            2:([(Allow, 'alice', 'view')], False),
+            3:([(Allow, 'group:a', 'view')], False),
+            4:([(Deny, 'group:b', 'view'), (Allow, Everyone, 'view')], True),
+            5:([(Allow, 'bob', 'view')], False),
+            })
+        objectmap = DummyObjectMap(obs)
+        catalog = DummyCatalog({'allowed':index})
+        site = _makeSite(objectmap=objectmap, catalog=catalog)
+        checker = self._makeChecker([Everyone, 'bob', 'group:b'])
+        adapter = self._makeOne(site, checker)
+        num, objectids = adapter.allowed([1, 2, 3, 4])
+        self.assertEqual(num, 1)
+        self.assertEqual(list(objectids), [1])
+        # only the document whose ACL denies the permission to some
+        # principals was loaded and checked
+        self.assertEqual(checker.checked, [obs[4][0]])
+
+    def test_allowed_with_allowed_index_denies_permitted(self):
+        from pyramid.security import Allow
+        index, obs = self._makeAllowedIndex({
+            1:([(Allow, 'alice', 'view')], False),
+            2:([(Allow, 'alice', 'view')], True),
+            })
+        objectmap = DummyObjectMap(obs)
+        catalog = DummyCatalog({'allowed':index})
+        site = _makeSite(objectmap=objectmap, catalog=catalog)
+        checker = self._makeChecker(['bob'], result=True)
+        adapter = self._makeOne(site, checker)
+        num, objectids = adapter.allowed(self.family.IF.Set([1, 2]))
+        self.assertEqual(num, 1)
+        self.assertEqual(list(objectids), [2])
+
+    def test_allowed_with_allowed_index_no_principals(self):
+        from pyramid.security import Allow, Everyone
+        index, obs = self._makeAllowedIndex({
+            1:([(Allow, Everyone, 'view')], False),
+            })
+        catalog = DummyCatalog({'allowed':index})
+        site = _makeSite(objectmap=DummyObjectMap(obs), catalog=catalog)
+        adapter = self._makeOne(site, self._makeChecker([]))
+        num, objectids = adapter.allowed([1])
+        self.assertEqual(num, 0)
+        self.assertEqual(list(objectids), [])
+
+    def test_search_with_allowed_index(self):
+        from pyramid.security import Allow
+        index, obs = self._makeAllowedIndex({
+            1:([(Allow, 'bob', 'view')], False),
+            2:([(Allow, 'alice', 'view')], False),
+            })
+        catalog = DummyCatalog({'allowed':index})
+        site = _makeSite(objectmap=DummyObjectMap(obs), catalog=catalog)
+        checker = self._makeChecker(['bob'])
+        adapter = self._makeOne(site, checker)
+        adapter.CatalogQuery = DummyCatalogQuery((2, [1, 2]))
+        num, objectids, resolver = adapter.search()
+        self.assertEqual(num, 1)
+        self.assertEqual(list(objectids), [1])
+        self.assertEqual(checker.checked, [])
+
+    def _makePermissionIndex(self, acls, permissions=('view', 'edit')):
+        from ..indexes import PermissionIndex
+        self._registerAuthorizationPolicy()
+        index = PermissionIndex(permissions)
+        return index, self._indexDocs(index, acls)
+
+    def test_allowed_index_permission_index(self):
+        index, obs = self._makePermissionIndex({})
+        catalog = DummyCatalog({'perms':index})
+        site = _makeSite(catalog=catalog)
+        adapter = self._makeOne(site, self._makeChecker(['bob'], 'edit'))
+        self.assertTrue(adapter.allowed_index() is index)
+
+    def test_allowed_index_permission_index_other_permission(self):
+        index, obs = self._makePermissionIndex({})
+        catalog = DummyCatalog({'perms':index})
+        site = _makeSite(catalog=catalog)
+        adapter = self._makeOne(site, self._makeChecker(['bob'], 'delete'))
+        self.assertEqual(adapter.allowed_index(), None)
+
+    def test_allowed_with_permission_index(self):
+        from pyramid.security import Allow, Deny, Everyone
+        index, obs = self._makePermissionIndex({
+            1:([(Allow, 'bob', 'edit')], False),
+            2:([(Allow, 'bob', 'view')], False),
+            3:([(Allow, 'group:a', 'edit')], False),
+            4:([(Deny, 'group:b', 'edit'), (Allow, Everyone, 'edit')], True),
+            })
+        catalog = DummyCatalog({'perms':index})
+        site = _makeSite(objectmap=DummyObjectMap(obs), catalog=catalog)
+        checker = self._makeChecker([Everyone, 'bob', 'group:b'], 'edit')
+        adapter = self._makeOne(site, checker)
+        num, objectids = adapter.allowed([1, 2, 3, 4])
+        self.assertEqual(num, 1)
+        self.assertEqual(list(objectids), [1])
+        self.assertEqual(checker.checked, [obs[4][0]])
+
+    def test_allowed_with_permission_index_other_permission_denied(self):
+        from pyramid.security import Allow, Deny, Everyone
+        index, obs = self._makePermissionIndex({
+            1:([(Deny, 'group:b', 'view'), (Allow, Everyone, 'edit')], False),
+            2:([(Allow, 'bob', 'view')], False),
+            })
+        catalog = DummyCatalog({'perms':index})
+        site = _makeSite(objectmap=DummyObjectMap(obs), catalog=catalog)
+        checker = self._makeChecker(['bob', Everyone], 'edit')
+        adapter = self._makeOne(site, checker)
+        num, objectids = adapter.allowed([1, 2])
+        self.assertEqual(list(objectids), [1])
+        # denying ``view`` doesn't matter for ``edit``
+        self.assertEqual(checker.checked, [])
+
+    def test_search_lazy_with_permission_index(self):
+        from pyramid.security import Allow
+        index, obs = self._makePermissionIndex({
+            1:([(Allow, 'bob', 'edit')], False),
+            2:([(Allow, 'alice', 'edit')], False),
+            3:([(Allow, 'bob', 'edit')], False),
+            })
+        catalog = DummyCatalog({'perms':index})
+        site = _makeSite(objectmap=DummyObjectMap(obs), catalog=catalog)
+        checker = self._makeChecker(['bob'], 'edit')
+        adapter = self._getTargetClass()(site, checker, lazy=True)
+        adapter.CatalogQuery = DummyCatalogQuery((3, [3, 2, 1]))
+        num, objectids, resolver = adapter.search()
+        self.assertEqual(num, None)
+        self.assertEqual(list(objectids), [3, 1])
+        self.assertEqual(checker.checked, [])
+
+    def test_search_lazy(self):
+        obs = dict([(oid, [testing.DummyResource(oid=oid), (u'', str(oid))])
+                    for oid in range(1, 7)])
+        site = _makeSite(objectmap=DummyObjectMap(obs),
+                         catalog=DummyCatalog())
+        def permitted(ob):
+            return ob.oid % 2
+        adapter = self._getTargetClass()(site, permitted, lazy=True)
+        adapter.CatalogQuery = DummyCatalogQuery((6, [5, 4, 3, 2, 1, 6]))
+        num, objectids, resolver = adapter.search()
+        self.assertEqual(num, None)
+        self.assertEqual(objectids.checked, 0)
+        self.assertEqual(objectids[:2], [5, 3])
+        self.assertEqual(objectids.checked, 3)
+        self.assertEqual(list(objectids), [5, 3, 1])
+        self.assertEqual(objectids.checked, 6)
+
+    def test_query_lazy_without_permission_checker(self):
+        site = _makeSite(catalog=DummyCatalog())
+        adapter = self._getTargetClass()(site, lazy=True)
+        adapter.CatalogQuery = DummyCatalogQuery((2, [2, 1]))
+        num, objectids, resolver = adapter.query(DummyQuery())
+        self.assertEqual(num, 2)
+        self.assertEqual(objectids, [2, 1])
+
+    def test_sort_lazy_with_allowed_index(self):
+        from pyramid.security import Allow
+        index, obs = self._makeAllowedIndex({
+            1:([(Allow, 'bob', 'view')], False),
+            2:([(Allow, 'alice', 'view')], False),
+            3:([(Allow, 'alice', 'view')], True),
+            4:([(Allow, 'bob', 'view')], False),
+            })
+        catalog = DummyCatalog({'allowed':index})
+        site = _makeSite(objectmap=DummyObjectMap(obs), catalog=catalog)
+        checker = self._makeChecker(['bob'], result=True)
+        adapter = self._getTargetClass()(site, checker, lazy=True)
+        adapter.CatalogQuery = DummyCatalogQuery((4, [4, 3, 2, 1]))
+        num, objectids, resolver = adapter.sort([1, 2, 3, 4], 'name')
+        self.assertEqual(num, None)
+        self.assertEqual(list(objectids), [4, 3, 1])
+        self.assertEqual(checker.checked, [obs[3][0]])
+
+    def test_search_lazy_with_allowed_index_no_principals(self):
+        from pyramid.security import Allow, Everyone
+        index, obs = self._makeAllowedIndex({
+            1:([(Allow, Everyone, 'view')], False),
+            })
+        catalog = DummyCatalog({'allowed':index})
+        site = _makeSite(objectmap=DummyObjectMap(obs), catalog=catalog)
+        adapter = self._getTargetClass()(
+            site, self._makeChecker([]), lazy=True)
+        adapter.CatalogQuery = DummyCatalogQuery((1, [1]))
+        num, objectids, resolver = adapter.search()
+        self.assertEqual(list(objectids), [])
+
 class TestSearchFunctional(unittest.TestCase):
     family = BTrees.family64
     
@@ -733,6 +1540,16 @@ class Test_query_catalog(unittest.TestCase):
         inst('q', a=1, permitted=(['bob'], 'view'))
         self.assertTrue(inst.Search.checker(request.context))
         
+
+    def test_it_lazy(self):
+        request = testing.DummyRequest()
+        request.context = testing.DummyResource()
+        inst = self._makeOne(request)
+        inst.Search = DummySearch(True)
+        inst('q', a=1, lazy=True)
+        self.assertEqual(inst.Search.lazy, True)
+
+
 class Test_search_catalog(unittest.TestCase):
     def setUp(self):
         self.config = testing.setUp()
@@ -787,6 +1604,232 @@ class Test_search_catalog(unittest.TestCase):
         inst(a=1, permitted=(['bob'], 'view'))
         self.assertTrue(inst.Search.checker(request.context))
 
+    def test_it_lazy(self):
+        request = testing.DummyRequest()
+        request.context = testing.DummyResource()
+        inst = self._makeOne(request)
+        inst.Search = DummySearch(True)
+        inst(a=1, lazy=True)
+        self.assertEqual(inst.Search.lazy, True)
+
+
+class TestPermittedResults(unittest.TestCase):
+    def _makeOne(self, oids, checker=None, permitted=None, custom=None,
+                 lookahead=0):
+        from .. import PermittedResults
+        if checker is None:
+            def checker(ob):
+                return ob % 2
+        self.resolved = []
+        def resolve_many(oids):
+            self.resolved.append(list(oids))
+            return [oid != 7 and oid or None for oid in oids]
+        return PermittedResults(
+            oids, checker, resolve_many, permitted, custom, lookahead)
+
+    def test_iter(self):
+        inst = self._makeOne([1, 2, 3, 4, 5, 7])
+        self.assertEqual(list(inst), [1, 3, 5])
+        self.assertTrue(inst.exhausted)
+        self.assertEqual(inst.checked, 6)
+        # iterating again doesn't check anything
+        self.assertEqual(list(inst), [1, 3, 5])
+        self.assertEqual(inst.checked, 6)
+
+    def test_iter_stops_early(self):
+        import itertools
+        inst = self._makeOne(range(1, 100))
+        self.assertEqual(list(itertools.islice(inst, 2)), [1, 3])
+        self.assertEqual(inst.checked, 3)
+        self.assertFalse(inst.exhausted)
+
+    def test_at_least(self):
+        inst = self._makeOne(range(1, 100))
+        self.assertEqual(inst.at_least(3), 3)
+        self.assertEqual(self.resolved, [[1, 2, 3], [4], [5]])
+        self.assertEqual(inst.checked, 5)
+        self.assertFalse(inst.exhausted)
+
+    def test_at_least_fewer(self):
+        inst = self._makeOne([1, 2, 3])
+        self.assertEqual(inst.at_least(5), 2)
+        self.assertTrue(inst.exhausted)
+
+    def test_at_least_lookahead(self):
+        inst = self._makeOne(range(1, 100), lookahead=2)
+        self.assertEqual(inst.at_least(1), 3)
+        self.assertEqual(inst.checked, 5)
+
+    def test_getitem(self):
+        inst = self._makeOne(range(1, 100))
+        self.assertEqual(inst[1], 3)
+        self.assertEqual(inst.checked, 3)
+        self.assertEqual(inst[1:3], [3, 5])
+        self.assertEqual(inst.checked, 5)
+        self.assertRaises(IndexError, inst.__getitem__, 100)
+
+    def test_getitem_negative(self):
+        inst = self._makeOne([1, 2, 3, 4, 5])
+        self.assertEqual(inst[-1], 5)
+        self.assertTrue(inst.exhausted)
+        inst = self._makeOne([1, 2, 3, 4, 5])
+        self.assertEqual(inst[-2:], [3, 5])
+        inst = self._makeOne([1, 2, 3, 4, 5])
+        self.assertEqual(inst[:-1], [1, 3])
+
+    def test_nonzero(self):
+        self.assertTrue(self._makeOne([2, 3]))
+        self.assertFalse(self._makeOne([2, 4]))
+
+    def test_permitted_and_custom(self):
+        def checker(ob):
+            return ob == 4
+        inst = self._makeOne(
+            [6, 5, 4, 3, 2, 1], checker, permitted=set([1, 3, 5, 6]),
+            custom=set([4, 6]))
+        self.assertEqual(list(inst), [5, 4, 3, 1])
+        self.assertEqual(self.resolved, [[6], [4]])
+        self.assertEqual(inst.checked, 2)
+
+class TestPermissionChecker(unittest.TestCase):
+    def _makeOne(self, authz_policy, principals, permission):
+        from .. import PermissionChecker
+        return PermissionChecker(authz_policy, principals, permission)
+
+    def test_it(self):
+        class DummyAuthorizationPolicy(object):
+            def permits(self, context, principals, permission):
+                return (context, principals, permission)
+        inst = self._makeOne(DummyAuthorizationPolicy(), ['bob'], 'view')
+        self.assertEqual(inst.principals, ['bob'])
+        self.assertEqual(inst.permission, 'view')
+        self.assertEqual(inst('ob'), ('ob', ['bob'], 'view'))
+
+class Test_permission_indexes_enabled(unittest.TestCase):
+    def _callFUT(self, registry):
+        from .. import permission_indexes_enabled
+        return permission_indexes_enabled(registry)
+
+    def test_no_settings(self):
+        registry = testing.DummyResource()
+        registry.settings = None
+        self.assertFalse(self._callFUT(registry))
+
+    def test_not_set(self):
+        registry = testing.DummyResource()
+        registry.settings = {}
+        self.assertFalse(self._callFUT(registry))
+
+    def test_enabled(self):
+        registry = testing.DummyResource()
+        registry.settings = {'substanced.catalog_permission_indexes':'true'}
+        self.assertTrue(self._callFUT(registry))
+
+class Test_reindex_permissions(unittest.TestCase):
+    def setUp(self):
+        from pyramid.authorization import ACLAuthorizationPolicy
+        from pyramid.interfaces import IAuthorizationPolicy
+        self.config = testing.setUp()
+        self.config.registry.registerUtility(
+            ACLAuthorizationPolicy(), IAuthorizationPolicy)
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _callFUT(self, resource):
+        from .. import reindex_permissions
+        return reindex_permissions(resource)
+
+    def _makeTree(self):
+        from pyramid.security import Allow
+        from hypatia.field import FieldIndex
+        from hypatia.keyword import KeywordIndex
+        from ...objectmap import ObjectMap
+        from ..discriminators import get_allowed_to_view
+        from ..indexes import PermissionIndex
+        catalog = self._makeCatalog()
+        site = _makeSite(catalog=catalog)
+        site.__acl__ = [(Allow, 'admin', 'view')]
+        objectmap = site.__objectmap__ = ObjectMap(site)
+        objectmap.add(site, (u'',))
+        folder = site['folder'] = testing.DummyResource(
+            __acl__=[(Allow, 'bob', ('view', 'edit'))])
+        folder['doc'] = testing.DummyResource(title='doc')
+        site['other'] = testing.DummyResource()
+        for path in [(u'', u'folder'), (u'', u'folder', u'doc'),
+                     (u'', u'other')]:
+            node = site
+            for name in path[1:]:
+                node = node[name]
+            node.__oid__ = objectmap.add(node, path)
+        catalog['perms'] = PermissionIndex(('view', 'edit'))
+        catalog['allowed'] = KeywordIndex(get_allowed_to_view)
+        catalog['title'] = FieldIndex('title')
+        for node in (folder, folder['doc'], site['other']):
+            catalog.index_doc(node.__oid__, node)
+        return site, catalog
+
+    def _makeCatalog(self):
+        from .. import Catalog
+        catalog = Catalog()
+        catalog.__name__ = 'catalog'
+        return catalog
+
+    def test_it(self):
+        from pyramid.security import Allow
+        site, catalog = self._makeTree()
+        folder = site['folder']
+        doc = folder['doc']
+        perms = catalog['perms']
+        self.assertEqual(list(perms.allows(['bob'], 'edit')),
+                         [folder.__oid__, doc.__oid__])
+        folder.__acl__ = [(Allow, 'alice', 'edit')]
+        doc.title = 'changed'
+        self._callFUT(folder)
+        self.assertEqual(list(perms.allows(['bob'], 'edit')), [])
+        self.assertEqual(list(perms.allows(['alice'], 'edit')),
+                         [folder.__oid__, doc.__oid__])
+        self.assertEqual(list(catalog['allowed'].applyAny(['bob'])), [])
+        # the other indexes aren't reindexed
+        self.assertEqual(list(catalog['title'].applyEq('doc')),
+                         [doc.__oid__])
+
+    def test_not_indexed_in_catalog(self):
+        site, catalog = self._makeTree()
+        other = site['other']
+        catalog.unindex_doc(other.__oid__)
+        self._callFUT(site)
+        self.assertFalse(other.__oid__ in catalog['perms'].indexed())
+
+    def test_no_catalog(self):
+        resource = testing.DummyResource()
+        self.assertEqual(self._callFUT(resource), None)
+
+    def test_no_objectmap(self):
+        site = _makeSite(catalog=self._makeCatalog())
+        self.assertEqual(self._callFUT(site), None)
+
+class Test_index_dependencies(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _callFUT(self, resource, registry=None):
+        from .. import index_dependencies
+        return index_dependencies(resource, registry)
+
+    def test_it(self):
+        registry = Dummy()
+        registry.content = DummyContentMetadata(
+            {'index_dependencies':{'title':('title',)}})
+        self.assertEqual(self._callFUT(None, registry), {'title':('title',)})
+
+    def test_current_registry(self):
+        self.config.registry.content = DummyContentMetadata({})
+        self.assertEqual(self._callFUT(None), None)
+
 class Test_is_catalogable(unittest.TestCase):
     def setUp(self):
         self.config = testing.setUp()
@@ -850,8 +1893,9 @@ class DummySearch(object):
     def __init__(self, result):
         self.result = result
 
-    def __call__(self, context, checker=None):
+    def __call__(self, context, checker=None, lazy=False):
         self.checker = checker
+        self.lazy = lazy
         return self
 
     def query(self, *arg, **kw):
@@ -860,6 +1904,17 @@ class DummySearch(object):
     def search(self, **kw):
         return self.result
 
+class DummyPermissionChecker(object):
+    def __init__(self, principals, permission, result):
+        self.principals = principals
+        self.permission = permission
+        self.result = result
+        self.checked = []
+
+    def __call__(self, ob):
+        self.checked.append(ob)
+        return self.result
+
 class DummyQuery(object):
     pass    
 
@@ -879,6 +1934,10 @@ class DummyObjectMap(object):
             return
         return data[0]
 
+    def objects_for(self, objectids):
+        for objectid in objectids:
+            yield self.object_for(objectid)
+
 class DummyCatalogQuery(object):
     family = BTrees.family64
     def __init__(self, result=(0, [])):
@@ -912,6 +1971,47 @@ class DummyTransaction(object):
 
     def abort(self):
         self.aborted += 1
+
+class DummyPersistentModel(testing.DummyResource):
+    deactivated = 0
+
+    def _p_deactivate(self):
+        self.deactivated += 1
+
+class DummyJar(object):
+    gced = 0
+    minimized = 0
+
+    def register(self, obj):
+        pass
+
+    def cacheGC(self):
+        self.gced += 1
+
+    def cacheMinimize(self):
+        self.minimized += 1
+
+class DummyClock(object):
+    # each call takes a second
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        now = self.now
+        self.now += 1
+        return now
+
+class DummyConflictingTransaction(DummyTransaction):
+    def __init__(self, conflicts):
+        DummyTransaction.__init__(self)
+        self.conflicts = conflicts
+
+    def commit(self):
+        if self.conflicts:
+            self.conflicts -= 1
+            from ZODB.POSException import ConflictError
+            raise ConflictError
+        DummyTransaction.commit(self)
         
 
 @implementer(IIndex)
@@ -965,5 +2065,12 @@ class DummyContent(object):
         return getattr(resource, 'result', default)
         
 
+class DummyContentMetadata(object):
+    def __init__(self, meta):
+        self.meta = meta
+
+    def metadata(self, resource, name, default=None):
+        return self.meta.get(name, default)
+
 class Dummy(object):
     pass
@@ -0,0 +1,212 @@
+import unittest
+
+import BTrees
+
+class Test_deferred_indexing(unittest.TestCase):
+    def _callFUT(self, registry):
+        from ..deferred import deferred_indexing
+        return deferred_indexing(registry)
+
+    def test_no_settings(self):
+        self.assertFalse(self._callFUT(None))
+
+    def test_false(self):
+        registry = DummyRegistry(
+            {'substanced.catalog_deferred_indexing':'false'})
+        self.assertFalse(self._callFUT(registry))
+
+    def test_true(self):
+        registry = DummyRegistry(
+            {'substanced.catalog_deferred_indexing':'true'})
+        self.assertTrue(self._callFUT(registry))
+
+class TestIndexingQueue(unittest.TestCase):
+    def _makeOne(self, registry=None):
+        from ..deferred import IndexingQueue
+        return IndexingQueue(registry)
+
+    def test_add(self):
+        inst = self._makeOne()
+        catalog = DummyCatalog()
+        inst.add(catalog, 1, 'obj')
+        self.assertEqual(len(inst), 1)
+        inst.process()
+        self.assertEqual(catalog.done, [('index', 1, 'obj')])
+        self.assertEqual(len(inst), 0)
+
+    def test_modify_many(self):
+        inst = self._makeOne('registry')
+        catalog = DummyCatalog()
+        inst.modify(catalog, 1, 'obj', ['a'])
+        inst.modify(catalog, 1, 'obj', ['b'])
+        inst.modify(catalog, 1, 'obj2', ['a'])
+        inst.process()
+        self.assertEqual(
+            catalog.done, [('reindex', 1, 'obj2', set(['a', 'b']), 'registry')])
+
+    def test_modify_unknown_attributes(self):
+        inst = self._makeOne()
+        catalog = DummyCatalog()
+        inst.modify(catalog, 1, 'obj', ['a'])
+        inst.modify(catalog, 1, 'obj')
+        inst.modify(catalog, 1, 'obj', ['b'])
+        inst.process()
+        self.assertEqual(catalog.done, [('reindex', 1, 'obj', None, None)])
+
+    def test_add_then_modify(self):
+        inst = self._makeOne()
+        catalog = DummyCatalog()
+        inst.add(catalog, 1, 'obj')
+        inst.modify(catalog, 1, 'obj2', ['a'])
+        inst.process()
+        self.assertEqual(catalog.done, [('index', 1, 'obj2')])
+
+    def test_modify_then_remove(self):
+        inst = self._makeOne()
+        catalog = DummyCatalog()
+        inst.modify(catalog, 1, 'obj', ['a'])
+        inst.remove(catalog, 1)
+        inst.modify(catalog, 1, 'obj', ['a'])
+        inst.process()
+        self.assertEqual(catalog.done, [('unindex', [1])])
+
+    def test_add_then_remove(self):
+        inst = self._makeOne()
+        catalog = DummyCatalog(objectids=())
+        inst.add(catalog, 1, 'obj')
+        inst.remove(catalog, 1)
+        inst.process()
+        self.assertEqual(catalog.done, [])
+
+    def test_remove_not_indexed(self):
+        inst = self._makeOne()
+        catalog = DummyCatalog(objectids=(1,))
+        inst.remove(catalog, 1)
+        inst.remove(catalog, 2)
+        inst.process()
+        self.assertEqual(catalog.done, [('unindex', [1])])
+
+    def test_remove_then_add(self):
+        inst = self._makeOne()
+        catalog = DummyCatalog()
+        inst.remove(catalog, 1)
+        inst.add(catalog, 1, 'obj')
+        inst.process()
+        self.assertEqual(catalog.done, [('index', 1, 'obj')])
+
+    def test_removals_in_bulk(self):
+        inst = self._makeOne()
+        catalog1 = DummyCatalog()
+        catalog2 = DummyCatalog()
+        inst.add(catalog1, 3, 'obj3')
+        inst.remove(catalog1, 2)
+        inst.remove(catalog2, 2)
+        inst.remove(catalog1, 1)
+        inst.process()
+        self.assertEqual(catalog1.done, [('unindex', [1, 2]),
+                                         ('index', 3, 'obj3')])
+        self.assertEqual(catalog2.done, [('unindex', [2])])
+
+    def test_per_catalog_in_order(self):
+        inst = self._makeOne()
+        catalog1 = DummyCatalog()
+        catalog2 = DummyCatalog()
+        inst.modify(catalog1, 2, 'obj2')
+        inst.modify(catalog2, 1, 'obj1')
+        inst.add(catalog1, 1, 'obj1')
+        inst.modify(catalog1, 2, 'obj2')
+        self.assertEqual(len(inst), 3)
+        inst.process()
+        self.assertEqual(catalog1.done, [('reindex', 2, 'obj2', None, None),
+                                         ('index', 1, 'obj1')])
+        self.assertEqual(catalog2.done, [('reindex', 1, 'obj1', None, None)])
+
+    def test_process_queued_while_processing(self):
+        inst = self._makeOne()
+        catalog = DummyCatalog()
+        def index_doc(objectid, obj):
+            catalog.done.append(('index', objectid, obj))
+            if objectid == 1:
+                inst.add(catalog, 2, 'obj2')
+        catalog.index_doc = index_doc
+        inst.add(catalog, 1, 'obj1')
+        inst.process()
+        self.assertEqual(catalog.done, [('index', 1, 'obj1'),
+                                        ('index', 2, 'obj2')])
+
+class Test_get_indexing_queue(unittest.TestCase):
+    def _callFUT(self, registry, txn=None):
+        from ..deferred import get_indexing_queue
+        return get_indexing_queue(registry, txn)
+
+    def test_creates_once(self):
+        txn = DummyTransaction()
+        queue = self._callFUT('registry', txn)
+        self.assertEqual(queue.registry, 'registry')
+        self.assertEqual(txn.hooks, [queue.process])
+        self.assertTrue(self._callFUT('registry', txn) is queue)
+        self.assertEqual(len(txn.hooks), 1)
+
+    def test_current_transaction(self):
+        import transaction
+        transaction.begin()
+        try:
+            queue = self._callFUT(None)
+            self.assertTrue(self._callFUT(None, transaction.get()) is queue)
+        finally:
+            transaction.abort()
+
+class Test_flush_indexing_queue(unittest.TestCase):
+    def _callFUT(self, txn=None):
+        from ..deferred import flush_indexing_queue
+        return flush_indexing_queue(txn)
+
+    def test_no_queue(self):
+        self._callFUT(DummyTransaction()) # doesn't blow up
+
+    def test_it(self):
+        from ..deferred import get_indexing_queue
+        txn = DummyTransaction()
+        catalog = DummyCatalog()
+        get_indexing_queue(None, txn).add(catalog, 1, 'obj')
+        self._callFUT(txn)
+        self.assertEqual(catalog.done, [('index', 1, 'obj')])
+
+    def test_current_transaction(self):
+        import transaction
+        from ..deferred import get_indexing_queue
+        transaction.begin()
+        try:
+            catalog = DummyCatalog()
+            get_indexing_queue(None).add(catalog, 1, 'obj')
+            self._callFUT()
+            self.assertEqual(catalog.done, [('index', 1, 'obj')])
+        finally:
+            transaction.abort()
+
+class DummyRegistry(object):
+    def __init__(self, settings):
+        self.settings = settings
+
+class DummyCatalog(object):
+    family = BTrees.family64
+
+    def __init__(self, objectids=(1, 2, 3)):
+        self.done = []
+        self.objectids = self.family.IF.TreeSet(objectids)
+
+    def index_doc(self, objectid, obj):
+        self.done.append(('index', objectid, obj))
+
+    def reindex_doc(self, objectid, obj, attributes=None, registry=None):
+        self.done.append(('reindex', objectid, obj, attributes, registry))
+
+    def unindex_docs(self, objectids):
+        self.done.append(('unindex', list(objectids)))
+
+class DummyTransaction(object):
+    def __init__(self):
+        self.hooks = []
+
+    def addBeforeCommitHook(self, hook, args=(), kws=None):
+        self.hooks.append(hook)
@@ -186,3 +186,77 @@ class TestGetAllowedToView(unittest.TestCase):
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].__class__, NoWay)
 
+    def test_it_denies(self):
+        from pyramid.security import Allow, Deny, Everyone
+        from ..discriminators import DENIED
+        context = testing.DummyModel(
+            __acl__=[(Deny, 'group:a', 'view'), (Allow, Everyone, 'view')])
+        result = self._callFUT(context, None)
+        self.assertEqual(result, ['system.Everyone', DENIED])
+
+    def test_it_parent_denies(self):
+        from pyramid.security import Allow, Deny, Everyone
+        from ..discriminators import DENIED
+        parent = testing.DummyModel(
+            __acl__=[(Deny, 'group:a', 'view'), (Allow, Everyone, 'view')])
+        context = testing.DummyModel(__parent__=parent)
+        result = self._callFUT(context, None)
+        self.assertEqual(result, ['system.Everyone', DENIED])
+
+    def test_it_denies_other_permission(self):
+        from pyramid.security import Allow, Deny, Everyone
+        context = testing.DummyModel(
+            __acl__=[(Deny, 'group:a', 'edit'), (Allow, Everyone, 'view')])
+        result = self._callFUT(context, None)
+        self.assertEqual(result, ['system.Everyone'])
+
+class TestHasDenyAces(unittest.TestCase):
+    def _callFUT(self, obj, permissions=None):
+        from ..discriminators import has_deny_aces
+        return has_deny_aces(obj, permissions)
+
+    def test_no_acl(self):
+        self.assertFalse(self._callFUT(testing.DummyModel()))
+
+    def test_allows_only(self):
+        from pyramid.security import Allow
+        context = testing.DummyModel(__acl__=[(Allow, 'bob', 'view')])
+        self.assertFalse(self._callFUT(context))
+
+    def test_deny(self):
+        from pyramid.security import Deny
+        context = testing.DummyModel(__acl__=[(Deny, 'bob', 'view')])
+        self.assertTrue(self._callFUT(context))
+        self.assertTrue(self._callFUT(context, ('edit', 'view')))
+        self.assertFalse(self._callFUT(context, ('edit',)))
+
+    def test_deny_permissions_sequence(self):
+        from pyramid.security import Deny
+        context = testing.DummyModel(
+            __acl__=[(Deny, 'bob', ('view', 'edit'))])
+        self.assertTrue(self._callFUT(context, ('edit',)))
+
+    def test_deny_all_permissions(self):
+        from pyramid.security import Deny, ALL_PERMISSIONS
+        context = testing.DummyModel(
+            __acl__=[(Deny, 'group:a', ALL_PERMISSIONS)])
+        self.assertTrue(self._callFUT(context, ('view',)))
+
+    def test_deny_everyone_all_permissions_stops(self):
+        from pyramid.security import Deny, Everyone, ALL_PERMISSIONS
+        parent = testing.DummyModel(__acl__=[(Deny, 'bob', 'view')])
+        context = testing.DummyModel(
+            __parent__=parent, __acl__=[(Deny, Everyone, ALL_PERMISSIONS)])
+        self.assertFalse(self._callFUT(context))
+
+    def test_callable_acl(self):
+        from pyramid.security import Deny
+        context = testing.DummyModel()
+        context.__acl__ = lambda: [(Deny, 'bob', 'view')]
+        self.assertTrue(self._callFUT(context))
+
+    def test_in_parent(self):
+        from pyramid.security import Deny
+        parent = testing.DummyModel(__acl__=[(Deny, 'bob', 'view')])
+        context = testing.DummyModel(__parent__=parent)
+        self.assertTrue(self._callFUT(context))
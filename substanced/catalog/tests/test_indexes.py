@@ -44,11 +44,21 @@ class TestPathIndex(unittest.TestCase):
         result = inst.unindex_doc(1)
         self.assertEqual(result, None)
 
+    def test_unindex_docs(self):
+        inst = self._makeOne()
+        result = inst.unindex_docs(BTrees.family64.IF.Set([1]))
+        self.assertEqual(result, None)
+
     def test_reindex_doc(self):
         inst = self._makeOne()
         result = inst.reindex_doc(1, None)
         self.assertEqual(result, None)
 
+    def test_discriminate(self):
+        inst = self._makeOne()
+        result = inst.discriminate(object(), 'default')
+        self.assertEqual(result, 'default')
+
     def test_docids(self):
         inst = self._makeOne()
         result = inst.docids()
@@ -128,6 +138,19 @@ class TestPathIndex(unittest.TestCase):
         result = inst.apply({'path':obj, 'include_origin':False})
         self.assertEqual(list(result),  [2])
         
+    def test_count(self):
+        inst = self._makeOne()
+        obj = testing.DummyResource()
+        objectmap = self._acquire(inst, '__objectmap__')
+        objectmap._v_nextid = 1
+        objectmap.add(obj, (u'',))
+        obj2 = testing.DummyResource(__name__='a')
+        obj2.__parent__ = obj
+        objectmap.add(obj2, (u'', u'a'))
+        self.assertEqual(inst.count(obj), 2)
+        self.assertEqual(inst.count('[depth=0]/'), 1)
+        self.assertEqual(inst.count({'path':obj, 'include_origin':False}), 1)
+
     def test__parse_path_obj(self):
         inst = self._makeOne()
         obj = testing.DummyResource()
@@ -182,6 +205,530 @@ class TestPathIndex(unittest.TestCase):
         result = inst.apply_intersect(obj, objectmap.family.IF.Set([1]))
         self.assertEqual(list(result),  [1])
 
+    def test_apply_intersect_no_docids(self):
+        inst = self._makeOne()
+        obj = testing.DummyResource()
+        objectmap = self._acquire(inst, '__objectmap__')
+        objectmap._v_nextid = 1
+        objectmap.add(obj, (u'',))
+        result = inst.apply_intersect(obj, None)
+        self.assertEqual(list(result),  [1])
+
+    def test_apply_intersect_uses_pathintersect(self):
+        inst = self._makeOne()
+        obj = testing.DummyResource()
+        objectmap = self._acquire(inst, '__objectmap__')
+        objectmap._v_nextid = 1
+        objectmap.add(obj, (u'',))
+        obj2 = testing.DummyResource(__name__='a')
+        obj2.__parent__ = obj
+        objectmap.add(obj2, (u'', u'a'))
+        def pathlookup(*arg):
+            raise AssertionError('pathlookup should not be called')
+        objectmap.pathlookup = pathlookup
+        result = inst.apply_intersect('[depth=0]/', [1, 2, 3])
+        self.assertEqual(list(result),  [1])
+
+class TestPermissionIndex(unittest.TestCase):
+    def setUp(self):
+        from pyramid.authorization import ACLAuthorizationPolicy
+        from pyramid.interfaces import IAuthorizationPolicy
+        self.config = testing.setUp()
+        self.config.registry.registerUtility(
+            ACLAuthorizationPolicy(), IAuthorizationPolicy)
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _makeOne(self, permissions=('view', 'edit'), family=None):
+        from ..indexes import PermissionIndex
+        return PermissionIndex(permissions, family)
+
+    def _makeContent(self, acl, denies=False):
+        from pyramid.security import Deny
+        if denies:
+            acl = [(Deny, 'group:denied', 'view')] + acl
+        return testing.DummyResource(__acl__=acl)
+
+    def _populate(self, index):
+        from pyramid.security import Allow, Everyone
+        index.index_doc(1, self._makeContent([(Allow, 'bob', 'view')]))
+        index.index_doc(2, self._makeContent(
+            [(Allow, 'group:editors', ('view', 'edit'))]))
+        index.index_doc(3, self._makeContent(
+            [(Allow, Everyone, 'view')], denies=True))
+        index.index_doc(4, self._makeContent([]))
+
+    def test_ctor_alternate_family(self):
+        index = self._makeOne(family=BTrees.family32)
+        self.assertEqual(index.family, BTrees.family32)
+        self.assertEqual(index.permissions, ('view', 'edit'))
+
+    def test_discriminate(self):
+        from pyramid.security import Allow
+        index = self._makeOne()
+        content = self._makeContent([(Allow, 'bob', 'view')], denies=True)
+        self.assertEqual(index.discriminate(content, None),
+                         ({'view':('bob',), 'edit':()}, ('view',)))
+
+    def test_allows(self):
+        from pyramid.security import Everyone
+        index = self._makeOne()
+        self._populate(index)
+        self.assertEqual(list(index.allows(['bob'], 'view')), [1])
+        self.assertEqual(list(index.allows(['bob', Everyone], 'view')),
+                         [1, 3])
+        self.assertEqual(list(index.allows(['group:editors'], 'view')), [2])
+        self.assertEqual(list(index.allows(['group:editors'], 'edit')), [2])
+        self.assertEqual(list(index.allows(['bob', Everyone], 'edit')), [])
+        self.assertEqual(list(index.allows([], 'view')), [])
+
+    def test_allows_unindexed_permission(self):
+        index = self._makeOne()
+        self.assertRaises(ValueError, index.allows, ['bob'], 'delete')
+
+    def test_allows_empty(self):
+        index = self._makeOne()
+        self.assertEqual(list(index.allows(['bob'], 'view')), [])
+
+    def test_apply(self):
+        index = self._makeOne()
+        self._populate(index)
+        self.assertEqual(list(index.apply((['bob'], 'view'))), [1])
+        self.assertEqual(
+            list(index.applyEq({'principals':['group:editors'],
+                                'permission':'edit'})),
+            [2])
+
+    def test_denied(self):
+        from pyramid.security import Allow, Deny
+        index = self._makeOne()
+        self._populate(index)
+        index.index_doc(5, self._makeContent(
+            [(Deny, 'bob', 'edit'), (Allow, 'group:editors', 'edit')]))
+        self.assertEqual(list(index.denied('view')), [3])
+        self.assertEqual(list(index.denied('edit')), [5])
+
+    def test_denied_none(self):
+        index = self._makeOne()
+        self.assertEqual(list(index.denied('view')), [])
+
+    def test_denied_unindexed_permission(self):
+        index = self._makeOne()
+        self.assertRaises(ValueError, index.denied, 'delete')
+
+    def test_denied_in_parent(self):
+        from pyramid.security import Allow, Deny
+        index = self._makeOne()
+        parent = self._makeContent([(Deny, 'bob', 'edit')])
+        content = self._makeContent([(Allow, 'group:editors', 'edit')])
+        content.__parent__ = parent
+        index.index_doc(1, content)
+        self.assertEqual(list(index.denied('edit')), [1])
+        self.assertEqual(list(index.denied('view')), [])
+
+    def test_indexed(self):
+        index = self._makeOne()
+        self._populate(index)
+        self.assertEqual(list(index.indexed()), [1, 2, 3, 4])
+        self.assertEqual(index.indexed_count(), 4)
+        self.assertEqual(index.not_indexed_count(), 0)
+        self.assertEqual(index._num_docs(), 4)
+
+    def test_reindex_doc(self):
+        from pyramid.security import Allow
+        index = self._makeOne()
+        self._populate(index)
+        index.reindex_doc(1, self._makeContent([(Allow, 'alice', 'edit')]))
+        self.assertEqual(list(index.allows(['bob'], 'view')), [])
+        self.assertEqual(list(index.allows(['alice'], 'edit')), [1])
+        self.assertFalse('bob' in index._fwd_index['view'])
+        self.assertEqual(index._num_docs(), 4)
+
+    def test_unindex_doc(self):
+        from pyramid.security import Everyone
+        index = self._makeOne()
+        self._populate(index)
+        index.unindex_doc(3)
+        index.unindex_doc(3)
+        index.unindex_doc(5)
+        self.assertEqual(list(index.allows(['bob', Everyone], 'view')), [1])
+        self.assertEqual(list(index.denied('view')), [])
+        self.assertFalse('view' in index._denied)
+        self.assertEqual(list(index.indexed()), [1, 2, 4])
+        self.assertEqual(index._num_docs(), 3)
+
+    def test_index_doc_not_indexed(self):
+        from ..indexes import NOT_INDEXED
+        index = self._makeOne()
+        self._populate(index)
+        index.reindex_doc_value(1, NOT_INDEXED)
+        self.assertEqual(list(index.not_indexed()), [1])
+        self.assertEqual(list(index.allows(['bob'], 'view')), [])
+        index.unindex_doc(1)
+        self.assertEqual(list(index.not_indexed()), [])
+
+    def test_reset(self):
+        index = self._makeOne()
+        self._populate(index)
+        index.reset()
+        self.assertEqual(list(index.indexed()), [])
+        self.assertEqual(list(index.denied('view')), [])
+
+class Test_remove_docids(unittest.TestCase):
+    def _callFUT(self, docids, removed):
+        from ..indexes import remove_docids
+        return remove_docids(docids, removed)
+
+    def test_few(self):
+        IF = BTrees.family64.IF
+        docids = IF.TreeSet(range(10))
+        result = self._callFUT(docids, IF.Set([3, 4, 20]))
+        self.assertEqual(result, 2)
+        self.assertEqual(list(docids), [0, 1, 2, 5, 6, 7, 8, 9])
+
+    def test_few_does_not_walk_docids(self):
+        IF = BTrees.family64.IF
+        docids = DummyLargeSet(IF.TreeSet(range(10)))
+        result = self._callFUT(docids, IF.Set([3, 20]))
+        self.assertEqual(result, 1)
+        self.assertEqual(list(docids.docids), [0, 1, 2, 4, 5, 6, 7, 8, 9])
+
+    def test_many(self):
+        IF = BTrees.family64.IF
+        docids = IF.TreeSet(range(100))
+        result = self._callFUT(docids, IF.Set(range(20, 200)))
+        self.assertEqual(result, 80)
+        self.assertEqual(list(docids), range(20))
+
+    def test_many_few_in_common(self):
+        IF = BTrees.family64.IF
+        docids = IF.TreeSet(range(1000))
+        result = self._callFUT(docids, IF.Set(range(900, 1100)))
+        self.assertEqual(result, 100)
+        self.assertEqual(list(docids), range(900))
+
+class Test_unindex_docs(unittest.TestCase):
+    def _callFUT(self, index, docids):
+        from ..indexes import unindex_docs
+        return unindex_docs(index, BTrees.family64.IF.Set(docids))
+
+    def _assertSameAsOneByOne(self, factory, values, docids):
+        bulk = factory()
+        single = factory()
+        for docid, value in values.items():
+            bulk.index_doc(docid, value)
+            single.index_doc(docid, value)
+        self._callFUT(bulk, docids)
+        for docid in docids:
+            single.unindex_doc(docid)
+        self.assertEqual(list(bulk._fwd_index.keys()),
+                         list(single._fwd_index.keys()))
+        for key, docids in single._fwd_index.items():
+            self.assertEqual(list(bulk._fwd_index[key]), list(docids))
+        self.assertEqual(_reverse(bulk), _reverse(single))
+        self.assertEqual(list(bulk._not_indexed), list(single._not_indexed))
+        self.assertEqual(bulk.indexed_count(), single.indexed_count())
+        return bulk
+
+    def _values(self, n):
+        values = {}
+        for docid in range(n):
+            if docid % 7 == 0:
+                values[docid] = Dummy() # not indexed
+            else:
+                values[docid] = Dummy(value=docid % 3)
+        return values
+
+    def test_field_index(self):
+        from ..indexes import FieldIndex
+        factory = lambda: FieldIndex('value')
+        values = self._values(100)
+        bulk = self._assertSameAsOneByOne(factory, values, range(0, 100, 2))
+        self.assertEqual(len(bulk._rev_index), 43)
+        self._assertSameAsOneByOne(factory, values, range(50))
+        self._assertSameAsOneByOne(factory, values, range(100) + [200])
+
+    def test_keyword_index(self):
+        from ..indexes import KeywordIndex
+        factory = lambda: KeywordIndex('words')
+        values = {}
+        for docid in range(100):
+            values[docid] = Dummy(words=['all', 'w%s' % (docid % 5)])
+        values[100] = Dummy()
+        self._assertSameAsOneByOne(factory, values, range(0, 100, 3))
+        bulk = self._assertSameAsOneByOne(factory, values, range(101))
+        self.assertEqual(len(bulk._fwd_index), 0)
+
+    def test_facet_index(self):
+        from ..indexes import FacetIndex
+        factory = lambda: FacetIndex('facets', ['a', 'a:b', 'c'])
+        values = {}
+        for docid in range(20):
+            values[docid] = Dummy(facets=docid % 2 and ['a:b'] or ['c'])
+        self._assertSameAsOneByOne(factory, values, range(0, 20, 3))
+
+    def test_one_doc_of_large_value_set(self):
+        from ..indexes import FieldIndex
+        index = FieldIndex('value')
+        for docid in range(1000):
+            index.index_doc(docid, Dummy(value=1))
+        index._fwd_index[1] = DummyLargeSet(index._fwd_index[1])
+        self._callFUT(index, [500])
+        self.assertFalse(500 in index._fwd_index[1].docids)
+        self.assertEqual(len(index._fwd_index[1].docids), 999)
+        self.assertEqual(index.indexed_count(), 999)
+
+    def test_index_with_unindex_docs(self):
+        index = DummyIndex()
+        index.unindex_docs = lambda docids: index.unindexed.append(
+            list(docids))
+        self._callFUT(index, [1, 2])
+        self.assertEqual(index.unindexed, [[1, 2]])
+
+    def test_other_index(self):
+        index = DummyIndex()
+        self._callFUT(index, [1, 2])
+        self.assertEqual(index.unindexed, [1, 2])
+
+    def test_subclass_overriding_unindex_doc(self):
+        from ..indexes import FieldIndex
+        unindexed = []
+        class MyFieldIndex(FieldIndex):
+            def unindex_doc(self, docid):
+                unindexed.append(docid)
+        self._callFUT(MyFieldIndex('value'), [1, 2])
+        self.assertEqual(unindexed, [1, 2])
+
+    def test_subclass(self):
+        from ..indexes import KeywordIndex
+        class MyKeywordIndex(KeywordIndex):
+            pass
+        factory = lambda: MyKeywordIndex('words')
+        values = {}
+        for docid in range(10):
+            values[docid] = Dummy(words=['all', 'w%s' % (docid % 2)])
+        self._assertSameAsOneByOne(factory, values, range(0, 10, 3))
+
+class Test_index_docs(unittest.TestCase):
+    def _callFUT(self, index, docs):
+        from ..indexes import index_docs
+        return index_docs(index, docs)
+
+    def _assertSameAsOneByOne(self, factory, before, after):
+        bulk = factory()
+        single = factory()
+        for docid, obj in sorted(before.items()):
+            bulk.index_doc(docid, obj)
+            single.index_doc(docid, obj)
+        self._callFUT(bulk, sorted(after.items()))
+        for docid, obj in sorted(after.items()):
+            single.index_doc(docid, obj)
+        self.assertEqual(list(bulk._fwd_index.keys()),
+                         list(single._fwd_index.keys()))
+        for key, docids in single._fwd_index.items():
+            self.assertEqual(type(bulk._fwd_index[key]), type(docids))
+            self.assertEqual(list(bulk._fwd_index[key]), list(docids))
+        self.assertEqual(_reverse(bulk), _reverse(single))
+        self.assertEqual(list(bulk._not_indexed), list(single._not_indexed))
+        self.assertEqual(bulk.indexed_count(), single.indexed_count())
+        return bulk
+
+    def test_field_index(self):
+        from ..indexes import FieldIndex
+        factory = lambda: FieldIndex('value')
+        before = {1:Dummy(value=1), 2:Dummy(value=2), 3:Dummy()}
+        after = {2:Dummy(value=3), 3:Dummy(value=1), 5:Dummy()}
+        for docid in range(10, 100):
+            after[docid] = Dummy(value=docid % 3)
+        bulk = self._assertSameAsOneByOne(factory, before, after)
+        self.assertEqual(list(bulk._fwd_index[1])[:3], [1, 3, 10])
+        self._assertSameAsOneByOne(factory, after, before)
+        self._assertSameAsOneByOne(factory, {}, after)
+
+    def test_keyword_index(self):
+        from ..indexes import KeywordIndex
+        factory = lambda: KeywordIndex('words')
+        before = {1:Dummy(words=['a', 'b']), 2:Dummy(words=['b']),
+                  3:Dummy()}
+        after = {1:Dummy(words=['b', 'c']), 2:Dummy(words=[]),
+                 3:Dummy(words=['a']), 4:Dummy(words=[]), 5:Dummy()}
+        for docid in range(10, 100):
+            after[docid] = Dummy(words=['all', 'w%s' % (docid % 5)])
+        bulk = self._assertSameAsOneByOne(factory, before, after)
+        self.assertTrue(isinstance(bulk._fwd_index['all'],
+                                   BTrees.family64.IF.TreeSet))
+        self.assertFalse(isinstance(bulk._fwd_index['w1'],
+                                    BTrees.family64.IF.TreeSet))
+        self._assertSameAsOneByOne(factory, after, before)
+        self._assertSameAsOneByOne(factory, {}, after)
+
+    def test_keyword_index_string(self):
+        from ..indexes import KeywordIndex
+        index = KeywordIndex('words')
+        self.assertRaises(TypeError, self._callFUT, index,
+                          [(1, Dummy(words='abc'))])
+
+    def test_index_with_index_docs(self):
+        index = DummyIndex()
+        index.index_docs = lambda docs: index.indexed.append(list(docs))
+        self._callFUT(index, [(1, 'one'), (2, 'two')])
+        self.assertEqual(index.indexed, [[(1, 'one'), (2, 'two')]])
+
+    def test_other_index(self):
+        index = DummyIndex()
+        self._callFUT(index, [(1, 'one'), (2, 'two')])
+        self.assertEqual(index.indexed, [(1, 'one'), (2, 'two')])
+
+    def test_subclass(self):
+        from ..indexes import FieldIndex
+        indexed = []
+        class MyFieldIndex(FieldIndex):
+            def index_doc(self, docid, obj):
+                indexed.append(docid)
+        self._callFUT(MyFieldIndex('value'), [(1, Dummy(value=1))])
+        self.assertEqual(indexed, [1])
+
+    def test_path_index(self):
+        from ..indexes import PathIndex
+        self._callFUT(PathIndex(), [(1, Dummy())])
+
+class Test_reindex_doc_value(unittest.TestCase):
+    def _callFUT(self, index, docid, value):
+        from ..indexes import reindex_doc_value
+        return reindex_doc_value(index, docid, value)
+
+    def _assertSameAsIndexDoc(self, factory, before, after):
+        # reindexing ``after`` with the values of ``before`` computed
+        # elsewhere is the same as reindexing the objects
+        from ..indexes import NOT_INDEXED
+        by_value = factory()
+        by_object = factory()
+        for docid, obj in before.items():
+            by_value.index_doc(docid, obj)
+            by_object.index_doc(docid, obj)
+        for docid, obj in after.items():
+            self._callFUT(by_value, docid,
+                          by_value.discriminate(obj, NOT_INDEXED))
+            by_object.reindex_doc(docid, obj)
+        self.assertEqual(list(by_value._fwd_index.keys()),
+                         list(by_object._fwd_index.keys()))
+        for key, docids in by_object._fwd_index.items():
+            self.assertEqual(list(by_value._fwd_index[key]), list(docids))
+        self.assertEqual(_reverse(by_value), _reverse(by_object))
+        self.assertEqual(list(by_value._not_indexed),
+                         list(by_object._not_indexed))
+        self.assertEqual(by_value.indexed_count(), by_object.indexed_count())
+
+    def test_field_index(self):
+        from ..indexes import FieldIndex
+        before = {1:Dummy(value=1), 2:Dummy(value=2), 3:Dummy()}
+        after = {1:Dummy(value=1), 2:Dummy(value=3), 3:Dummy(value=1),
+                 4:Dummy(value=2), 5:Dummy()}
+        self._assertSameAsIndexDoc(
+            lambda: FieldIndex('value'), before, after)
+        self._assertSameAsIndexDoc(
+            lambda: FieldIndex('value'), after, before)
+
+    def test_keyword_index(self):
+        from ..indexes import KeywordIndex
+        before = {1:Dummy(words=['a', 'b']), 2:Dummy(words=['b']),
+                  3:Dummy()}
+        after = {1:Dummy(words=['b', 'c']), 2:Dummy(words=[]),
+                 3:Dummy(words=['a']), 4:Dummy(words=['a']), 5:Dummy()}
+        self._assertSameAsIndexDoc(
+            lambda: KeywordIndex('words'), before, after)
+        self._assertSameAsIndexDoc(
+            lambda: KeywordIndex('words'), after, before)
+
+    def test_keyword_index_string(self):
+        from ..indexes import KeywordIndex
+        self.assertRaises(
+            TypeError, self._callFUT, KeywordIndex('words'), 1, 'abc')
+
+    def test_index_with_reindex_doc_value(self):
+        index = DummyIndex()
+        index.reindex_doc_value = lambda docid, value: index.unindexed.append(
+            (docid, value))
+        self._callFUT(index, 1, 'value')
+        self.assertEqual(index.unindexed, [(1, 'value')])
+
+    def test_other_index(self):
+        from ..indexes import FacetIndex
+        index = FacetIndex('facets', ['a'])
+        self.assertRaises(ValueError, self._callFUT, index, 1, ['a'])
+
+    def test_subclass(self):
+        from ..indexes import FieldIndex
+        class MyFieldIndex(FieldIndex):
+            pass
+        self.assertRaises(
+            ValueError, self._callFUT, MyFieldIndex('value'), 1, 'a')
+
+class Test_can_reindex_value(unittest.TestCase):
+    def _callFUT(self, index):
+        from ..indexes import can_reindex_value
+        return can_reindex_value(index)
+
+    def test_it(self):
+        from ..indexes import (
+            FacetIndex,
+            FieldIndex,
+            KeywordIndex,
+            PermissionIndex,
+            TextIndex,
+            )
+        self.assertTrue(self._callFUT(FieldIndex('value')))
+        self.assertTrue(self._callFUT(KeywordIndex('words')))
+        self.assertTrue(self._callFUT(PermissionIndex(('view',))))
+        self.assertFalse(self._callFUT(FacetIndex('facets', ['a'])))
+        self.assertFalse(self._callFUT(TextIndex('text')))
+        self.assertFalse(self._callFUT(DummyIndex()))
+
+def _reverse(index):
+    # the reverse index of a field or keyword index as a list
+    result = []
+    for docid, value in index._rev_index.items():
+        if hasattr(value, 'keys'): # keywords
+            value = list(value.keys())
+        result.append((docid, value))
+    return result
+
+class Dummy(object):
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+class DummyLargeSet(object):
+    # a set of docids too large to be walked
+    def __init__(self, docids):
+        self.docids = docids
+
+    def __contains__(self, docid):
+        return docid in self.docids
+
+    def remove(self, docid):
+        self.docids.remove(docid)
+
+    def __nonzero__(self):
+        return True
+
+    def __len__(self):
+        raise AssertionError('the whole set is walked')
+
+    def __iter__(self):
+        raise AssertionError('the whole set is walked')
+
+class DummyIndex(object):
+    def __init__(self):
+        self.indexed = []
+        self.unindexed = []
+
+    def index_doc(self, docid, obj):
+        self.indexed.append((docid, obj))
+
+    def unindex_doc(self, docid):
+        self.unindexed.append(docid)
+
 class DummyCatalog(object):
     family = BTrees.family64
     def __init__(self, objectids=None):
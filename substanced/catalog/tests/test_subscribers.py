@@ -98,6 +98,100 @@ class Test_object_added(unittest.TestCase):
         self.assertEqual(catalog1.indexed, [(2, model2), (1, model1)])
         self.assertEqual(catalog2.indexed, [(2, model2), (1, model1)])
 
+class Test_deferred_indexing(unittest.TestCase):
+    def setUp(self):
+        import transaction
+        transaction.abort()
+        transaction.begin()
+
+    def tearDown(self):
+        import transaction
+        transaction.abort()
+
+    def _makeEvent(self, model, site=None):
+        content = DummyContent(metadata={'factory1':{'catalog':True}})
+        event = DummyEvent(model, site)
+        event.registry = DummyRegistry(
+            content=content,
+            settings={'substanced.catalog_deferred_indexing':'true'})
+        return event
+
+    def _makeModel(self, catalog):
+        site = _makeSite(objectmap=DummyObjectMap(), catalog=catalog)
+        model = testing.DummyResource()
+        model.__objectid__ = 1
+        model.__factory_type__ = 'factory1'
+        site['model'] = model
+        return model
+
+    def test_many_modifications_reindex_once(self):
+        import transaction
+        from ..subscribers import object_modified
+        catalog = DummyCatalog()
+        model = self._makeModel(catalog)
+        for i in range(5):
+            event = self._makeEvent(model)
+            event.attributes = ['attr%s' % i]
+            object_modified(event)
+        self.assertEqual(catalog.reindexed, [])
+        transaction.commit()
+        self.assertEqual(catalog.reindexed, [(1, model)])
+        self.assertEqual(sorted(catalog.attributes),
+                         ['attr0', 'attr1', 'attr2', 'attr3', 'attr4'])
+
+    def test_add_then_modify_indexes_once(self):
+        import transaction
+        from ..subscribers import (
+            object_added,
+            object_modified,
+            )
+        catalog = DummyCatalog()
+        model = self._makeModel(catalog)
+        object_added(self._makeEvent(model))
+        object_modified(self._makeEvent(model))
+        transaction.commit()
+        self.assertEqual(catalog.indexed, [(1, model)])
+        self.assertEqual(catalog.reindexed, [])
+
+    def test_modify_then_remove_unindexes(self):
+        import transaction
+        from ..subscribers import (
+            object_modified,
+            object_will_be_removed,
+            )
+        catalog = DummyCatalog()
+        catalog.objectids = catalog.family.IF.Set([1])
+        model = self._makeModel(catalog)
+        object_modified(self._makeEvent(model))
+        object_will_be_removed(self._makeEvent(model))
+        transaction.commit()
+        self.assertEqual(catalog.reindexed, [])
+        self.assertEqual(catalog.unindexed, [1])
+
+    def test_add_then_remove_in_one_transaction(self):
+        import transaction
+        from ..subscribers import (
+            object_added,
+            object_will_be_removed,
+            )
+        catalog = DummyCatalog()
+        model = self._makeModel(catalog)
+        object_added(self._makeEvent(model))
+        object_will_be_removed(self._makeEvent(model))
+        transaction.commit()
+        self.assertEqual(catalog.indexed, [])
+        self.assertEqual(catalog.unindexed, [])
+
+    def test_abort_discards_queue(self):
+        import transaction
+        from ..subscribers import object_modified
+        catalog = DummyCatalog()
+        model = self._makeModel(catalog)
+        object_modified(self._makeEvent(model))
+        transaction.abort()
+        transaction.commit()
+        self.assertEqual(catalog.reindexed, [])
+
 class Test_object_will_be_removed(unittest.TestCase):
     def _callFUT(self, event):
         from ..subscribers import object_will_be_removed
@@ -216,6 +310,22 @@ class Test_object_modified(unittest.TestCase):
         self.assertEqual(catalog1.reindexed, [(1, model)])
         self.assertEqual(catalog2.reindexed, [(1, model)])
 
+    def test_with_attributes(self):
+        objectmap = DummyObjectMap()
+        catalog = DummyCatalog()
+        site = _makeSite(objectmap=objectmap, catalog=catalog)
+        model = testing.DummyResource()
+        model.__objectid__ = 1
+        site['model'] = model
+        event = DummyEvent(model, site)
+        event.attributes = ['title']
+        registry = DummyRegistry(content=DummyContent(metadata={}))
+        event.registry = registry
+        self._callFUT(event)
+        self.assertEqual(catalog.reindexed, [(1, model)])
+        self.assertEqual(catalog.attributes, ['title'])
+        self.assertEqual(catalog.registry, registry)
+
 class DummyCatalog(dict):
     
     family = BTrees.family64
@@ -230,11 +340,19 @@ class DummyCatalog(dict):
     def index_doc(self, objectid, obj):
         self.indexed.append((objectid, obj))
 
+    def index_docs(self, docs):
+        self.indexed.extend(docs)
+
     def unindex_doc(self, objectid):
         self.unindexed.append(objectid)
 
-    def reindex_doc(self, objectid, obj):
+    def unindex_docs(self, objectids):
+        self.unindexed.extend(objectids)
+
+    def reindex_doc(self, objectid, obj, attributes=None, registry=None):
         self.reindexed.append((objectid, obj))
+        self.attributes = attributes
+        self.registry = registry
 
 class DummyObjectMap:
     family = BTrees.family64
@@ -243,6 +361,8 @@ class DummyObjectMap:
         return self.family.IF.Set([1,2])
 
 class DummyEvent(object):
+    registry = None
+
     def __init__(self, object, parent):
         self.object = object
         self.parent = parent
@@ -255,7 +375,8 @@ class DummyContent(object):
         return self._metadata.get(resource.__factory_type__, default)
 
 class DummyRegistry(object):
-    def __init__(self, content):
+    def __init__(self, content, settings=None):
         self.content = content
+        self.settings = settings or {}
         
         
@@ -28,6 +28,29 @@ class TestManageCatalog(unittest.TestCase):
         inst = self._makeOne(context, request)
         result = inst.view()
         self.assertEqual(result['cataloglen'], 0)
+        self.assertEqual(result['objectcount'], None)
+
+    def test_view_with_objectmap(self):
+        site = testing.DummyResource()
+        site.__objectmap__ = DummyObjectMap(3)
+        services = testing.DummyResource(__parent__=site)
+        context = DummyCatalog()
+        context.__parent__ = services
+        request = testing.DummyRequest()
+        inst = self._makeOne(context, request)
+        result = inst.view()
+        self.assertEqual(result['objectcount'], 3)
+        self.assertEqual(site.__objectmap__.counted, site)
+
+    def test_view_with_objectmap_not_in_services(self):
+        site = testing.DummyResource()
+        site.__objectmap__ = DummyObjectMap(3)
+        context = DummyCatalog()
+        context.__parent__ = site
+        request = testing.DummyRequest()
+        inst = self._makeOne(context, request)
+        result = inst.view()
+        self.assertEqual(result['objectcount'], None)
 
     def test_reindex(self):
         context = DummyCatalog()
@@ -201,6 +224,14 @@ class DummyCatalog(object):
         self.indexes = indexes
         self.reindexed = True
 
+class DummyObjectMap(object):
+    def __init__(self, count):
+        self.count = count
+
+    def count_under(self, obj):
+        self.counted = obj
+        return self.count
+
 class DummyIndex(object):
     def __init__(self, parent=None):
         if parent is None:
@@ -11,6 +11,7 @@ from pyramid.view import view_defaults
 from ..interfaces import ICatalog
 
 from ..content import find_service
+from ..objectmap import find_objectmap
 from ..sdi import mgmt_view
 from ..form import FormView
 from ..schema import Schema
@@ -46,7 +47,16 @@ class ManageCatalog(object):
     @mgmt_view(request_method='GET', tab_title='Manage')
     def view(self):
         cataloglen = len(self.context.objectids)
-        return dict(cataloglen=cataloglen)
+        # the number of objects in the site the catalog could contain,
+        # counted by the objectmap without visiting them; the catalog is in
+        # the ``__services__`` folder of its site
+        objectcount = None
+        objectmap = find_objectmap(self.context)
+        services = getattr(self.context, '__parent__', None)
+        site = getattr(services, '__parent__', None)
+        if objectmap is not None and site is not None:
+            objectcount = objectmap.count_under(site)
+        return dict(cataloglen=cataloglen, objectcount=objectcount)
 
     @mgmt_view(request_method='POST', request_param='reindex', check_csrf=True)
     def reindex(self):
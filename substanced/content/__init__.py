@@ -250,6 +250,14 @@ def add_content_type(config, content_type, factory, factory_type=None, **meta):
     - If ``meta`` contains the keyword ``catalog`` and its value is true, the
       object will be tracked in the Substance D catalog.
 
+    - If ``meta`` contains the keyword ``index_dependencies``, its value
+      should be a dictionary mapping the name of a catalog index to a
+      sequence of the names of the attributes the index's value depends on.
+      When an object of the type is modified and the
+      :class:`substanced.event.ObjectModified` event names the attributes
+      which changed, the indexes which don't depend on any of them aren't
+      reindexed.  Indexes which aren't named are always reindexed.
+
     Other keywords in ``meta`` will just be stored, and have no special
     meaning.
 
@@ -25,22 +25,29 @@ class _ObjectEvent(object):
 @implementer(IObjectAdded)
 class ObjectAdded(_ObjectEvent):
     """ An event sent just after an object has been added to a folder.  """
+    def __init__(self, object, parent, name, moving=False):
+        self.object = object
+        self.parent = parent
+        self.name = name
+        self.moving = moving
 
 @implementer(IObjectWillBeAdded)
 class ObjectWillBeAdded(_ObjectEvent):
     """ An event sent just before an object has been added to a folder.  """
-    def __init__(self, object, parent, name, duplicating=False):
+    def __init__(self, object, parent, name, duplicating=False, moving=False):
         self.object = object
         self.parent = parent
         self.name = name
         self.duplicating = duplicating
+        self.moving = moving
 
 class _ObjectRemovalEvent(object):
-    def __init__(self, object, parent, name, moving=False):
+    def __init__(self, object, parent, name, moving=False, moving_to=None):
         self.object = object
         self.parent = parent
         self.name = name
         self.moving = moving
+        self.moving_to = moving_to
 
 @implementer(IObjectRemoved)
 class ObjectRemoved(_ObjectRemovalEvent):
@@ -52,9 +59,12 @@ class ObjectWillBeRemoved(_ObjectRemovalEvent):
 
 @implementer(IObjectModified)
 class ObjectModified(object): # pragma: no cover
-    """ An event sent when an object has been modified."""
-    def __init__(self, object):
+    """ An event sent when an object has been modified.  ``attributes`` is
+    a sequence of the names of the attributes which were changed, or
+    ``None`` if they aren't known."""
+    def __init__(self, object, attributes=None):
         self.object = object
+        self.attributes = attributes
 
 @implementer(IContentCreated)
 class ContentCreated(object):
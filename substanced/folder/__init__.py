@@ -249,20 +249,22 @@ class Folder(Persistent):
         return name
 
     def add(self, name, other, send_events=True, reserved_names=RESERVED_NAMES,
-            duplicating=False, registry=None):
+            duplicating=False, moving=False, registry=None):
         """ Same as ``__setitem__``.
 
         If ``send_events`` is False, suppress the sending of folder events.
         Don't allow names in the ``reserved_names`` sequence to be
         added. If ``duplicating`` is True, oids will be replaced in
-        objectmap.
+        objectmap.  If ``moving`` is True, the events sent will indicate
+        that the object is being moved here from the folder it was removed
+        from using ``remove`` with ``moving=True``.
         """
         if registry is None:
             registry = get_current_registry()
         name = self.check_name(name, reserved_names)
 
         if send_events:
-            event = ObjectWillBeAdded(other, self, name, duplicating)
+            event = ObjectWillBeAdded(other, self, name, duplicating, moving)
             self._notify(event, registry)
 
         other.__parent__ = self
@@ -275,7 +277,7 @@ class Folder(Persistent):
             self._order += (name,)
 
         if send_events:
-            event = ObjectAdded(other, self, name)
+            event = ObjectAdded(other, self, name, moving)
             self._notify(event, registry)
 
     def pop(self, name, default=marker):
@@ -331,18 +333,20 @@ class Folder(Persistent):
         """
         return self.remove(name)
 
-    def remove(self, name, send_events=True, moving=False):
+    def remove(self, name, send_events=True, moving=False, moving_to=None):
         """ Same thing as ``__delitem__``.
 
         If ``send_events`` is false, suppress the sending of folder events.
         If ``moving`` is True, the events sent will indicate that a move is
-        in process.
+        in process.  ``moving_to`` is passed by ``move``: a ``(folder,
+        name)`` tuple telling where the object will be added (using ``add``
+        with ``moving=True``) right after it is removed.
         """
         name = unicode(name)
         other = self.data[name]
 
         if send_events:
-            event = ObjectWillBeRemoved(other, self, name, moving)
+            event = ObjectWillBeRemoved(other, self, name, moving, moving_to)
             self._notify(event)
 
         if hasattr(other, '__parent__'):
@@ -358,7 +362,7 @@ class Folder(Persistent):
             self._order = tuple([x for x in self._order if x != name])
 
         if send_events:
-            event = ObjectRemoved(other, self, name, moving)
+            event = ObjectRemoved(other, self, name, moving, moving_to)
             self._notify(event)
 
         return other
@@ -389,23 +393,23 @@ class Folder(Persistent):
         the target object name; otherwise the existing subobject name is
         used.
 
-        This operation is done in terms of a remove and an add.  The Removed
-        and WillBeRemoved events sent will indicate that the object is
-        moving.
+        This operation is done in terms of a remove and an add.  The Removed,
+        WillBeRemoved, WillBeAdded and Added events sent will indicate that
+        the object is moving.
         """
         if newname is None:
             newname = name
-        ob = self.remove(name, moving=True)
-        other.add(newname, ob)
+        ob = self.remove(name, moving=True, moving_to=(other, newname))
+        other.add(newname, ob, moving=True)
         return ob
 
     def rename(self, oldname, newname):
         """
         Rename a subobject from oldname to newname.
 
-        This operation is done in terms of a remove and an add.  The Removed
-        and WillBeRemoved events sent will indicate that the object is
-        moving.
+        This operation is done in terms of a remove and an add.  The Removed,
+        WillBeRemoved, WillBeAdded and Added events sent will indicate that
+        the object is moving.
         """
         return self.move(oldname, self, newname)
 
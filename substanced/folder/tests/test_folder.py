@@ -334,6 +334,84 @@ class TestFolder(unittest.TestCase):
         self.assertEqual(other['a'].__parent__, other)
         self.assertFalse('a' in folder)
 
+    def test_move_sends_moving_events(self):
+        from ...interfaces import IObjectEvent
+        events = []
+        def listener(event, obj, container):
+            events.append(event)
+        folder = self._makeOne()
+        other = self._makeOne()
+        model = DummyModel()
+        folder['a'] = model
+        self._registerEventListener(listener, IObjectEvent)
+        folder.move('a', other)
+        self.assertEqual(len(events), 4)
+        for event in events:
+            self.assertTrue(event.moving)
+
+    def test_move_sends_moving_to(self):
+        from ...interfaces import IObjectEvent
+        from ...interfaces import IObjectRemoved
+        events = []
+        def listener(event, obj, container):
+            events.append(event)
+        folder = self._makeOne()
+        other = self._makeOne()
+        folder['a'] = DummyModel()
+        self._registerEventListener(listener, IObjectEvent)
+        folder.move('a', other, 'b')
+        removed = [e for e in events if IObjectRemoved.providedBy(e)]
+        self.assertEqual(removed[0].moving_to, (other, 'b'))
+
+    def _registerObjectMapSubscribers(self):
+        from ...interfaces import (
+            IObjectRemoved,
+            IObjectWillBeAdded,
+            )
+        from ...objectmap import (
+            object_removed,
+            object_will_be_added,
+            )
+        self._registerEventListener(
+            lambda event, *arg: object_will_be_added(event),
+            IObjectWillBeAdded)
+        self._registerEventListener(
+            lambda event, *arg: object_removed(event), IObjectRemoved)
+
+    def _makeMapped(self):
+        from ...objectmap import ObjectMap
+        root = self._makeOne()
+        objectmap = root.__objectmap__ = ObjectMap(root)
+        objectmap.add(root, (u'',))
+        self._registerObjectMapSubscribers()
+        root['folder'] = self._makeOne()
+        root['other'] = self._makeOne()
+        root['folder']['a'] = DummyModel()
+        return root, objectmap
+
+    def test_move_with_objectmap(self):
+        root, objectmap = self._makeMapped()
+        oid = root['folder']['a'].__objectid__
+        root['folder'].move('a', root['other'], 'b')
+        self.assertEqual(root['other']['b'].__objectid__, oid)
+        self.assertEqual(objectmap.path_for(oid), (u'', u'other', u'b'))
+        self.assertEqual(objectmap.objectid_for((u'', u'folder', u'a')), None)
+
+    def test_remove_moving_then_add_with_objectmap(self):
+        root, objectmap = self._makeMapped()
+        oid = root['folder']['a'].__objectid__
+        ob = root['folder'].remove('a', moving=True)
+        self.assertEqual(objectmap.path_for(oid), None)
+        root['other'].add('b', ob)
+        self.assertEqual(objectmap.path_for(oid), (u'', u'other', u'b'))
+
+    def test_remove_moving_not_added_with_objectmap(self):
+        root, objectmap = self._makeMapped()
+        oid = root['folder']['a'].__objectid__
+        root['folder'].remove('a', moving=True)
+        self.assertEqual(objectmap.path_for(oid), None)
+        self.assertEqual(objectmap.objectid_for((u'', u'folder', u'a')), None)
+
     def test_move_newname(self):
         folder = self._makeOne()
         other = self._makeOne()
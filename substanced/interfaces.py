@@ -45,12 +45,23 @@ class IObjectMap(Interface):
         """ Return the object associated with ``objectid`` or ``None`` if the
         object cannot be found."""
 
+    def objects_for(objectids):
+        """ Return a generator which yields the object associated with each
+        object id in ``objectids`` (or ``None`` if the object cannot be
+        found), in order."""
+
     def add(obj):
         """ Add a new object to the object map.  Assigns a new objectid to
         obj.__objectid__ to the object if it doesn't already have one.  The
         object's path or objectid must not already exist in the map.  Returns
         the object id."""
 
+    def add_many(nodes, replace_oid=False):
+        """ Add many objects to the object map at once.  ``nodes`` is a
+        sequence of ``(obj, path_tuple)`` pairs.  Equivalent to calling
+        ``add`` for each pair, but cheaper for large subtrees.  Returns a list
+        of the object ids."""
+
     def remove(obj_objectid_or_path_tuple):
         """ Removes an object from the object map using the object itself, an
         object id, or a path tuple.  Returns a set of objectids (children,
@@ -65,6 +76,16 @@ class IObjectMap(Interface):
         passed as ``obj_or_path_tuple`` in the returned set, otherwise it
         omits it."""
 
+    def pathintersect(objectids, obj_or_path_tuple, depth=None,
+                      include_origin=True):
+        """ Returns the set of document ids in ``objectids`` which
+        ``pathlookup`` would return for the other arguments, without
+        building the set of every document id under the path."""
+
+    def count_under(obj_or_path_tuple, depth=None, include_origin=True):
+        """ Returns the number of document ids ``pathlookup`` would return
+        for the same arguments without computing them."""
+
     def connect(src, target, reftype):
         """Connect ``src_object`` to ``target_object`` using the reference
         type ``reftype``.  ``src`` and ``target`` may be objects or object
@@ -75,6 +96,24 @@ class IObjectMap(Interface):
         reference type ``reftype``. ``src`` and ``target`` may be objects or
         object identifiers"""
 
+    def connect_many(src, targets, reftype, ignore_missing=False):
+        """Connect ``src`` to each of ``targets`` using the reference type
+        ``reftype``, checking that every object is in the object map before
+        connecting any of them.  ``src`` and ``targets`` may be objects or
+        object identifiers."""
+
+    def connect_many_sources(srcs, target, reftype, ignore_missing=False):
+        """Like ``connect_many``, but connect each of ``srcs`` to
+        ``target``."""
+
+    def disconnect_many(src, targets, reftype, ignore_missing=False):
+        """Disconnect ``src`` from each of ``targets`` using the reference
+        type ``reftype``."""
+
+    def disconnect_many_sources(srcs, target, reftype, ignore_missing=False):
+        """Like ``disconnect_many``, but disconnect each of ``srcs`` from
+        ``target``."""
+
     def sources(obj, reftype):
         """ Return a generator consisting of objects which have ``obj`` as a
         relationship source using ``reftype``.  ``obj`` can be an object or
@@ -93,6 +132,16 @@ class IObjectMap(Interface):
         """ Return a set of objectids which have ``obj`` as a relationship
         source using ``reftype``.  ``obj`` can be an object or an object id."""
 
+    def count_targets(obj, reftype):
+        """ Return the number of objectids which have ``obj`` as a
+        relationship target using ``reftype``.  ``obj`` can be an object or
+        an object id."""
+
+    def count_sources(obj, reftype):
+        """ Return the number of objectids which have ``obj`` as a
+        relationship source using ``reftype``.  ``obj`` can be an object or
+        an object id."""
+
 class ISearch(Interface):
     """ Adapter for searching the catalog """
 
@@ -103,12 +152,16 @@ class IObjectWillBeAdded(IObjectEvent):
     name = Attribute('The name which the object is being added to the folder '
                      'with')
     duplicating = Attribute('Boolean indicating object is a duplicate')
+    moving = Attribute('Boolean indicating that this addition is part of an '
+                       'object move')
 
 class IObjectAdded(IObjectEvent):
     """ An event type sent when an object is added """
     object = Attribute('The object being added')
     parent = Attribute('The folder to which the object is being added')
     name = Attribute('The name of the object within the folder')
+    moving = Attribute('Boolean indicating that this addition is part of an '
+                       'object move')
 
 class IObjectWillBeRemoved(IObjectEvent):
     """ An event type sent before an object is removed """
@@ -117,6 +170,10 @@ class IObjectWillBeRemoved(IObjectEvent):
     name = Attribute('The name of the object within the folder')
     moving = Attribute('Boolean indicating that this removal is part of an '
                        'object move')
+    moving_to = Attribute('If the object is being moved by the ``move`` or '
+                          '``rename`` method of a folder, a ``(folder, '
+                          'name)`` tuple telling where it will be added '
+                          'right after it is removed, otherwise ``None``')
 
 class IObjectRemoved(IObjectEvent):
     """ An event type sent when an object is removed """
@@ -125,10 +182,16 @@ class IObjectRemoved(IObjectEvent):
     name = Attribute('The name of the object within the folder')
     moving = Attribute('Boolean indicating that this removal is part of an '
                        'object move')
+    moving_to = Attribute('If the object is being moved by the ``move`` or '
+                          '``rename`` method of a folder, a ``(folder, '
+                          'name)`` tuple telling where it will be added '
+                          'right after it is removed, otherwise ``None``')
 
 class IObjectModified(IObjectEvent):
     """ May be sent when an object is modified """
     object = Attribute('The object being modified')
+    attributes = Attribute('A sequence of the names of the attributes which '
+                           'were changed, or ``None`` if they are not known')
 
 class IContentCreated(Interface):
     """ An event type sent when a Substance D content object is created 
@@ -279,12 +342,14 @@ class IFolder(Interface):
         and ``__parent__`` value,
         """
 
-    def remove(name, send_events=True, moving=False):
+    def remove(name, send_events=True, moving=False, moving_to=None):
         """ Same thing as ``__delitem__``.
 
         If ``send_events`` is false, suppress the sending of folder events.
         If ``moving`` is True, the events sent will indicate that a move is
-        in process.
+        in process.  ``moving_to`` is passed by ``move``: a ``(folder,
+        name)`` tuple telling where the object will be added (using ``add``
+        with ``moving=True``) right after it is removed.
         """
 
     def move(name, other, newname=None):
@@ -294,18 +359,18 @@ class IFolder(Interface):
         the target object name; otherwise the existing subobject name is
         used.
 
-        This operation is done in terms of a remove and an add.  The Removed
-        and WillBeRemoved events sent will indicate that the object is
-        moving.
+        This operation is done in terms of a remove and an add.  The Removed,
+        WillBeRemoved, WillBeAdded and Added events sent will indicate that
+        the object is moving.
         """
 
     def rename(oldname, newname):
         """
         Rename a subobject from oldname to newname.
 
-        This operation is done in terms of a remove and an add.  The Removed
-        and WillBeRemoved events sent will indicate that the object is
-        moving.
+        This operation is done in terms of a remove and an add.  The Removed,
+        WillBeRemoved, WillBeAdded and Added events sent will indicate that
+        the object is moving.
         """
     def replace(name, newobject):
         """ Replace an existing object named ``name`` in this folder with a
@@ -322,9 +387,12 @@ class ICatalog(_ICatalog):
     """ A collection of indices """
     objectids = Attribute(
         'a sequence of objectids that are cataloged in this catalog')
+    reindex_checkpoint = Attribute(
+        'the progress of an interrupted reindex, or ``None``')
 
     def reindex(dry_run=False, commit_interval=200, indexes=None, 
-                path_re=None, output=None):
+                path_re=None, output=None, mapper=None, resume=False,
+                max_memory=None):
         """\
         Reindex all objects in this collection of indexes.
 
@@ -350,6 +418,17 @@ class ICatalog(_ICatalog):
         the reindex.  If ``False`` is passed, no output is done.  If ``None``
         is passed (the default), the output will wind up in the
         ``substanced.catalog`` Python logger output at ``info`` level.
+
+        ``mapper``, if not ``None``, is called with a list of shards of
+        objectids, ``indexes`` and ``path_re``, and must return the index
+        values computed for each of them, which are then applied one shard
+        at a time.
+
+        If ``resume`` is ``True``, continue an interrupted reindex from
+        ``reindex_checkpoint``.
+
+        ``max_memory``, if not ``None``, is the number of megabytes the
+        process may use before the database cache is shrunk.
         """
         
 class IPrincipal(Interface):
@@ -1,11 +1,17 @@
+import os
 import random
+import threading
+import weakref
 
 from persistent import Persistent
 
 import BTrees
+from BTrees.Length import Length
 
 from zope.interface import implementer
 
+from repoze.lru import LRUCache
+
 from pyramid.compat import is_nonstr_iter
 from pyramid.location import lineage
 from pyramid.traversal import (
@@ -86,43 +92,393 @@ references to the objectid represented by '/a' *and* any children
 
 _marker = object()
 
+class RandomObjectidAllocator(object):
+    """ An objectid allocator which starts at a random point in the full
+    range of the object map's BTree family and probes upward from there
+    until it finds an unused objectid.  This is the allocator used by an
+    object map which has no ``objectid_allocator``.
+
+    Randomly chosen objectids are unlikely to collide between concurrent
+    writers, but they are scattered across every bucket of the object map's
+    (and the catalog's) BTrees."""
+
+    def new_objectid(self, objectmap):
+        while True:
+            if objectmap._v_nextid is None:
+                family = objectmap.family
+                objectmap._v_nextid = objectmap._randrange(family.minint,
+                                                           family.maxint)
+
+            objectid = objectmap._v_nextid
+
+            if objectid > objectmap.family.maxint:
+                objectmap._v_nextid = None
+                continue
+
+            objectmap._v_nextid += 1
+
+            # object id zero is reserved as "irresolveable"
+            if objectid != 0 and not objectid in objectmap.objectid_to_path:
+                return objectid
+
+            objectmap._v_nextid = None
+
+class BlockObjectidAllocator(Persistent):
+    """ A persistent objectid allocator which hands out objectids from
+    blocks of ``block_size`` contiguous objectids.  Blocks are reserved by
+    bumping a persistent counter; the objectids in a block are then handed
+    out one after the other by the process which reserved it (to any of its
+    threads) without writing to the allocator again.  Objects created close
+    together in time get objectids which sort close together, so their
+    entries land in the same buckets of the object map's and the catalog's
+    BTrees and concurrent writers contend for (and conflict on) far fewer of
+    them.
+
+    Reserving a block is the only write, so concurrent writers conflict on
+    the allocator at most once per ``block_size`` objectids.  A block is
+    only used by the transaction which reserved it until that transaction
+    commits; it is then shared with the other threads of the process.  If
+    the transaction is aborted (or its commit fails), the rest of the block
+    is dropped, as another process may reserve the same block.  Blocks are
+    kept per database and per process id, so a forked worker never uses a
+    block reserved by its parent.  Objectids which are already in use (e.g.
+    ones handed out by a random allocator before this one was installed)
+    are skipped."""
+
+    # {database:{(process id, oid of allocator):[next objectid, end of
+    # block]}}, the committed blocks shared by all the threads of a process
+    _blocks = weakref.WeakKeyDictionary()
+    _lock = threading.Lock()
+    _v_block = None # used until the allocator is stored in a database
+    _v_pending = None # (transaction, block) reserved but not committed yet
+
+    def __init__(self, block_size=1000, start=1):
+        self.block_size = block_size
+        self.next_block = start
+
+    def reserve(self):
+        """ Reserve a new block of objectids.  Return a ``(start, end)``
+        tuple representing the half-open range of the block."""
+        start = self.next_block
+        end = start + self.block_size
+        self.next_block = end
+        return start, end
+
+    def _reserve(self, objectmap):
+        block = list(self.reserve())
+        if block[0] > objectmap.family.maxint:
+            raise ValueError('objectids exhausted')
+        return block
+
+    def _shared_blocks(self, jar):
+        # Each connection has its own copy of the allocator, so the blocks
+        # it reserves are kept outside of the instance (volatile attributes
+        # would be lost whenever another writer's reservation invalidates
+        # it), keyed by the database rather than by its id(), which may be
+        # reused once the database is gone.
+        db = jar.db()
+        blocks = self._blocks.get(db)
+        if blocks is None:
+            blocks = self._blocks[db] = {}
+        return blocks, (os.getpid(), self._p_oid)
+
+    def _committed(self, status, blocks, key, block):
+        # after commit hook of a transaction which reserved ``block``
+        if status:
+            with self._lock:
+                blocks[key] = block
+
+    def _block_for(self, objectmap):
+        jar = self._p_jar
+        if jar is None:
+            block = self._v_block
+            if block is None or block[0] >= block[1]:
+                block = self._v_block = self._reserve(objectmap)
+            return block
+        txn = jar.transaction_manager.get()
+        pending = self._v_pending
+        if pending is not None and pending[0] is txn:
+            block = pending[1]
+            if block[0] < block[1]:
+                return block
+        blocks, key = self._shared_blocks(jar)
+        block = blocks.get(key)
+        if block is None or block[0] >= block[1]:
+            block = self._reserve(objectmap)
+            self._v_pending = (txn, block)
+            txn.addAfterCommitHook(self._committed, (blocks, key, block))
+        return block
+
+    def _next(self, objectmap):
+        with self._lock:
+            block = self._block_for(objectmap)
+            objectid = block[0]
+            block[0] += 1
+        return objectid
+
+    def new_objectid(self, objectmap):
+        while True:
+            objectid = self._next(objectmap)
+            # object id zero is reserved as "irresolveable"
+            if objectid != 0 and not objectid in objectmap.objectid_to_path:
+                return objectid
+
+class ResolvedObjectCache(object):
+    """ A bounded cache of the objects resolved by an object map, keyed by
+    objectid.  An object map keeps one of these per ZODB connection (in a
+    volatile attribute) and empties it whenever a new transaction begins,
+    so objects are never shared between connections or served from a
+    transaction other than the one they were resolved in.  ``hits`` and
+    ``misses`` count lookups over the lifetime of the cache, across
+    transactions."""
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.transaction = None
+        self.lru = LRUCache(size)
+
+    def scope(self, transaction):
+        """ Empty the cache if ``transaction`` isn't the transaction the
+        cached objects were resolved in."""
+        if transaction is not self.transaction:
+            self.lru.clear()
+            self.transaction = transaction
+
+    def get(self, objectid):
+        result = self.lru.get(objectid)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def put(self, objectid, obj):
+        if obj is not None:
+            self.lru.put(objectid, obj)
+
+    def invalidate(self, objectids):
+        for objectid in objectids:
+            self.lru.invalidate(objectid)
+
+    def stats(self):
+        return {
+            'hits':self.hits,
+            'misses':self.misses,
+            'size':len(self.lru.data),
+            'maxsize':self.size,
+            }
+
 @implementer(IObjectMap)
 class ObjectMap(Persistent):
     
     _v_nextid = None
     _randrange = random.randrange
 
+    # An object with a ``new_objectid(objectmap)`` method (e.g. a
+    # ``BlockObjectidAllocator``) or ``None``, meaning "use a
+    # ``RandomObjectidAllocator``".
+    objectid_allocator = None
+
     family = BTrees.family64
 
-    def __init__(self, root, family=None):
+    # When ``segment_ids`` is not ``None``, the object map stores each path
+    # in ``objectid_to_path``, ``path_to_objectid`` and ``pathindex`` as a
+    # tuple of interned integer segment identifiers rather than as a tuple
+    # of Unicode names.  See ``intern_paths``.
+    segment_ids = None
+    segment_names = None
+
+    # A BTree mapping each pathindex key to an IO BTree of ``{level:
+    # BTrees.Length.Length}`` which counts the members of the corresponding
+    # pathindex level set, or ``None`` for object maps created by an older
+    # version of this package.  Level 0 only ever holds the object at the
+    # path itself, so it isn't counted, and leaves have no entry at all.
+    # See ``count_under`` and ``build_pathcounts``.
+    pathcounts = None
+
+    # Largest number of objects kept in the resolved object cache used by
+    # ``object_for`` and ``objects_for``; zero disables the cache
+    resolved_cache_size = 1000
+    _v_resolved = None
+
+    # Largest number of parents remembered by ``objects_for``
+    _objects_for_max_parents = 1000
+
+    # ``pathintersect`` looks up the path of each objectid it is given when
+    # there are fewer than 1/``_pathintersect_ratio`` as many of them as
+    # objects under the path, otherwise it intersects them with the level
+    # sets.
+    _pathintersect_ratio = 20
+
+    def __init__(self, root, family=None, intern_paths=False,
+                 objectid_allocator=None):
         if family is not None:
             self.family = family
+        if objectid_allocator is not None:
+            self.objectid_allocator = objectid_allocator
         self.objectid_to_path = self.family.IO.BTree()
         self.path_to_objectid = self.family.OI.BTree()
         self.pathindex = self.family.OO.BTree()
+        self.pathcounts = self.family.OO.BTree()
         self.referencemap = ReferenceMap()
         self.root = root
+        if intern_paths:
+            self.segment_ids = self.family.OI.BTree()
+            self.segment_names = self.family.IO.BTree()
 
     def new_objectid(self):
-        """ Obtain an unused integer object identifier """
-        while True:
-            if self._v_nextid is None:
-                self._v_nextid = self._randrange(self.family.minint, 
-                                                 self.family.maxint)
-
-            objectid = self._v_nextid
-
-            if objectid > self.family.maxint:
-                self._v_nextid = None
-                continue
-                
-            self._v_nextid += 1
-
-            # object id zero is reserved as "irresolveable"
-            if objectid != 0 and not objectid in self.objectid_to_path:
-                return objectid
+        """ Obtain an unused integer object identifier from the object map's
+        ``objectid_allocator``."""
+        allocator = self.objectid_allocator
+        if allocator is None:
+            allocator = RandomObjectidAllocator()
+        return allocator.new_objectid(self)
+
+    def _new_segmentid(self):
+        segment_names = self.segment_names
+        if not segment_names:
+            return 1
+        return segment_names.maxKey() + 1
+
+    def _key_for(self, path_tuple, create=False):
+        # Return the key under which ``path_tuple`` is stored in the object
+        # map's BTrees.  If paths are interned and some segment of the path
+        # has never been seen before, return ``None`` (no such path can be
+        # present) unless ``create`` is true, in which case intern it.
+        segment_ids = self.segment_ids
+        if segment_ids is None:
+            return path_tuple
+        key = []
+        for name in path_tuple:
+            segmentid = segment_ids.get(name)
+            if segmentid is None:
+                if not create:
+                    return None
+                segmentid = self._new_segmentid()
+                segment_ids[name] = segmentid
+                self.segment_names[segmentid] = name
+            key.append(segmentid)
+        return tuple(key)
+
+    def _path_for_key(self, key):
+        # Inverse of ``_key_for``
+        segment_names = self.segment_names
+        if segment_names is None or key is None:
+            return key
+        return tuple([segment_names[segmentid] for segmentid in key])
+
+    def intern_paths(self):
+        """ Convert an object map which stores full path tuples into one
+        which stores paths as tuples of interned integer segment identifiers
+        in place.  Segment interning shrinks the keys of ``path_to_objectid``
+        and ``pathindex`` and the values of ``objectid_to_path``
+        considerably when there are many objects in deep trees.  The public
+        API of the object map is unchanged by the conversion: path tuples
+        are still accepted and returned.  Calling this method on an object
+        map which already interns its paths is a no-op.  Meant to be called
+        from an evolve step."""
+        if self.segment_ids is not None:
+            return
+        self.segment_ids = self.family.OI.BTree()
+        self.segment_names = self.family.IO.BTree()
+        objectid_to_path = self.family.IO.BTree()
+        path_to_objectid = self.family.OI.BTree()
+        pathindex = self.family.OO.BTree()
+        pathcounts = None
+        if self.pathcounts is not None:
+            pathcounts = self.family.OO.BTree()
+            for path_tuple, counts in self.pathcounts.items():
+                pathcounts[self._key_for(path_tuple, create=True)] = counts
+        for objectid, path_tuple in self.objectid_to_path.items():
+            key = self._key_for(path_tuple, create=True)
+            objectid_to_path[objectid] = key
+            path_to_objectid[key] = objectid
+        for path_tuple, omap in self.pathindex.items():
+            # level maps are keyed by depth, which doesn't change
+            pathindex[self._key_for(path_tuple, create=True)] = omap
+        self.objectid_to_path = objectid_to_path
+        self.path_to_objectid = path_to_objectid
+        self.pathindex = pathindex
+        self.pathcounts = pathcounts
+
+    def build_pathcounts(self):
+        """ Compute the per-level subtree counts used by ``count_under`` for
+        an object map created by an older version of this package, which
+        doesn't maintain them.  Until this is done, ``count_under`` falls
+        back to counting the result of ``pathlookup``.  Calling this method
+        again recomputes the counts from the pathindex.  Meant to be called
+        from an evolve step."""
+        pathcounts = self.family.OO.BTree()
+        for key, omap in self.pathindex.items():
+            counts = self.family.IO.BTree()
+            for level, oidset in omap.items(min=1):
+                counts[level] = Length(len(oidset))
+            if counts:
+                pathcounts[key] = counts
+        self.pathcounts = pathcounts
+
+    def _change_count(self, key, level, delta):
+        # Add ``delta`` to the number of objects at ``level`` under ``key``
+        # in ``pathcounts``, dropping counts which reach zero just like
+        # empty level sets are dropped from the pathindex.  Level 0 isn't
+        # counted.
+        pathcounts = self.pathcounts
+        if pathcounts is None or not delta or not level:
+            return
+        counts = pathcounts.get(key)
+        if counts is None:
+            counts = pathcounts[key] = self.family.IO.BTree()
+        length = counts.get(level)
+        if length is None:
+            length = counts[level] = Length()
+        length.change(delta)
+        if length() <= 0:
+            del counts[level]
+            if not counts:
+                del pathcounts[key]
+
+    def _level_counts(self, key, items):
+        # Return a list of ``(level, count)`` pairs for the pathindex entry
+        # ``key`` whose level sets are ``items``, using the maintained
+        # counts where possible.
+        if self.pathcounts is None:
+            return [(level, len(oidset)) for level, oidset in items]
+        result = [(level, len(oidset)) for level, oidset in items
+                  if level == 0]
+        counts = self.pathcounts.get(key)
+        if counts is not None:
+            result.extend(
+                [(level, length()) for level, length in counts.items(min=1)])
+        return result
 
-            self._v_nextid = None
+    def convert_level_sets(self):
+        """ Replace any ``IF.Set`` level sets in the pathindex of an object
+        map created by an older version of this package with ``IF.TreeSet``
+        level sets.  A tree set is spread over many buckets, so adding an
+        object to (or removing one from) a large folder writes one bucket
+        of each level set instead of the whole set.  Meant to be called from
+        an evolve step."""
+        TreeSet = self.family.IF.TreeSet
+        for omap in self.pathindex.values():
+            for level, oidset in list(omap.items()):
+                if not isinstance(oidset, TreeSet):
+                    omap[level] = TreeSet(oidset)
+
+    def _get_key(self, obj_objectid_or_path_tuple):
+        if hasattr(obj_objectid_or_path_tuple, '__parent__'):
+            path_tuple = resource_path_tuple(obj_objectid_or_path_tuple)
+        elif isinstance(obj_objectid_or_path_tuple, (int, long)):
+            return self.objectid_to_path[obj_objectid_or_path_tuple]
+        elif isinstance(obj_objectid_or_path_tuple, tuple):
+            path_tuple = obj_objectid_or_path_tuple
+        else:
+            raise ValueError(
+                'Value passed to remove must be a traversable '
+                'object, an object id, or a path tuple, got %s' % (
+                    (obj_objectid_or_path_tuple,)))
+        return self._key_for(path_tuple)
 
     def objectid_for(self, obj_or_path_tuple):
         """ Returns an objectid or ``None``, given an object or a path tuple"""
@@ -134,25 +490,127 @@ class ObjectMap(Persistent):
             raise ValueError(
                 'objectid_for accepts a traversable object or a path tuple, '
                 'got %s' % (obj_or_path_tuple,))
-        return self.path_to_objectid.get(path_tuple)
+        key = self._key_for(path_tuple)
+        if key is None:
+            return None
+        return self.path_to_objectid.get(key)
 
     def path_for(self, objectid):
         """ Returns an path or ``None`` given an object id """
-        return self.objectid_to_path.get(objectid)
+        return self._path_for_key(self.objectid_to_path.get(objectid))
+
+    def _get_resolved_cache(self):
+        # Return the resolved object cache for this connection, scoped to its
+        # current transaction, or ``None`` if caching is disabled.
+        size = self.resolved_cache_size
+        if not size:
+            return None
+        cache = self._v_resolved
+        if cache is None:
+            cache = self._v_resolved = ResolvedObjectCache(size)
+        jar = self._p_jar
+        if jar is None:
+            cache.scope(None)
+        else:
+            cache.scope(jar.transaction_manager.get())
+        return cache
+
+    def _invalidate_resolved(self, objectids):
+        cache = self._v_resolved
+        if cache is not None:
+            cache.invalidate(objectids)
+
+    def resolved_cache_stats(self):
+        """ Return a dictionary describing the resolved object cache of this
+        object map's connection with the keys ``hits`` and ``misses`` (the
+        number of lookups satisfied and not satisfied by the cache since the
+        object map was loaded by the connection), ``size`` (the number of
+        objects in the cache for the current transaction) and ``maxsize``.
+        """
+        cache = self._get_resolved_cache()
+        if cache is None:
+            return {'hits':0, 'misses':0, 'size':0, 'maxsize':0}
+        return cache.stats()
 
     def object_for(self, objectid_or_path_tuple, context=None):
-        """ Returns an object or ``None`` given an object id or a path tuple"""
+        """ Returns an object or ``None`` given an object id or a path tuple.
+
+        Objects looked up by object id (without a ``context``) are cached
+        until the end of the transaction, unless they are removed or moved
+        before then."""
         if isinstance(objectid_or_path_tuple, (int, long)):
-            path_tuple = self.objectid_to_path.get(objectid_or_path_tuple)
+            cache = None
+            if context is None:
+                cache = self._get_resolved_cache()
+            if cache is not None:
+                obj = cache.get(objectid_or_path_tuple)
+                if obj is not None:
+                    return obj
+            path_tuple = self.path_for(objectid_or_path_tuple)
+            obj = self._object_for_path(path_tuple, context)
+            if cache is not None:
+                cache.put(objectid_or_path_tuple, obj)
+            return obj
         elif isinstance(objectid_or_path_tuple, tuple):
-            path_tuple = objectid_or_path_tuple
+            return self._object_for_path(objectid_or_path_tuple, context)
         else:
             raise ValueError('Unknown input %s' % (objectid_or_path_tuple,))
+
+    def _object_for_path(self, path_tuple, context):
         try:
             return self._find_resource(context, path_tuple)
         except KeyError:
             return None
 
+    def objects_for(self, objectids, context=None):
+        """ Return a generator which yields the object (or ``None`` if the
+        object cannot be found) for each of the object ids in ``objectids``,
+        in the same order.  Equivalent to calling ``object_for`` for each
+        object id, but the parent of each object is only found by
+        traversal once, so resolving many objects which live in a handful of
+        folders costs one traversal per folder rather than one per
+        object."""
+        # {parent path tuple:parent or None}
+        parents = {}
+        cache = None
+        for objectid in objectids:
+            if context is None:
+                # the transaction may change between iterations
+                cache = self._get_resolved_cache()
+            if cache is not None:
+                obj = cache.get(objectid)
+                if obj is not None:
+                    yield obj
+                    continue
+            obj = self._resolve_in(objectid, parents, context)
+            if cache is not None:
+                cache.put(objectid, obj)
+            yield obj
+
+    def _resolve_in(self, objectid, parents, context):
+        # Resolve ``objectid`` via ``parents``, a mapping of the parent path
+        # tuples seen so far by ``objects_for`` to their parents.
+        path_tuple = self.path_for(objectid)
+        if path_tuple is None:
+            return None
+        if len(path_tuple) < 2:
+            return self._object_for_path(path_tuple, context)
+        parent_path = path_tuple[:-1]
+        parent = parents.get(parent_path, _marker)
+        if parent is _marker:
+            if len(parents) >= self._objects_for_max_parents:
+                # don't keep every folder we've seen alive
+                parents.clear()
+            parent = self._object_for_path(parent_path, context)
+            parents[parent_path] = parent
+        getitem = getattr(parent, '__getitem__', None)
+        if getitem is None:
+            return None
+        try:
+            return getitem(path_tuple[-1])
+        except KeyError:
+            return None
+
     def _find_resource(self, context, path_tuple): # replaced in tests
         if context is None:
             context = self.root
@@ -173,39 +631,116 @@ class ObjectMap(Persistent):
         elif objectid in self.objectid_to_path:
             raise ValueError('objectid %s already exists' % (objectid,))
 
-        if path_tuple in self.path_to_objectid:
+        key = self._key_for(path_tuple, create=True)
+
+        if key in self.path_to_objectid:
             raise ValueError('path %s already exists' % (path_tuple,))
 
-        self.path_to_objectid[path_tuple] = objectid
-        self.objectid_to_path[objectid] = path_tuple
+        self.path_to_objectid[key] = objectid
+        self.objectid_to_path[objectid] = key
 
-        pathlen = len(path_tuple)
+        pathlen = len(key)
 
         for x in range(pathlen):
-            els = path_tuple[:x+1]
+            els = key[:x+1]
             omap = self.pathindex.setdefault(els, self.family.IO.BTree())
             level = pathlen - len(els)
-            oidset = omap.setdefault(level, self.family.IF.Set())
-            oidset.add(objectid)
+            oidset = omap.setdefault(level, self.family.IF.TreeSet())
+            if oidset.insert(objectid):
+                self._change_count(els, level, 1)
+
+        self._invalidate_resolved((objectid,))
 
         return objectid
 
+    def add_many(self, nodes, replace_oid=False):
+        """ Add many objects to the object map at once.  ``nodes`` is a
+        sequence of ``(obj, path_tuple)`` pairs, each of which means the
+        same thing as the arguments to ``add``.  Returns a list of the
+        objectids of the added objects in the order they were supplied.
+
+        This is equivalent to calling ``add`` for each pair, but the
+        pathindex entries of ancestors shared by the objects are looked up
+        once and each of their level sets is updated once, which makes it
+        much cheaper to add a large subtree.  Newly allocated objectids are
+        handed out in consecutive runs.  All paths and objectids are
+        checked before anything is changed: if any of them is already
+        present in the object map (or appears twice in ``nodes``) a
+        :exc:`ValueError` is raised and the object map is left as it
+        was."""
+        nodes = list(nodes)
+        keys = []
+        seen_keys = set()
+        seen_oids = set()
+
+        for obj, path_tuple in nodes:
+            if not isinstance(path_tuple, tuple):
+                raise ValueError('path_tuple argument must be a tuple')
+            if not replace_oid:
+                objectid = oid_of(obj, _marker)
+                if objectid is not _marker:
+                    if (objectid in seen_oids or
+                        objectid in self.objectid_to_path):
+                        raise ValueError(
+                            'objectid %s already exists' % (objectid,))
+                    seen_oids.add(objectid)
+            key = self._key_for(path_tuple)
+            if key is not None and key in self.path_to_objectid:
+                raise ValueError('path %s already exists' % (path_tuple,))
+            if path_tuple in seen_keys:
+                raise ValueError('path %s already exists' % (path_tuple,))
+            seen_keys.add(path_tuple)
+
+        objectids = []
+        # {parent key:[objectid, ...]}
+        siblings = {}
+        # {prefix:{level:[objectid, ...]}}
+        prefixes = {}
+
+        for obj, path_tuple in nodes:
+            objectid = oid_of(obj, _marker)
+            if objectid is _marker or replace_oid:
+                objectid = self.new_objectid()
+                obj.__objectid__ = objectid
+            objectids.append(objectid)
+
+            key = self._key_for(path_tuple, create=True)
+            self.path_to_objectid[key] = objectid
+            self.objectid_to_path[objectid] = key
+
+            prefixes.setdefault(key, {}).setdefault(0, []).append(objectid)
+            if len(key) > 1:
+                siblings.setdefault(key[:-1], []).append(objectid)
+
+        # Objects with the same parent are at the same levels of every
+        # ancestor, so the ancestors are visited once per parent rather than
+        # once per object.
+        for parent, oids in siblings.items():
+            parentlen = len(parent)
+            for x in range(parentlen):
+                levels = prefixes.setdefault(parent[:x+1], {})
+                levels.setdefault(parentlen - x, []).extend(oids)
+
+        for els, levels in prefixes.items():
+            omap = self.pathindex.setdefault(els, self.family.IO.BTree())
+            for level, oids in levels.items():
+                oidset = omap.setdefault(level, self.family.IF.TreeSet())
+                self._change_count(els, level, oidset.update(oids))
+
+        self._invalidate_resolved(objectids)
+
+        return objectids
+
     def remove(self, obj_objectid_or_path_tuple, references=True):
         """ Remove an object from the object map give an object, an object id
         or a path tuple.  If ``references`` is True, also remove any
         references added via ``connect``, otherwise leave them there
         (e.g. when moving an object)."""
-        if hasattr(obj_objectid_or_path_tuple, '__parent__'):
-            path_tuple = resource_path_tuple(obj_objectid_or_path_tuple)
-        elif isinstance(obj_objectid_or_path_tuple, (int, long)):
-            path_tuple = self.objectid_to_path[obj_objectid_or_path_tuple]
-        elif isinstance(obj_objectid_or_path_tuple, tuple):
-            path_tuple = obj_objectid_or_path_tuple
-        else:
-            raise ValueError(
-                'Value passed to remove must be a traversable '
-                'object, an object id, or a path tuple, got %s' % (
-                    (obj_objectid_or_path_tuple,)))
+        path_tuple = self._get_key(obj_objectid_or_path_tuple)
+
+        # rationale: a segment of this path was never interned
+        if path_tuple is None:
+            return set()
 
         pathlen = len(path_tuple)
 
@@ -215,55 +750,185 @@ class ObjectMap(Persistent):
         if omap is None:
             return set()
 
+        # Every object at or under ``path_tuple`` is a member of exactly one
+        # of the level sets of ``omap``, so the work done below is bounded
+        # by the size of the removed subtree (times its depth in the tree),
+        # not by the number of keys in the pathindex.
+        items = list(omap.items())
+        sizes = self._level_counts(path_tuple, items)
         removed = set()
-        items = omap.items()
+
+        for level, oidset in items:
+            removed.update(oidset)
+
+        for oid in removed:
+            p = self.objectid_to_path.pop(oid, None)
+            if p is not None:
+                del self.path_to_objectid[p]
+
         removepaths = []
-        
-        for k, dm in self.pathindex.items(min=path_tuple):
-            if k[:pathlen] == path_tuple:
-                for oidset in dm.values():
-                    removed.update(oidset)
-                    for oid in oidset:
-                        if oid in self.objectid_to_path:
-                            p = self.objectid_to_path[oid]
-                            del self.objectid_to_path[oid]
-                            del self.path_to_objectid[p]
-                # dont mutate while iterating
-                removepaths.append(k)
-            else:
+
+        for k in self.pathindex.keys(min=path_tuple):
+            if k[:pathlen] != path_tuple:
                 break
+            # dont mutate while iterating
+            removepaths.append(k)
 
         for k in removepaths:
             del self.pathindex[k]
+            if self.pathcounts is not None:
+                self.pathcounts.pop(k, None)
 
-        for x in range(pathlen-1):
-
-            offset = x + 1
+        for offset in range(1, pathlen):
             els = path_tuple[:pathlen-offset]
-            omap2 = self.pathindex[els]
+            omap2 = self.pathindex.get(els)
+            if omap2 is None:
+                continue
             for level, oidset in items:
-
                 i = level + offset
-                oidset2 = omap2[i]
-
-                for oid in oidset:
-                    if oid in oidset2:
-                        oidset2.remove(oid)
-                        # adding to removed and removing from objectid_to_path
-                        # and path_to_objectid should have been taken care of
-                        # above in the for k, dm in self.pathindex.items()
-                        # loop
-                        assert oid in removed, oid
-                        assert not oid in self.objectid_to_path, oid
-
-                if not oidset2:
-                    del omap2[i]
+                oidset2 = omap2.get(i)
+                if oidset2 is not None:
+                    self._remove_from_level(omap2, i, oidset2, oidset)
+            for level, count in sizes:
+                self._change_count(els, level + offset, -count)
 
         if references:
             self.referencemap.remove(removed)
 
+        self._invalidate_resolved(removed)
+
         return removed
 
+    def move(self, old_path_tuple, new_path_tuple):
+        """ Move the object at ``old_path_tuple`` and all of its descendants
+        so that they live at ``new_path_tuple``, preserving their object
+        identifiers and any references added via ``connect``.  Only the
+        entries of the moved subtree and the level sets of ancestors which
+        are not shared by the old and new locations are rewritten.  Returns
+        the set of objectids that were moved.
+
+        A :exc:`ValueError` is raised if nothing exists at
+        ``old_path_tuple``, if something already exists at
+        ``new_path_tuple``, or if ``new_path_tuple`` is inside the subtree
+        being moved."""
+        if not (isinstance(old_path_tuple, tuple) and
+                isinstance(new_path_tuple, tuple)):
+            raise ValueError('move requires two path tuples')
+
+        old_key = self._key_for(old_path_tuple)
+        omap = self.pathindex.get(old_key)
+
+        if omap is None:
+            raise ValueError('path %s does not exist' % (old_path_tuple,))
+
+        new_key = self._key_for(new_path_tuple, create=True)
+
+        if new_key in self.pathindex or new_key in self.path_to_objectid:
+            raise ValueError('path %s already exists' % (new_path_tuple,))
+
+        oldlen = len(old_key)
+        newlen = len(new_key)
+
+        if new_key[:oldlen] == old_key:
+            raise ValueError(
+                'cannot move %s into itself' % (old_path_tuple,))
+
+        items = list(omap.items())
+        sizes = self._level_counts(old_key, items)
+        moved = set()
+
+        for level, oidset in items:
+            moved.update(oidset)
+
+        for oid in moved:
+            p = self.objectid_to_path.get(oid)
+            if p is not None:
+                newp = new_key + p[oldlen:]
+                del self.path_to_objectid[p]
+                self.path_to_objectid[newp] = oid
+                self.objectid_to_path[oid] = newp
+
+        # Level maps of keys inside the subtree are relative to the key
+        # itself, so they are moved as-is to their new keys.
+        movepaths = []
+
+        for k in self.pathindex.keys(min=old_key):
+            if k[:oldlen] != old_key:
+                break
+            # dont mutate while iterating
+            movepaths.append(k)
+
+        pathcounts = self.pathcounts
+
+        for k in movepaths:
+            self.pathindex[new_key + k[oldlen:]] = self.pathindex.pop(k)
+            if pathcounts is not None and k in pathcounts:
+                pathcounts[new_key + k[oldlen:]] = pathcounts.pop(k)
+
+        # An ancestor shared by both locations keeps the moved objectids at
+        # the same levels when the depth of the moved object doesn't change
+        # (e.g. a rename), otherwise its level sets change like those of any
+        # other ancestor.
+        common = 0
+        for old, new in zip(old_key[:-1], new_key[:-1]):
+            if old != new:
+                break
+            common += 1
+
+        for offset in range(1, oldlen):
+            els = old_key[:oldlen-offset]
+            if len(els) <= common and oldlen == newlen:
+                continue
+            omap2 = self.pathindex.get(els)
+            if omap2 is None:
+                continue
+            for level, oidset in items:
+                i = level + offset
+                oidset2 = omap2.get(i)
+                if oidset2 is not None:
+                    self._remove_from_level(omap2, i, oidset2, oidset)
+            for level, count in sizes:
+                self._change_count(els, level + offset, -count)
+
+        for offset in range(1, newlen):
+            els = new_key[:newlen-offset]
+            if len(els) <= common and oldlen == newlen:
+                continue
+            omap2 = self.pathindex.setdefault(els, self.family.IO.BTree())
+            for level, oidset in items:
+                i = level + offset
+                oidset2 = omap2.setdefault(i, self.family.IF.TreeSet())
+                oidset2.update(oidset)
+            for level, count in sizes:
+                self._change_count(els, level + offset, count)
+
+        self._invalidate_resolved(moved)
+
+        return moved
+
+    def _remove_from_level(self, omap, level, oidset, removed):
+        # Remove the objectids in ``removed`` from ``oidset``, the set stored
+        # under ``level`` in the pathindex entry ``omap``.  A single
+        # objectid (removing one document) is removed in place, which only
+        # touches its bucket, so the change can be merged with concurrent
+        # changes to other members of the same set.  Anything larger is a
+        # single ``difference`` which is linear in the size of the two sets
+        # and writes the result once.
+        if len(removed) == 1:
+            for oid in removed:
+                try:
+                    oidset.remove(oid)
+                except KeyError:
+                    pass
+            if not oidset:
+                del omap[level]
+            return
+        remaining = self.family.IF.difference(oidset, removed)
+        if remaining:
+            omap[level] = self.family.IF.TreeSet(remaining)
+        else:
+            del omap[level]
+
     def _get_path_tuple(self, obj_or_path_tuple):
         if hasattr(obj_or_path_tuple, '__parent__'):
             path_tuple = resource_path_tuple(obj_or_path_tuple)
@@ -276,28 +941,134 @@ class ObjectMap(Persistent):
         return path_tuple
     
     def navgen(self, obj_or_path_tuple, depth=1):
+        """ Return a list of dictionaries representing the objects in the
+        tree under ``obj_or_path_tuple`` down to ``depth`` levels.  Each
+        dictionary has the keys ``path``, ``name`` and ``children``, the
+        latter being a list of the same kind of dictionaries.  See
+        ``navigate`` for a lazy version of this method."""
+        def todict(node):
+            return {'path':node.path,
+                    'name':node.name,
+                    'children':[todict(child) for child in node.children],
+                    }
+        return [todict(node) for node in self.navigate(obj_or_path_tuple,
+                                                       depth)]
+
+    def navigate(self, obj_or_path_tuple, depth=1, limits=None, sort=False,
+                 prefetch=False):
+        """ Return an iterator of :class:`NavNode` objects representing the
+        children of ``obj_or_path_tuple`` (an object or a path tuple).  The
+        ``children`` of each node are only computed when they are first
+        asked for, so the cost of rendering a navigation tree depends on the
+        parts of it that are displayed rather than on the size of the tree.
+
+        ``depth`` is the number of levels of the tree that may be expanded;
+        the nodes at the last level have no children.
+
+        ``limits`` limits the number of children returned for each node.  It
+        may be ``None`` (no limit), an integer (the same limit for every
+        level) or a sequence of integers or ``None`` values, one per level,
+        starting with the children of ``obj_or_path_tuple``.
+
+        If ``sort`` is true, children are returned in the order of their
+        names, otherwise they are returned in objectid order.  Unless the
+        object map interns its paths, sorted children are found by seeking
+        through the pathindex, so only the children returned are looked at.
+
+        If ``prefetch`` is true, the whole tree (down to ``depth``, honoring
+        ``limits``) is expanded eagerly, a level at a time, and if the object
+        map's connection supports it the pathindex records each level needs
+        are loaded with a single ``prefetch`` call per kind of record rather
+        than one at a time."""
+        if depth < 1:
+            return iter(())
+        if limits is None or isinstance(limits, (int, long)):
+            limits = (limits,) * depth
+        else:
+            limits = tuple(limits) + (None,) * (depth - len(limits))
         path_tuple = self._get_path_tuple(obj_or_path_tuple)
-        return self._navgen(path_tuple, depth)
-
-    def _navgen(self, path_tuple, depth):
-        omap = self.pathindex.get(path_tuple)
+        key = self._key_for(path_tuple)
+        if key is None:
+            return iter(())
+        if not prefetch:
+            return self._nav_children(key, depth, limits, sort)
+        top = NavNode(self, key, None, depth, limits, sort)
+        nodes = [top]
+        while nodes:
+            nodes = [node for node in nodes if node.depth > 0]
+            self._prefetch([self.pathindex.get(node.key) for node in nodes])
+            if not sort or self.segment_ids is not None:
+                self._prefetch([node._level_set() for node in nodes])
+            nextnodes = []
+            for node in nodes:
+                nextnodes.extend(node.children)
+            nodes = nextnodes
+        return iter(top.children)
+
+    def _prefetch(self, objects):
+        # ask the connection (if it can; ZODB >= 5) to load all of
+        # ``objects`` at once, ahead of their use
+        prefetch = getattr(self._p_jar, 'prefetch', None)
+        objects = [ob for ob in objects if ob is not None]
+        if prefetch is not None and objects:
+            prefetch(objects)
+
+    def _nav_children(self, key, depth, limits, sort):
+        # Generate ``NavNode`` objects for the children of ``key``, where
+        # ``depth`` and ``limits`` apply to the children.
+        limit = limits[0]
+        if limit is not None and limit <= 0:
+            return
+        count = 0
+        if sort and self.segment_ids is None:
+            childkeys = self._sorted_child_keys(key)
+        elif sort:
+            childkeys = sorted(
+                self._unsorted_child_keys(key),
+                key=lambda childkey: self.segment_names[childkey[-1]])
+        else:
+            childkeys = self._unsorted_child_keys(key)
+        for childkey in childkeys:
+            objectid = self.path_to_objectid.get(childkey)
+            if objectid is None:
+                # an ancestor of an object that isn't in the object map
+                continue
+            yield NavNode(self, childkey, objectid, depth - 1, limits[1:],
+                          sort)
+            count += 1
+            if count == limit:
+                return
+
+    def _unsorted_child_keys(self, key):
+        omap = self.pathindex.get(key)
         if omap is None:
-            return []
+            return
         oidset = omap.get(1)
-        result = []
         if oidset is None:
-            return result
-        newdepth = depth-1
-        if newdepth > -1:
-            for oid in oidset:
-                pt = self.objectid_to_path[oid]
-                result.append(
-                    {'path':pt,
-                     'children':self._navgen(pt, newdepth),
-                     'name':pt[-1],
-                     }
-                    )
-        return result
+            return
+        objectid_to_path = self.objectid_to_path
+        for objectid in oidset:
+            yield objectid_to_path[objectid]
+
+    def _sorted_child_keys(self, key):
+        # Keys are tuples of names, so the keys under ``key`` in the
+        # pathindex are contiguous and the children are among them in name
+        # order, each followed by its own descendants.  A name followed by a
+        # NUL sorts after every key under the child with that name and
+        # before the next child, so we can seek from child to child without
+        # visiting their descendants.
+        keylen = len(key)
+        keys = self.pathindex.keys(min=key, excludemin=True)
+        while True:
+            for childkey in keys:
+                break
+            else:
+                return
+            if childkey[:keylen] != key:
+                return
+            childkey = childkey[:keylen+1]
+            yield childkey
+            keys = self.pathindex.keys(min=key + (childkey[-1] + u'\x00',))
 
     def pathlookup(self, obj_or_path_tuple, depth=None, include_origin=True):
         """ Return a set of objectids under a given path given an object or a
@@ -306,7 +1077,7 @@ class ObjectMap(Persistent):
         ``include_origin`` is ``True``, include the object identifier of the
         object that was passed, otherwise omit it from the returned set."""
         path_tuple = self._get_path_tuple(obj_or_path_tuple)
-        omap = self.pathindex.get(path_tuple)
+        omap = self.pathindex.get(self._key_for(path_tuple))
 
         result = self.family.IF.Set()
 
@@ -336,6 +1107,81 @@ class ObjectMap(Persistent):
 
         return result
 
+    def _level_sets(self, key, depth, include_origin):
+        # Return the pathindex level sets under ``key`` which ``pathlookup``
+        # combines for ``depth`` and ``include_origin``.
+        omap = self.pathindex.get(key)
+        if omap is None:
+            return []
+        if depth is None:
+            items = omap.items()
+        else:
+            items = omap.items(max=depth)
+        return [oidset for level, oidset in items
+                if level or include_origin]
+
+    def pathintersect(self, objectids, obj_or_path_tuple, depth=None,
+                      include_origin=True):
+        """ Return an ``IF.Set`` of the objectids in ``objectids`` which
+        ``pathlookup`` would return for the other arguments, without
+        building the set of every objectid under the path.  A small
+        ``objectids`` is filtered by looking up the path of each of its
+        members; a large one is intersected with each level set under the
+        path in turn."""
+        IF = self.family.IF
+        path_tuple = self._get_path_tuple(obj_or_path_tuple)
+        key = self._key_for(path_tuple)
+        if key is None or not objectids:
+            return IF.Set()
+        if not isinstance(objectids, (IF.Set, IF.TreeSet)):
+            objectids = IF.Set(objectids)
+        count = self.count_under(path_tuple, depth, include_origin)
+        if len(objectids) * self._pathintersect_ratio < count:
+            keylen = len(key)
+            result = []
+            for objectid in objectids:
+                k = self.objectid_to_path.get(objectid)
+                if k is None or k[:keylen] != key:
+                    continue
+                level = len(k) - keylen
+                if level == 0 and not include_origin:
+                    continue
+                if depth is not None and level > depth:
+                    continue
+                result.append(objectid)
+            return IF.Set(result)
+        oidsets = self._level_sets(key, depth, include_origin)
+        return IF.multiunion(
+            [IF.intersection(oidset, objectids) for oidset in oidsets])
+
+    def count_under(self, obj_or_path_tuple, depth=None, include_origin=True):
+        """ Return the number of objectids ``pathlookup`` would return for
+        the same arguments, without building the set.  The object map keeps
+        a count of the objects at each depth below every path as objects
+        are added, removed and moved, so the cost of this method depends
+        only on ``depth`` (or on the depth of the subtree when ``depth`` is
+        ``None``), not on the number of objects counted."""
+        if self.pathcounts is None:
+            return len(
+                self.pathlookup(obj_or_path_tuple, depth, include_origin))
+        path_tuple = self._get_path_tuple(obj_or_path_tuple)
+        key = self._key_for(path_tuple)
+        if key is None:
+            return 0
+        total = 0
+        if include_origin and key in self.path_to_objectid:
+            total = 1
+        counts = self.pathcounts.get(key)
+        if counts is None or depth == 0:
+            return total
+        if depth is None:
+            items = counts.items(min=1)
+        else:
+            items = counts.items(min=1, max=depth)
+        for level, length in items:
+            total += length()
+        return total
+
     def _refids_for(self, source, target):
         sourceid, targetid = oid_of(source, source), oid_of(target, target)
         if not sourceid in self.objectid_to_path:
@@ -362,6 +1208,56 @@ class ObjectMap(Persistent):
         sourceid, targetid = self._refids_for(source, target)
         self.referencemap.disconnect(sourceid, targetid, reftype)
 
+    def _refids_for_many(self, objects, ignore_missing):
+        # Return a list of the objectids of ``objects`` (objects or
+        # objectids), raising a ValueError if any of them isn't in the
+        # object map, or leaving it out if ``ignore_missing`` is true.
+        objectid_to_path = self.objectid_to_path
+        oids = []
+        for obj in objects:
+            oid = oid_of(obj, obj)
+            if oid in objectid_to_path:
+                oids.append(oid)
+            elif not ignore_missing:
+                raise ValueError('oid %s is not in objectmap' % (obj,))
+        return oids
+
+    def connect_many(self, source, targets, reftype, ignore_missing=False):
+        """ Connect a source object or objectid to each of the objects or
+        objectids in ``targets`` using reference type ``reftype``.  All of
+        the objects are checked before any reference is added: if one of
+        them isn't in the object map, a :exc:`ValueError` is raised, unless
+        ``ignore_missing`` is true, in which case it is skipped."""
+        sourceid = self._refid_for(source)
+        targetids = self._refids_for_many(targets, ignore_missing)
+        self.referencemap.connect_many(sourceid, targetids, reftype)
+
+    def connect_many_sources(self, sources, target, reftype,
+                             ignore_missing=False):
+        """ Like ``connect_many``, but connect each of the objects or
+        objectids in ``sources`` to a single target object or objectid."""
+        targetid = self._refid_for(target)
+        sourceids = self._refids_for_many(sources, ignore_missing)
+        self.referencemap.connect_many_sources(sourceids, targetid, reftype)
+
+    def disconnect_many(self, source, targets, reftype,
+                        ignore_missing=False):
+        """ Disconnect a source object or objectid from each of the objects
+        or objectids in ``targets`` using reference type ``reftype``.
+        Missing objects are handled as by ``connect_many``."""
+        sourceid = self._refid_for(source)
+        targetids = self._refids_for_many(targets, ignore_missing)
+        self.referencemap.disconnect_many(sourceid, targetids, reftype)
+
+    def disconnect_many_sources(self, sources, target, reftype,
+                                ignore_missing=False):
+        """ Like ``disconnect_many``, but disconnect each of the objects or
+        objectids in ``sources`` from a single target object or
+        objectid."""
+        targetid = self._refid_for(target)
+        sourceids = self._refids_for_many(sources, ignore_missing)
+        self.referencemap.disconnect_many_sources(sourceids, targetid, reftype)
+
     # We make a copy of the set returned by ``targetids`` and ``sourceids``
     # because it's not atypical for callers to want to modify the
     # underlying bucket while iterating over the returned set.  For example:
@@ -387,35 +1283,122 @@ class ObjectMap(Persistent):
         oid = self._refid_for(obj)
         return self.family.IF.Set(self.referencemap.targetids(oid, reftype))
 
+    def count_sources(self, obj, reftype):
+        """ Return the number of objects connected to ``obj`` as a source
+        using reference type ``reftype`` without loading their object
+        identifiers."""
+        oid = self._refid_for(obj)
+        return self.referencemap.count_sources(oid, reftype)
+
+    def count_targets(self, obj, reftype):
+        """ Return the number of objects connected to ``obj`` as a target
+        using reference type ``reftype`` without loading their object
+        identifiers."""
+        oid = self._refid_for(obj)
+        return self.referencemap.count_targets(oid, reftype)
+
     def sources(self, obj, reftype):
         """ Return a generator which will return the objects connected to
         ``obj`` as a source using reference type ``reftype``"""
-        for oid in self.sourceids(obj, reftype):
-            yield self.object_for(oid)
+        for ob in self.objects_for(self.sourceids(obj, reftype)):
+            yield ob
 
     def targets(self, obj, reftype):
         """ Return a generator which will return the objects connected to
         ``obj`` as a target using reference type ``reftype``"""
-        for oid in self.targetids(obj, reftype):
-            yield self.object_for(oid)
+        for ob in self.objects_for(self.targetids(obj, reftype)):
+            yield ob
 
 class ReferenceMap(Persistent):
     
     family = BTrees.family64
+
+    # {oid:OOTreeSet([reftype, ...])}: the reftypes of the reference sets
+    # each objectid takes part in (may include reftypes the objectid no
+    # longer has references of, never omits one it has).  ``None`` in maps
+    # created before this index existed; see ``index_reftypes``.
+    reftypes = None
     
     def __init__(self, refmap=None):
         if refmap is None:
             refmap = self.family.OO.BTree()
+            self.reftypes = self.family.IO.BTree()
         self.refmap = refmap
 
+    def index_reftypes(self):
+        """ Build the objectid-to-reftypes index used to limit the work done
+        by ``remove`` to the reference sets an objectid takes part in.  Maps
+        created by an older version of this package don't have one, and
+        visit every reference set instead.  Meant to be called from an
+        evolve step."""
+        reftypes = self.family.IO.BTree()
+        OOTreeSet = self.family.OO.TreeSet
+        for reftype, refset in self.refmap.items():
+            for oids in (refset.src2target, refset.target2src):
+                for oid in oids.keys():
+                    reftypes.setdefault(oid, OOTreeSet()).insert(reftype)
+        self.reftypes = reftypes
+
     def connect(self, source, target, reftype):
         refset = self.refmap.setdefault(reftype, ReferenceSet())
         refset.connect(source, target)
+        index = self.reftypes
+        if index is not None:
+            OOTreeSet = self.family.OO.TreeSet
+            index.setdefault(source, OOTreeSet()).insert(reftype)
+            index.setdefault(target, OOTreeSet()).insert(reftype)
+
+    def connect_many(self, source, targets, reftype):
+        refset = self.refmap.setdefault(reftype, ReferenceSet())
+        refset.connect_many(source, targets)
+        self._index_reftype([source] + list(targets), reftype)
+
+    def connect_many_sources(self, sources, target, reftype):
+        refset = self.refmap.setdefault(reftype, ReferenceSet())
+        refset.connect_many_sources(sources, target)
+        self._index_reftype(list(sources) + [target], reftype)
+
+    def _index_reftype(self, oids, reftype):
+        index = self.reftypes
+        if index is not None:
+            OOTreeSet = self.family.OO.TreeSet
+            for oid in oids:
+                index.setdefault(oid, OOTreeSet()).insert(reftype)
 
     def disconnect(self, source, target, reftype):
         refset = self.refmap.get(reftype)
         if refset is not None:
             refset.disconnect(source, target)
+            self._unindex_reftype(refset, (source, target), reftype)
+
+    def disconnect_many(self, source, targets, reftype):
+        refset = self.refmap.get(reftype)
+        if refset is not None:
+            refset.disconnect_many(source, targets)
+            self._unindex_reftype(
+                refset, [source] + list(targets), reftype)
+
+    def disconnect_many_sources(self, sources, target, reftype):
+        refset = self.refmap.get(reftype)
+        if refset is not None:
+            refset.disconnect_many_sources(sources, target)
+            self._unindex_reftype(
+                refset, list(sources) + [target], reftype)
+
+    def _unindex_reftype(self, refset, oids, reftype):
+        index = self.reftypes
+        if index is not None:
+            for oid in oids:
+                if refset.targetids(oid) or refset.sourceids(oid):
+                    continue
+                oid_reftypes = index.get(oid)
+                if oid_reftypes is not None:
+                    try:
+                        oid_reftypes.remove(reftype)
+                    except KeyError:
+                        pass
+                    if not oid_reftypes:
+                        del index[oid]
 
     def targetids(self, oid, reftype):
         refset = self.refmap.get(reftype)
@@ -429,23 +1412,69 @@ class ReferenceMap(Persistent):
             return refset.sourceids(oid)
         return self.family.IF.Set()
 
+    def count_targets(self, oid, reftype):
+        refset = self.refmap.get(reftype)
+        if refset is not None:
+            return refset.count_targets(oid)
+        return 0
+
+    def count_sources(self, oid, reftype):
+        refset = self.refmap.get(reftype)
+        if refset is not None:
+            return refset.count_sources(oid)
+        return 0
+
     def remove(self, oids):
-        for refset in self.refmap.values():
-            refset.remove(oids)
+        index = self.reftypes
+        if index is None:
+            for refset in self.refmap.values():
+                refset.remove(oids)
+            return
+        # {reftype:[oid, ...]}
+        byreftype = {}
+        for oid in oids:
+            oid_reftypes = index.pop(oid, None)
+            if oid_reftypes is not None:
+                for reftype in oid_reftypes:
+                    byreftype.setdefault(reftype, []).append(oid)
+        for reftype, reftype_oids in byreftype.items():
+            refset = self.refmap.get(reftype)
+            if refset is not None:
+                refset.remove(reftype_oids)
 
 class ReferenceSet(Persistent):
     
     family = BTrees.family64
 
+    # {oid:Length}: the number of targets of each source and the number of
+    # sources of each target.  ``None`` in reference sets created before
+    # the counts were kept, which count the members of the oid sets instead.
+    targetcounts = None
+    sourcecounts = None
+
     def __init__(self):
         self.src2target = self.family.IO.BTree()
         self.target2src = self.family.IO.BTree()
+        self.targetcounts = self.family.IO.BTree()
+        self.sourcecounts = self.family.IO.BTree()
+
+    def _change_count(self, counts, oid, delta):
+        if counts is None:
+            return
+        length = counts.get(oid)
+        if length is None:
+            if delta < 0:
+                return
+            length = counts[oid] = Length()
+        length.change(delta)
 
     def connect(self, source, target):
         targets = self.src2target.setdefault(source, self.family.IF.TreeSet())
-        targets.insert(target)
+        if targets.insert(target):
+            self._change_count(self.targetcounts, source, 1)
         sources = self.target2src.setdefault(target, self.family.IF.TreeSet())
-        sources.insert(source)
+        if sources.insert(source):
+            self._change_count(self.sourcecounts, target, 1)
 
     def disconnect(self, source, target):
         targets = self.src2target.get(source)
@@ -454,6 +1483,8 @@ class ReferenceSet(Persistent):
                 targets.remove(target)
             except KeyError:
                 pass
+            else:
+                self._change_count(self.targetcounts, source, -1)
             
         sources = self.target2src.get(target)
         if sources is not None:
@@ -461,6 +1492,48 @@ class ReferenceSet(Persistent):
                 sources.remove(source)
             except KeyError:
                 pass
+            else:
+                self._change_count(self.sourcecounts, target, -1)
+
+    def connect_many(self, source, targets):
+        # Like ``connect`` for each target, but the targets of ``source``
+        # are updated (and counted) once.
+        targets = self.family.IF.Set(targets)
+        if not targets:
+            return
+        targetset = self.src2target.setdefault(
+            source, self.family.IF.TreeSet())
+        self._change_count(
+            self.targetcounts, source, targetset.update(targets))
+        for target in targets:
+            sources = self.target2src.setdefault(
+                target, self.family.IF.TreeSet())
+            if sources.insert(source):
+                self._change_count(self.sourcecounts, target, 1)
+
+    def connect_many_sources(self, sources, target):
+        # Like ``connect`` for each source, but the sources of ``target``
+        # are updated (and counted) once.
+        sources = self.family.IF.Set(sources)
+        if not sources:
+            return
+        sourceset = self.target2src.setdefault(
+            target, self.family.IF.TreeSet())
+        self._change_count(
+            self.sourcecounts, target, sourceset.update(sources))
+        for source in sources:
+            targets = self.src2target.setdefault(
+                source, self.family.IF.TreeSet())
+            if targets.insert(target):
+                self._change_count(self.targetcounts, source, 1)
+
+    def disconnect_many(self, source, targets):
+        for target in targets:
+            self.disconnect(source, target)
+
+    def disconnect_many_sources(self, sources, target):
+        for source in sources:
+            self.disconnect(source, target)
 
     def targetids(self, oid):
         return self.src2target.get(oid, self.family.IF.Set())
@@ -468,28 +1541,101 @@ class ReferenceSet(Persistent):
     def sourceids(self, oid):
         return self.target2src.get(oid, self.family.IF.Set())
 
+    def count_targets(self, oid):
+        counts = self.targetcounts
+        if counts is None:
+            return len(self.src2target.get(oid, ()))
+        length = counts.get(oid)
+        if length is None:
+            return 0
+        return length()
+
+    def count_sources(self, oid):
+        counts = self.sourcecounts
+        if counts is None:
+            return len(self.target2src.get(oid, ()))
+        length = counts.get(oid)
+        if length is None:
+            return 0
+        return length()
+
     def remove(self, oidset):
         # XXX is there a way to make this less expensive?
         removed = self.family.IF.Set()
+        targetcounts = self.targetcounts
+        sourcecounts = self.sourcecounts
         for oid in oidset:
             if oid in self.src2target:
                 removed.insert(oid)
                 targets = self.src2target.pop(oid)
+                if targetcounts is not None:
+                    targetcounts.pop(oid, None)
                 for target in targets:
                     oidset = self.target2src.get(target)
                     oidset.remove(oid)
+                    self._change_count(sourcecounts, target, -1)
                     if not oidset:
                         del self.target2src[target]
+                        if sourcecounts is not None:
+                            sourcecounts.pop(target, None)
             if oid in self.target2src:
                 removed.insert(oid)
                 sources = self.target2src.pop(oid)
+                if sourcecounts is not None:
+                    sourcecounts.pop(oid, None)
                 for source in sources:
                     oidset = self.src2target.get(source)
                     oidset.remove(oid)
+                    self._change_count(targetcounts, source, -1)
                     if not oidset:
                         del self.src2target[source]
+                        if targetcounts is not None:
+                            targetcounts.pop(source, None)
         return removed
     
+class NavNode(object):
+    """ A node of the navigation tree returned by
+    :meth:`ObjectMap.navigate`, representing one object.  ``objectid``,
+    ``path`` (a path tuple) and ``name`` describe the object; ``children``
+    is a list of ``NavNode`` objects computed the first time it is
+    accessed."""
+
+    def __init__(self, objectmap, key, objectid, depth, limits, sort):
+        self.objectmap = objectmap
+        self.key = key
+        self.objectid = objectid
+        self.depth = depth
+        self.limits = limits
+        self.sort = sort
+
+    @property
+    def path(self):
+        return self.objectmap._path_for_key(self.key)
+
+    @property
+    def name(self):
+        return self.path[-1]
+
+    def _level_set(self):
+        omap = self.objectmap.pathindex.get(self.key)
+        if omap is not None:
+            return omap.get(1)
+
+    @property
+    def children(self):
+        children = self.__dict__.get('_children')
+        if children is None:
+            if self.depth < 1:
+                children = []
+            else:
+                children = list(self.objectmap._nav_children(
+                    self.key, self.depth, self.limits, self.sort))
+            self._children = children
+        return children
+
+    def __repr__(self):
+        return '<NavNode %s>' % (u'/'.join(self.path) or u'/',)
+
 def node_path_tuple(resource):
     # cant use resource_path_tuple from pyramid, it wants everything to 
     # have a __name__
@@ -515,13 +1661,20 @@ def object_will_be_added(event):
             )
     basepath = resource_path_tuple(event.parent)
     name = event.name
+    if getattr(event, 'moving', False):
+        old_path_tuple = objectmap.path_for(oid_of(obj, None))
+        if old_path_tuple is not None:
+            objectmap.move(old_path_tuple, basepath + (name,))
+            return
+    nodes = []
     for node in postorder(obj):
         node_path = node_path_tuple(node)
         path_tuple = basepath + (name,) + node_path[1:]
-        # the below gives node an objectid; if the will-be-added event is
-        # the result of a duplication, replace the oid of the node with a new
-        # one
-        objectmap.add(node, path_tuple, replace_oid=event.duplicating)
+        nodes.append((node, path_tuple))
+    # the below gives each node an objectid; if the will-be-added event is
+    # the result of a duplication, replace the oid of the node with a new
+    # one
+    objectmap.add_many(nodes, replace_oid=event.duplicating)
 
 @subscribe_removed()
 def object_removed(event):
@@ -533,6 +1686,10 @@ def object_removed(event):
     objectmap = find_objectmap(parent)
     if objectmap is None:
         return
+    if moving and getattr(event, 'moving_to', None) is not None:
+        # ``Folder.move`` adds the object to its new parent right away; the
+        # object map entries are moved then by ``object_will_be_added``
+        return
     objectid = oid_of(obj)
     objectmap.remove(objectid, references=not moving)
 
@@ -690,13 +1847,9 @@ def _multireference_property(
 
     def _get(self, resolve=resolve):
         objectmap = find_objectmap(self)
-        if orientation == 'source':
-            oids = objectmap.targetids(self, reftype)
-        else:
-            oids = objectmap.sourceids(self, reftype)
         return Multireference(
             self,
-            oids,
+            None,
             objectmap,
             reftype,
             ignore_missing,
@@ -765,6 +1918,11 @@ class Multireference(object):
     """ An iterable of objects (if ``resolve`` is true) or oids (if
     ``resolve`` is false).  Also supports the Python sequence protocol.
 
+    If ``oids`` is ``None``, the set of object identifiers implied by the
+    reference is looked up in ``objectmap`` when it is first needed and kept
+    until the relationship is changed via this multireference.  Objects are
+    only resolved when they are iterated over or indexed.
+
     Additionally supports ``connect``, ``disconnect``, and ``clear`` methods
     for mutating the relationships implied by the reference."""
     def __init__(
@@ -778,47 +1936,75 @@ class Multireference(object):
         orientation,
         ):
         self.context = context
-        self.oids = oids
+        self._oids = oids
+        self._lazy = oids is None
         self.objectmap = objectmap
         self.reftype = reftype
         self.ignore_missing = ignore_missing
         self.resolve = resolve
         self.orientation = orientation
 
+    @property
+    def oids(self):
+        """ The object identifiers implied by this multireference """
+        oids = self._oids
+        if oids is None:
+            if self.orientation == 'source':
+                oids = self.objectmap.targetids(self.context, self.reftype)
+            else:
+                oids = self.objectmap.sourceids(self.context, self.reftype)
+            self._oids = oids
+        return oids
+
+    def _changed(self):
+        if self._lazy:
+            self._oids = None
+
     def __nonzero__(self):
         """ Returns ``True`` if there are oids associated with this
         multireference, ``False`` if the oid list is empty. """
-        return bool(self.oids)
+        return bool(len(self))
 
     def __getitem__(self, i):
         """ Return the i'th element from the sequence of objects or object
-        ids"""
-        oid = self.oids[i]
+        ids, or a list of the elements in a slice of it.  Only the objects
+        in the slice are resolved."""
+        oids = self.oids
+        if isinstance(i, slice):
+            page = [oids[n] for n in range(*i.indices(len(oids)))]
+            if self.resolve:
+                return list(self.objectmap.objects_for(page))
+            return page
+        oid = oids[i]
         if self.resolve:
             return self.objectmap.object_for(oid)
         return oid
 
     def __contains__(self, other):
         """ Return ``True`` if ``other`` is a member of the sequence managed
-        by this multireference. """
-        if self.resolve:
-            object_for = self.objectmap.object_for
-            for oid in self.oids:
-                if object_for(oid) == other:
-                    return True
+        by this multireference.  ``other`` may be an object or an object
+        id; no object is resolved to answer."""
+        oid = oid_of(other, other)
+        if not isinstance(oid, (int, long)):
             return False
-        return other in self.oids
+        return oid in self.oids
 
     def __iter__(self):
         """ Return an iterable of object ids or objects. """
         if self.resolve:
-            return iter((self.objectmap.object_for(oid) for oid in self.oids))
+            return self.objectmap.objects_for(self.oids)
         return iter(self.oids)
 
     def __len__(self):
         """ Return the length of the sequence of objects implied by this
         multireference"""
-        return len(self.oids)
+        if self._oids is None:
+            # counted without loading the object identifiers
+            if self.orientation == 'source':
+                return self.objectmap.count_targets(
+                    self.context, self.reftype)
+            return self.objectmap.count_sources(self.context, self.reftype)
+        return len(self._oids)
 
     def connect(self, objects, ignore_missing=None):
         """ Connect ``objects`` to this reference's relationship. ``objects``
@@ -826,15 +2012,17 @@ class Multireference(object):
         if ignore_missing is None:
             ignore_missing = self.ignore_missing
         ctx_oid = oid_of(self.context)
-        for obj in objects:
-            try:
-                if self.orientation == 'source':
-                    self.objectmap.connect(ctx_oid, obj, self.reftype)
-                else:
-                    self.objectmap.connect(obj, ctx_oid, self.reftype)
-            except ValueError:
-                if not ignore_missing:
-                    raise
+        self._changed()
+        try:
+            if self.orientation == 'source':
+                self.objectmap.connect_many(
+                    ctx_oid, objects, self.reftype, ignore_missing)
+            else:
+                self.objectmap.connect_many_sources(
+                    objects, ctx_oid, self.reftype, ignore_missing)
+        except ValueError:
+            if not ignore_missing:
+                raise
 
     def disconnect(self, objects, ignore_missing=None):
         """ Disonnect ``objects`` to this reference's relationship. ``objects``
@@ -842,15 +2030,17 @@ class Multireference(object):
         if ignore_missing is None:
             ignore_missing = self.ignore_missing
         ctx_oid = oid_of(self.context)
-        for obj in objects:
-            try:
-                if self.orientation == 'source':
-                    self.objectmap.disconnect(ctx_oid, obj, self.reftype)
-                else:
-                    self.objectmap.disconnect(obj, ctx_oid, self.reftype)
-            except ValueError:
-                if not ignore_missing:
-                    raise
+        self._changed()
+        try:
+            if self.orientation == 'source':
+                self.objectmap.disconnect_many(
+                    ctx_oid, objects, self.reftype, ignore_missing)
+            else:
+                self.objectmap.disconnect_many_sources(
+                    objects, ctx_oid, self.reftype, ignore_missing)
+        except ValueError:
+            if not ignore_missing:
+                raise
 
     def clear(self):
         """ Clear all references in this relationship. """
@@ -0,0 +1,342 @@
+""" Compare an object map with the resource tree it describes and report
+or repair the differences.
+
+The tree is divided into disjoint subtrees (see ``plan_subtrees``) which
+are checked independently by ``check_subtree``, possibly in several
+processes, each with its own database connection.  The objects above those
+subtrees are checked by ``check_objectmap`` itself once every subtree has
+been checked.
+
+A problem is a ``(kind, path_tuple, objectid)`` tuple; ``kind`` is one of
+the keys of ``PROBLEMS``.
+"""
+
+from BTrees.Length import Length
+
+from pyramid.traversal import (
+    find_resource,
+    resource_path_tuple,
+    )
+
+from ..interfaces import IFolder
+from ..util import oid_of
+
+PROBLEMS = {
+    'unregistered': 'object has no objectid',
+    'missing': 'objectid of object is not in the object map',
+    'moved': 'objectid of object is mapped to another path',
+    'path': 'path of object is mapped to another objectid',
+    'stale': 'path in the object map has no object',
+    'pathindex': 'pathindex entry is wrong',
+    }
+
+def describe(problem):
+    """ Return a line of text describing ``problem`` """
+    kind, path_tuple, objectid = problem
+    path = '/'.join(path_tuple) or '/'
+    if objectid is None:
+        return '%s: %s' % (path, PROBLEMS[kind])
+    return '%s: %s (objectid %s)' % (path, PROBLEMS[kind], objectid)
+
+def _walk(resource, path_tuple, gc_interval=1000):
+    # Yield ``(path_tuple, object)`` for ``resource`` and every object below
+    # it without keeping the objects which were visited in memory.
+    stack = [(path_tuple, resource)]
+    n = 0
+    while stack:
+        path_tuple, obj = stack.pop()
+        yield path_tuple, obj
+        if IFolder.providedBy(obj):
+            for name, child in obj.items():
+                stack.append((path_tuple + (name,), child))
+        n += 1
+        jar = getattr(obj, '_p_jar', None)
+        if jar is not None and n % gc_interval == 0:
+            jar.cacheGC()
+
+def _find(root, path_tuple):
+    try:
+        return find_resource(root, path_tuple)
+    except KeyError:
+        return None
+
+def _child_paths(objectmap, resource, path_tuple):
+    # The paths of the children of ``path_tuple`` in the resource tree or in
+    # the object map.
+    paths = set()
+    if resource is not None and IFolder.providedBy(resource):
+        for name in resource.keys():
+            paths.add(path_tuple + (name,))
+    key = objectmap._key_for(path_tuple)
+    omap = key is not None and objectmap.pathindex.get(key) or None
+    if omap is not None and 1 in omap:
+        for objectid in omap[1]:
+            childkey = objectmap.objectid_to_path.get(objectid)
+            if childkey is not None:
+                paths.add(objectmap._path_for_key(childkey))
+    return sorted(paths)
+
+def plan_subtrees(objectmap, root, max_size=10000):
+    """ Divide the tree below ``root`` into disjoint subtrees to be checked
+    by ``check_subtree``.  A subtree with more than ``max_size`` objects (as
+    counted by the object map) is divided among its children.  Returns
+    ``(subtrees, shallow)``: two lists of path tuples, the second of which
+    holds ``root`` and the other objects which aren't part of any
+    subtree."""
+    root_path = resource_path_tuple(root)
+    subtrees = []
+    shallow = [root_path]
+    pending = [(root_path, root)]
+    while pending:
+        path_tuple, resource = pending.pop()
+        for child_path in _child_paths(objectmap, resource, path_tuple):
+            child = None
+            if resource is not None:
+                child = _find(resource, child_path[-1:])
+            if (objectmap.count_under(child_path) > max_size and
+                _child_paths(objectmap, child, child_path)):
+                shallow.append(child_path)
+                pending.append((child_path, child))
+            else:
+                subtrees.append(child_path)
+    return subtrees, shallow
+
+def _expected_levels(objectmap, live, prefix, shallow):
+    # {key:{level:[objectid, ...]}} for the pathindex entries within the
+    # subtree at ``prefix``, computed from ``live``
+    expected = {}
+    if shallow:
+        return expected
+    prefixlen = len(prefix)
+    for key, objectid in live.items():
+        for x in range(prefixlen, len(key) + 1):
+            levels = expected.setdefault(key[:x], {})
+            levels.setdefault(len(key) - x, []).append(objectid)
+    return expected
+
+def _entry_levels(objectmap, key):
+    omap = objectmap.pathindex.get(key)
+    if omap is None:
+        return {}
+    return dict([(level, list(oidset)) for level, oidset in omap.items()])
+
+def _counted(sizes):
+    # the subtree counts kept for the level sizes ``sizes``: level 0 isn't
+    # counted
+    return dict([(level, size) for level, size in sizes.items() if level])
+
+def _entry_counts(objectmap, key):
+    if objectmap.pathcounts is None:
+        return None
+    counts = objectmap.pathcounts.get(key)
+    if counts is None:
+        return {}
+    return dict([(level, length()) for level, length in counts.items()])
+
+def _set_entry(objectmap, key, levels):
+    # Replace the pathindex entry (and subtree counts) for ``key`` with
+    # ``levels``, a dictionary of ``{level:[objectid, ...]}``.
+    family = objectmap.family
+    pathcounts = objectmap.pathcounts
+    if not levels:
+        objectmap.pathindex.pop(key, None)
+        if pathcounts is not None:
+            pathcounts.pop(key, None)
+        return
+    omap = family.IO.BTree()
+    counts = family.IO.BTree()
+    for level, objectids in levels.items():
+        omap[level] = family.IF.TreeSet(objectids)
+        if level:
+            counts[level] = Length(len(omap[level]))
+    objectmap.pathindex[key] = omap
+    if pathcounts is not None:
+        if counts:
+            pathcounts[key] = counts
+        else:
+            pathcounts.pop(key, None)
+
+def check_subtree(objectmap, root, path_tuple, repair=False, shallow=False):
+    """ Compare the object map entries for the object at ``path_tuple`` and
+    every object below it with the objects in the resource tree rooted at
+    ``root``.  If ``shallow`` is true, only the object at ``path_tuple`` is
+    compared, and the pathindex entry for ``path_tuple`` is left to
+    ``check_objectmap``.  If ``repair`` is true, make the object map agree
+    with the resource tree.
+
+    Returns ``(problems, levels)``, where ``levels`` maps a path length to
+    the number of objects of that length found in the subtree."""
+    problems = []
+    levels = {}
+    live = {}
+
+    resource = _find(root, path_tuple)
+
+    if resource is not None:
+        if shallow:
+            nodes = [(path_tuple, resource)]
+        else:
+            nodes = _walk(resource, path_tuple)
+        for path, obj in nodes:
+            key = objectmap._key_for(path, create=repair)
+            objectid = oid_of(obj, None)
+            if objectid is None:
+                problems.append(('unregistered', path, None))
+                if not repair:
+                    continue
+                objectid = objectmap.new_objectid()
+                obj.__objectid__ = objectid
+            mapped = objectmap.objectid_to_path.get(objectid)
+            if mapped is None:
+                problems.append(('missing', path, objectid))
+            elif mapped != key:
+                problems.append(('moved', path, objectid))
+            elif objectmap.path_to_objectid.get(key) != objectid:
+                problems.append(('path', path, objectid))
+            levels[len(path)] = levels.get(len(path), 0) + 1
+            if key is not None:
+                live[key] = objectid
+
+    prefix = objectmap._key_for(path_tuple)
+    stored = {}
+
+    if prefix is not None:
+        if shallow:
+            items = [(prefix, objectmap.path_to_objectid.get(prefix))]
+        else:
+            items = objectmap.path_to_objectid.items(min=prefix)
+        prefixlen = len(prefix)
+        for key, objectid in items:
+            if key[:prefixlen] != prefix:
+                break
+            if objectid is None:
+                continue
+            stored[key] = objectid
+            if key not in live:
+                problems.append(
+                    ('stale', objectmap._path_for_key(key), objectid))
+
+    # every object must be a member of the level sets of its ancestors
+    # outside the subtree; whether those sets hold anything else is left
+    # to ``check_objectmap``
+    for key, objectid in live.items():
+        for x in range(1, len(prefix or ())):
+            omap = objectmap.pathindex.get(key[:x])
+            oidset = omap and omap.get(len(key) - x)
+            if not oidset or objectid not in oidset:
+                problems.append(
+                    ('pathindex', objectmap._path_for_key(key[:x]), objectid))
+
+    wrong = []
+    if prefix is not None:
+        expected = _expected_levels(objectmap, live, prefix, shallow)
+        keys = set(expected)
+        if not shallow:
+            for key in objectmap.pathindex.keys(min=prefix):
+                if key[:len(prefix)] != prefix:
+                    break
+                keys.add(key)
+        for key in sorted(keys):
+            levels_expected = expected.get(key, {})
+            for objectids in levels_expected.values():
+                objectids.sort()
+            counts = _entry_counts(objectmap, key)
+            if (_entry_levels(objectmap, key) != levels_expected or
+                (counts is not None and counts != _counted(dict(
+                    [(l, len(o)) for l, o in levels_expected.items()])))):
+                problems.append(
+                    ('pathindex', objectmap._path_for_key(key), None))
+                wrong.append((key, levels_expected))
+
+    if repair and problems:
+        for key, objectid in stored.items():
+            if key not in live:
+                del objectmap.path_to_objectid[key]
+                if objectmap.objectid_to_path.get(objectid) == key:
+                    del objectmap.objectid_to_path[objectid]
+        for key, objectid in live.items():
+            old = objectmap.objectid_to_path.get(objectid)
+            if old is not None and old != key:
+                if objectmap.path_to_objectid.get(old) == objectid:
+                    del objectmap.path_to_objectid[old]
+            objectmap.objectid_to_path[objectid] = key
+            objectmap.path_to_objectid[key] = objectid
+        for key, levels_expected in wrong:
+            _set_entry(objectmap, key, levels_expected)
+        objectmap._invalidate_resolved(
+            list(live.values()) + list(stored.values()))
+
+    return problems, levels
+
+def _check_entry(objectmap, path_tuple, expected, repair, force=False):
+    # Compare the sizes of the level sets of the pathindex entry for
+    # ``path_tuple`` with ``expected``.  When repairing, rebuild the entry
+    # from ``path_to_objectid`` if they differ or if ``force`` is true.
+    key = objectmap._key_for(path_tuple)
+    if key is None:
+        return []
+    omap = objectmap.pathindex.get(key) or {}
+    actual = dict([(level, len(oidset)) for level, oidset in omap.items()])
+    counts = _entry_counts(objectmap, key)
+    problems = []
+    if actual != expected or (
+        counts is not None and counts != _counted(expected)):
+        problems.append(('pathindex', path_tuple, None))
+    if repair and (problems or force):
+        levels = {}
+        for k, objectid in objectmap.path_to_objectid.items(min=key):
+            if k[:len(key)] != key:
+                break
+            levels.setdefault(len(k) - len(key), []).append(objectid)
+        _set_entry(objectmap, key, levels)
+    return problems
+
+def check_objectmap(objectmap, root, repair=False, max_size=10000,
+                    mapper=None):
+    """ Compare the whole object map with the resource tree rooted at
+    ``root`` and return a list of problems.  If ``repair`` is true, make
+    the object map agree with the resource tree.
+
+    The subtrees returned by ``plan_subtrees`` are checked by calling
+    ``mapper`` with a list of their paths; it must return the results of
+    calling ``check_subtree`` for each of them, in order.  The default
+    calls ``check_subtree`` in this process.  The objects outside those
+    subtrees are checked afterwards."""
+    subtrees, shallow = plan_subtrees(objectmap, root, max_size)
+
+    if mapper is None:
+        def mapper(paths):
+            return [check_subtree(objectmap, root, path, repair)
+                    for path in paths]
+
+    results = list(zip(subtrees, mapper(subtrees)))
+    for path_tuple in shallow:
+        results.append(
+            (path_tuple, check_subtree(
+                objectmap, root, path_tuple, repair, shallow=True)))
+
+    problems = []
+    rebuild = set()
+    for path_tuple, (subtree_problems, levels) in results:
+        for problem in subtree_problems:
+            kind, problem_path, objectid = problem
+            if kind == 'pathindex' and objectid is not None:
+                # an ancestor above a subtree is missing a member
+                rebuild.add(problem_path)
+            problems.append(problem)
+
+    for path_tuple in shallow:
+        expected = {}
+        pathlen = len(path_tuple)
+        for subtree_path, (subtree_problems, levels) in results:
+            if subtree_path[:pathlen] != path_tuple:
+                continue
+            for length, count in levels.items():
+                level = length - pathlen
+                expected[level] = expected.get(level, 0) + count
+        problems.extend(
+            _check_entry(
+                objectmap, path_tuple, expected, repair,
+                force=path_tuple in rebuild))
+
+    return problems
@@ -1,8 +1,10 @@
 import sys
 import unittest
+import mock
 from zope.interface import implementer
 
 from pyramid import testing
+from pyramid.traversal import resource_path_tuple
 
 IS_32_BIT = sys.maxsize == 2**32
 
@@ -13,11 +15,11 @@ class TestObjectMap(unittest.TestCase):
     def tearDown(self):
         testing.tearDown()
         
-    def _makeOne(self, root=None, family=None):
+    def _makeOne(self, root=None, family=None, intern_paths=False):
         from . import ObjectMap
         if root is None:
             root = DummyRoot()
-        return ObjectMap(root, family=family)
+        return ObjectMap(root, family=family, intern_paths=intern_paths)
 
     def test_ctor_alternate_family(self):
         import BTrees
@@ -59,6 +61,14 @@ class TestObjectMap(unittest.TestCase):
         result = inst.new_objectid()
         self.assertEqual(result, 5)
 
+    def test_ctor_objectid_allocator(self):
+        from . import ObjectMap
+        allocator = DummyAllocator()
+        inst = ObjectMap(DummyRoot(), objectid_allocator=allocator)
+        self.assertEqual(inst.objectid_allocator, allocator)
+        self.assertEqual(inst.new_objectid(), 42)
+        self.assertEqual(allocator.objectmaps, [inst])
+
     def test_objectid_for_object(self):
         obj = testing.DummyResource()
         inst = self._makeOne()
@@ -171,6 +181,84 @@ class TestObjectMap(unittest.TestCase):
         self.assertEqual(inst.objectid_to_path[1], (u'',))
         self.assertEqual(obj.__objectid__, 1)
         
+    def test_add_many(self):
+        inst = self._makeOne()
+        inst._v_nextid = 1
+        nodes = [(resource(path), split(path)) for path in
+                 ('/', '/a', '/a/b', '/a/c', '/z')]
+        result = inst.add_many(nodes)
+        self.assertEqual(result, [1, 2, 3, 4, 5])
+        self.assertEqual(nodes[2][0].__objectid__, 3)
+        expected = self._makeOne()
+        expected._v_nextid = 1
+        for obj, path_tuple in nodes:
+            expected.add(Dummy(), path_tuple)
+        self.assertEqual(dict(inst.objectid_to_path),
+                         dict(expected.objectid_to_path))
+        self.assertEqual(dict(inst.path_to_objectid),
+                         dict(expected.path_to_objectid))
+        self.assertEqual(list(inst.pathindex.keys()),
+                         list(expected.pathindex.keys()))
+        for k, omap in expected.pathindex.items():
+            self.assertEqual(
+                dict([(l, list(s)) for l, s in inst.pathindex[k].items()]),
+                dict([(l, list(s)) for l, s in omap.items()]),
+                )
+
+    def test_add_many_interned(self):
+        inst = self._makeOne(intern_paths=True)
+        inst._v_nextid = 1
+        inst.add_many([(Dummy(), (u'',)), (Dummy(), (u'', u'a'))])
+        self.assertEqual(inst.objectid_for((u'', u'a')), 2)
+        self.assertEqual(sorted(inst.pathlookup((u'',))), [1, 2])
+
+    def test_add_many_keeps_existing_oid(self):
+        inst = self._makeOne()
+        obj = Dummy()
+        obj.__objectid__ = 5
+        self.assertEqual(inst.add_many([(obj, (u'',))]), [5])
+        self.assertEqual(inst.path_for(5), (u'',))
+
+    def test_add_many_replace_oid(self):
+        inst = self._makeOne()
+        inst._v_nextid = 1
+        obj = Dummy()
+        obj.__objectid__ = 5
+        self.assertEqual(inst.add_many([(obj, (u'',))], True), [1])
+        self.assertEqual(obj.__objectid__, 1)
+
+    def test_add_many_not_a_path_tuple(self):
+        inst = self._makeOne()
+        self.assertRaises(ValueError, inst.add_many, [(Dummy(), '/')])
+
+    def test_add_many_path_exists(self):
+        inst = self._makeOne()
+        inst.add(Dummy(), (u'',))
+        self.assertRaises(ValueError, inst.add_many,
+                          [(Dummy(), (u'', u'a')), (Dummy(), (u'',))])
+        self.assertEqual(inst.objectid_for((u'', u'a')), None)
+
+    def test_add_many_path_twice(self):
+        inst = self._makeOne()
+        self.assertRaises(ValueError, inst.add_many,
+                          [(Dummy(), (u'',)), (Dummy(), (u'',))])
+        self.assertEqual(len(inst.objectid_to_path), 0)
+
+    def test_add_many_objectid_exists(self):
+        inst = self._makeOne()
+        obj = Dummy()
+        obj.__objectid__ = 1
+        inst.objectid_to_path[1] = (u'', u'a')
+        self.assertRaises(ValueError, inst.add_many, [(obj, (u'',))])
+
+    def test_add_many_objectid_twice(self):
+        inst = self._makeOne()
+        obj = Dummy()
+        obj.__objectid__ = 1
+        self.assertRaises(ValueError, inst.add_many,
+                          [(obj, (u'',)), (obj, (u'', u'a'))])
+        self.assertEqual(len(inst.objectid_to_path), 0)
+
     def test_add_not_valid(self):
         inst = self._makeOne()
         self.assertRaises(AttributeError, inst.add, 'a', (u'',))
@@ -212,6 +300,297 @@ class TestObjectMap(unittest.TestCase):
         result = inst.remove((u'',))
         self.assertEqual(list(result), [])
 
+    def test_remove_subtree_keeps_siblings(self):
+        inst = self._makeOne()
+        inst._v_nextid = 1
+        for path in ('/', '/a', '/a/b', '/a/b/c', '/a/d', '/a/bb', '/z'):
+            thing = resource(path)
+            inst.add(thing, thing.path_tuple)
+        removed = inst.remove((u'', u'a', u'b'))
+        self.assertEqual(removed, set([3, 4]))
+        self.assertEqual(
+            list(inst.pathindex.keys()),
+            [(u'',), (u'', u'a'), (u'', u'a', u'bb'), (u'', u'a', u'd'),
+             (u'', u'z')]
+            )
+        root = inst.pathindex[(u'',)]
+        self.assertEqual(sorted(root.keys()), [0, 1, 2])
+        self.assertEqual(list(root[2]), [5, 6])
+        a = inst.pathindex[(u'', u'a')]
+        self.assertEqual(sorted(a.keys()), [0, 1])
+        self.assertEqual(list(a[1]), [5, 6])
+        self.assertEqual(sorted(inst.objectid_to_path.keys()), [1, 2, 5, 6, 7])
+        self.assertEqual(len(inst.path_to_objectid), 5)
+
+    def _makeTree(self, inst, *paths):
+        inst._v_nextid = 1
+        for path in paths:
+            thing = resource(path)
+            inst.add(thing, thing.path_tuple)
+
+    def _assertConsistent(self, inst):
+        # compare the object map to one built from scratch with its paths
+        fresh = self._makeOne()
+        for oid, path in inst.objectid_to_path.items():
+            fresh._v_nextid = oid
+            fresh.add(Dummy(), path)
+        self.assertEqual(
+            dict(inst.path_to_objectid), dict(fresh.path_to_objectid))
+        self.assertEqual(list(inst.pathindex.keys()),
+                         list(fresh.pathindex.keys()))
+        for k, omap in fresh.pathindex.items():
+            self.assertEqual(
+                dict([(l, list(s)) for l, s in inst.pathindex[k].items()]),
+                dict([(l, list(s)) for l, s in omap.items()]),
+                )
+        self._assertCounts(inst)
+
+    def _assertCounts(self, inst):
+        # the subtree counts match the sizes of the pathindex level sets
+        # below level 0; leaves have no counts
+        expected = {}
+        for k, omap in inst.pathindex.items():
+            sizes = dict([(l, len(s)) for l, s in omap.items(min=1)])
+            if sizes:
+                expected[k] = sizes
+        self.assertEqual(
+            dict([(k, dict([(l, c()) for l, c in counts.items()]))
+                  for k, counts in inst.pathcounts.items()]),
+            expected)
+
+    def test_move_rename(self):
+        inst = self._makeOne()
+        self._makeTree(inst, '/', '/a', '/a/b', '/a/b/c', '/z')
+        root_before = dict(inst.pathindex[(u'',)])
+        moved = inst.move((u'', u'a'), (u'', u'x'))
+        self.assertEqual(moved, set([2, 3, 4]))
+        self.assertEqual(inst.path_for(3), (u'', u'x', u'b'))
+        self.assertEqual(inst.objectid_for((u'', u'x', u'b', u'c')), 4)
+        self.assertEqual(inst.objectid_for((u'', u'a')), None)
+        # same depth: the root level sets are untouched
+        self.assertEqual(dict(inst.pathindex[(u'',)]), root_before)
+        self._assertConsistent(inst)
+
+    def test_move_deeper(self):
+        inst = self._makeOne()
+        self._makeTree(inst, '/', '/a', '/a/b', '/a/b/c', '/z', '/z/y')
+        inst.move((u'', u'a', u'b'), (u'', u'z', u'y', u'b'))
+        self.assertEqual(inst.path_for(4), (u'', u'z', u'y', u'b', u'c'))
+        self.assertEqual(sorted(inst.pathlookup((u'', u'a'))), [2])
+        self.assertEqual(sorted(inst.pathlookup((u'', u'z'))), [3, 4, 5, 6])
+        self._assertConsistent(inst)
+
+    def test_move_shallower(self):
+        inst = self._makeOne()
+        self._makeTree(inst, '/', '/a', '/a/b', '/a/b/c', '/a/b/c/d')
+        inst.move((u'', u'a', u'b', u'c'), (u'', u'c'))
+        self.assertEqual(inst.path_for(5), (u'', u'c', u'd'))
+        self.assertEqual(
+            sorted(inst.pathlookup((u'',), depth=1)), [1, 2, 4])
+        self._assertConsistent(inst)
+
+    def test_move_interned(self):
+        inst = self._makeOne(intern_paths=True)
+        self._makeTree(inst, '/', '/a', '/a/b', '/z')
+        inst.move((u'', u'a'), (u'', u'z', u'new'))
+        self.assertEqual(inst.path_for(3), (u'', u'z', u'new', u'b'))
+        self.assertEqual(sorted(inst.pathlookup((u'', u'z'))), [2, 3, 4])
+        self.assertEqual(list(inst.pathlookup((u'', u'a'))), [])
+
+    def test_move_keeps_references(self):
+        inst = self._makeOne()
+        self._makeTree(inst, '/', '/a', '/z')
+        inst.connect(2, 3, 'ref')
+        inst.move((u'', u'a'), (u'', u'b'))
+        self.assertEqual(list(inst.targetids(2, 'ref')), [3])
+
+    def test_move_not_path_tuples(self):
+        inst = self._makeOne()
+        self.assertRaises(ValueError, inst.move, '/a', (u'', u'b'))
+
+    def test_move_old_path_missing(self):
+        inst = self._makeOne()
+        self._makeTree(inst, '/')
+        self.assertRaises(ValueError, inst.move, (u'', u'a'), (u'', u'b'))
+
+    def test_move_new_path_exists(self):
+        inst = self._makeOne()
+        self._makeTree(inst, '/', '/a', '/b')
+        self.assertRaises(ValueError, inst.move, (u'', u'a'), (u'', u'b'))
+
+    def test_move_into_itself(self):
+        inst = self._makeOne()
+        self._makeTree(inst, '/', '/a')
+        self.assertRaises(
+            ValueError, inst.move, (u'', u'a'), (u'', u'a', u'b'))
+
+    def test__remove_from_level_nonempty(self):
+        inst = self._makeOne()
+        IF = inst.family.IF
+        oidset = IF.TreeSet([1, 2, 3])
+        omap = {1:oidset}
+        inst._remove_from_level(omap, 1, omap[1], IF.Set([3]))
+        self.assertTrue(omap[1] is oidset)
+        self.assertEqual(list(omap[1]), [1, 2])
+
+    def test__remove_from_level_empty(self):
+        inst = self._makeOne()
+        IF = inst.family.IF
+        omap = {1:IF.TreeSet([1])}
+        inst._remove_from_level(omap, 1, omap[1], IF.Set([1]))
+        self.assertEqual(omap, {})
+
+    def test__remove_from_level_not_member(self):
+        inst = self._makeOne()
+        IF = inst.family.IF
+        omap = {1:IF.TreeSet([1])}
+        inst._remove_from_level(omap, 1, omap[1], IF.Set([2]))
+        self.assertEqual(list(omap[1]), [1])
+
+    def test__remove_from_level_many_nonempty(self):
+        inst = self._makeOne()
+        IF = inst.family.IF
+        omap = {1:IF.Set([1, 2, 3])}
+        inst._remove_from_level(omap, 1, omap[1], IF.Set([1, 3, 4]))
+        self.assertEqual(omap[1].__class__, IF.TreeSet)
+        self.assertEqual(list(omap[1]), [2])
+
+    def test__remove_from_level_many_empty(self):
+        inst = self._makeOne()
+        IF = inst.family.IF
+        omap = {1:IF.TreeSet([1, 2])}
+        inst._remove_from_level(omap, 1, omap[1], IF.Set([1, 2]))
+        self.assertEqual(omap, {})
+
+    def test_add_uses_tree_sets(self):
+        inst = self._makeOne()
+        inst.add(Dummy(), (u'', u'a'))
+        inst.add_many([(Dummy(), (u'', u'b'))])
+        omap = inst.pathindex[(u'',)]
+        self.assertEqual(omap[1].__class__, inst.family.IF.TreeSet)
+        self.assertEqual(len(omap[1]), 2)
+
+    def test_convert_level_sets(self):
+        inst = self._makeOne()
+        IF = inst.family.IF
+        inst.pathindex[(u'',)] = omap = inst.family.IO.BTree()
+        omap[0] = IF.Set([1])
+        omap[1] = tree = IF.TreeSet([2])
+        inst.convert_level_sets()
+        self.assertEqual(omap[0].__class__, IF.TreeSet)
+        self.assertEqual(list(omap[0]), [1])
+        self.assertTrue(omap[1] is tree)
+
+    def test_count_under(self):
+        inst = self._makeOne()
+        self._makeTree(inst, '/', '/a', '/a/b', '/a/b/c', '/z')
+        self._assertCounts(inst)
+        self.assertEqual(inst.count_under((u'',)), 5)
+        self.assertEqual(inst.count_under((u'',), depth=1), 3)
+        self.assertEqual(inst.count_under((u'',), depth=0), 1)
+        self.assertEqual(
+            inst.count_under((u'', u'a'), include_origin=False), 2)
+        self.assertEqual(
+            inst.count_under((u'',), depth=0, include_origin=False), 0)
+        self.assertEqual(inst.count_under((u'', u'nope')), 0)
+
+    def test_count_under_leaf(self):
+        inst = self._makeOne()
+        self._makeTree(inst, '/', '/a', '/a/b')
+        self.assertFalse((u'', u'a', u'b') in inst.pathcounts)
+        self.assertEqual(inst.count_under((u'', u'a', u'b')), 1)
+        self.assertEqual(
+            inst.count_under((u'', u'a', u'b'), include_origin=False), 0)
+
+    def test_count_under_traversable_object(self):
+        inst = self._makeOne()
+        obj = testing.DummyResource()
+        inst.add(obj, (u'',))
+        self.assertEqual(inst.count_under(obj), 1)
+
+    def test_count_under_matches_pathlookup(self):
+        inst = self._makeOne(intern_paths=True)
+        self._makeTree(inst, '/', '/a', '/a/b', '/a/b/c', '/a/d', '/z')
+        for path in ((u'',), (u'', u'a'), (u'', u'a', u'b'), (u'', u'q')):
+            for depth in (None, 0, 1, 2, 5):
+                for include_origin in (True, False):
+                    self.assertEqual(
+                        inst.count_under(path, depth, include_origin),
+                        len(inst.pathlookup(path, depth, include_origin)))
+
+    def test_count_under_add_many(self):
+        inst = self._makeOne()
+        inst.add(Dummy(), (u'',))
+        inst.add_many([(Dummy(), (u'', u'a')),
+                       (Dummy(), (u'', u'a', u'b')),
+                       (Dummy(), (u'', u'a', u'c'))])
+        self._assertCounts(inst)
+        self.assertEqual(inst.count_under((u'', u'a'), depth=1), 3)
+
+    def test_count_under_after_remove(self):
+        inst = self._makeOne()
+        self._makeTree(inst, '/', '/a', '/a/b', '/a/b/c', '/a/d', '/z')
+        inst.remove((u'', u'a', u'b'))
+        self._assertCounts(inst)
+        self.assertEqual(inst.count_under((u'',)), 4)
+        self.assertEqual(inst.count_under((u'', u'a', u'b')), 0)
+
+    def test_count_under_after_remove_many(self):
+        inst = self._makeOne()
+        self._makeTree(inst, '/', '/a', '/a/b', '/a/b/c', '/z')
+        inst.remove((u'', u'a'))
+        self._assertCounts(inst)
+        self.assertEqual(inst.count_under((u'',), depth=2), 2)
+
+    def test_count_under_no_pathcounts(self):
+        inst = self._makeOne()
+        self._makeTree(inst, '/', '/a', '/a/b')
+        del inst.pathcounts
+        inst.remove((u'', u'a', u'b'))
+        self.assertEqual(inst.count_under((u'',)), 2)
+        self.assertEqual(inst.count_under((u'',), depth=0), 1)
+
+    def test_build_pathcounts(self):
+        inst = self._makeOne()
+        self._makeTree(inst, '/', '/a', '/a/b', '/z')
+        del inst.pathcounts
+        inst.build_pathcounts()
+        self._assertCounts(inst)
+        self.assertEqual(inst.count_under((u'', u'a')), 2)
+
+    def test_pathintersect_filters_objectids(self):
+        inst = self._makeOne()
+        inst._pathintersect_ratio = 100
+        self._makeTree(inst, '/', '/a', '/a/b', '/a/b/c', '/z')
+        IF = inst.family.IF
+        self.assertEqual(
+            list(inst.pathintersect(IF.Set([3, 5, 99]), (u'', u'a'))), [3])
+        self.assertEqual(
+            list(inst.pathintersect([2, 4], (u'', u'a'), depth=1)), [2])
+        self.assertEqual(
+            list(inst.pathintersect([2, 3], (u'', u'a'),
+                                    include_origin=False)), [3])
+
+    def test_pathintersect_intersects_level_sets(self):
+        inst = self._makeOne()
+        inst._pathintersect_ratio = 0
+        self._makeTree(inst, '/', '/a', '/a/b', '/a/b/c', '/z')
+        IF = inst.family.IF
+        result = inst.pathintersect(IF.Set([3, 5, 99]), (u'', u'a'))
+        self.assertEqual(result.__class__, IF.Set)
+        self.assertEqual(list(result), [3])
+        self.assertEqual(
+            list(inst.pathintersect([2, 4], (u'', u'a'), depth=1)), [2])
+        self.assertEqual(
+            list(inst.pathintersect([2, 3], (u'', u'a'),
+                                    include_origin=False)), [3])
+
+    def test_pathintersect_nothing(self):
+        inst = self._makeOne(intern_paths=True)
+        self._makeTree(inst, '/', '/a')
+        self.assertEqual(list(inst.pathintersect([], (u'',))), [])
+        self.assertEqual(list(inst.pathintersect([1], (u'', u'nope'))), [])
+
     def test_pathlookup_not_valid(self):
         inst = self._makeOne()
         self.assertRaises(ValueError, inst.pathlookup, 1)
@@ -332,6 +711,107 @@ class TestObjectMap(unittest.TestCase):
         result = inst.navgen(a, 0)
         self.assertEqual(result, [])
         
+    def _makeNavTree(self, inst):
+        # objectids are assigned in the reverse order of names
+        inst._v_nextid = 1
+        for path in ('/', '/z', '/z/2', '/z/1', '/m', '/m/b', '/m/a',
+                     '/a', '/a/y/x'):
+            thing = resource(path)
+            inst.add(thing, thing.path_tuple)
+
+    def _names(self, nodes):
+        return [node.name for node in nodes]
+
+    def test_navigate_lazy(self):
+        inst = self._makeOne()
+        self._makeNavTree(inst)
+        nodes = list(inst.navigate((u'',), 2))
+        self.assertEqual(self._names(nodes), [u'z', u'm', u'a'])
+        self.assertEqual([node.objectid for node in nodes], [2, 5, 8])
+        self.assertFalse('_children' in nodes[0].__dict__)
+        self.assertEqual(self._names(nodes[0].children), [u'2', u'1'])
+        self.assertEqual(nodes[0].children[0].path, (u'', u'z', u'2'))
+        self.assertEqual(nodes[0].children[0].children, [])
+        self.assertEqual(repr(nodes[0]), '<NavNode /z>')
+
+    def test_navigate_skips_paths_without_objects(self):
+        inst = self._makeOne()
+        self._makeNavTree(inst)
+        nodes = list(inst.navigate((u'', u'a'), 2))
+        self.assertEqual(nodes, [])
+        nodes = list(inst.navigate((u'', u'a'), 2, sort=True))
+        self.assertEqual(nodes, [])
+
+    def test_navigate_nodepth(self):
+        inst = self._makeOne()
+        self._makeNavTree(inst)
+        self.assertEqual(list(inst.navigate((u'',), 0)), [])
+
+    def test_navigate_notexist(self):
+        inst = self._makeOne(intern_paths=True)
+        self.assertEqual(list(inst.navigate((u'', u'nope'), 1)), [])
+
+    def test_navigate_limit(self):
+        inst = self._makeOne()
+        self._makeNavTree(inst)
+        nodes = list(inst.navigate((u'',), 2, limits=1))
+        self.assertEqual(self._names(nodes), [u'z'])
+        self.assertEqual(self._names(nodes[0].children), [u'2'])
+
+    def test_navigate_limits_per_level(self):
+        inst = self._makeOne()
+        self._makeNavTree(inst)
+        nodes = list(inst.navigate((u'',), 2, limits=[2]))
+        self.assertEqual(self._names(nodes), [u'z', u'm'])
+        self.assertEqual(self._names(nodes[1].children), [u'b', u'a'])
+        nodes = list(inst.navigate((u'',), 2, limits=[None, 0]))
+        self.assertEqual(self._names(nodes), [u'z', u'm', u'a'])
+        self.assertEqual(nodes[0].children, [])
+
+    def test_navigate_sort(self):
+        inst = self._makeOne()
+        self._makeNavTree(inst)
+        nodes = list(inst.navigate((u'',), 2, limits=2, sort=True))
+        self.assertEqual(self._names(nodes), [u'a', u'm'])
+        self.assertEqual(self._names(nodes[1].children), [u'a', u'b'])
+
+    def test_navigate_sort_interned(self):
+        inst = self._makeOne(intern_paths=True)
+        self._makeNavTree(inst)
+        nodes = list(inst.navigate((u'',), 2, sort=True))
+        self.assertEqual(self._names(nodes), [u'a', u'm', u'z'])
+        self.assertEqual(self._names(nodes[2].children), [u'1', u'2'])
+
+    def test_navigate_prefetch(self):
+        inst = self._makeOne()
+        self._makeNavTree(inst)
+        jar = DummyJar()
+        inst._p_jar = jar
+        nodes = list(inst.navigate((u'',), 2, prefetch=True))
+        self.assertEqual(self._names(nodes), [u'z', u'm', u'a'])
+        for node in nodes:
+            self.assertTrue('_children' in node.__dict__)
+            for child in node.children:
+                self.assertEqual(child.children, [])
+        # root's entry and level set, then those of its three children
+        self.assertEqual([len(objects) for objects in jar.prefetched],
+                         [1, 1, 3, 2])
+
+    def test_navigate_prefetch_sort(self):
+        inst = self._makeOne()
+        self._makeNavTree(inst)
+        jar = DummyJar()
+        inst._p_jar = jar
+        nodes = list(inst.navigate((u'',), 1, sort=True, prefetch=True))
+        self.assertEqual(self._names(nodes), [u'a', u'm', u'z'])
+        self.assertEqual([len(objects) for objects in jar.prefetched], [1])
+
+    def test_navigate_prefetch_unsupported(self):
+        inst = self._makeOne()
+        self._makeNavTree(inst)
+        nodes = list(inst.navigate((u'',), 1, prefetch=True))
+        self.assertEqual(self._names(nodes), [u'z', u'm', u'a'])
+
     def test_functional(self):
 
         def l(path, depth=None, include_origin=True):
@@ -479,6 +959,92 @@ class TestObjectMap(unittest.TestCase):
         assert dict(objmap.objectid_to_path) == {}
         assert dict(objmap.path_to_objectid) == {}
 
+    def test_ctor_intern_paths(self):
+        inst = self._makeOne(intern_paths=True)
+        self.assertEqual(inst.segment_ids.__class__.__name__, 'OLBTree')
+        self.assertEqual(inst.segment_names.__class__.__name__, 'LOBTree')
+
+    def test_functional_interned(self):
+        objmap = self._makeOne(intern_paths=True)
+        objmap._v_nextid = 1
+
+        root = resource('/')
+        a = resource('/a')
+        ab = resource('/a/b')
+        abc = resource('/a/b/c')
+        z = resource('/z')
+
+        for thing in root, a, ab, abc, z:
+            objmap.add(thing, thing.path_tuple)
+
+        self.assertEqual(
+            dict(objmap.segment_ids),
+            {u'':1, u'a':2, u'b':3, u'c':4, u'z':5}
+            )
+        self.assertEqual(
+            dict(objmap.objectid_to_path),
+            {1:(1,), 2:(1, 2), 3:(1, 2, 3), 4:(1, 2, 3, 4), 5:(1, 5)}
+            )
+        self.assertEqual(objmap.path_for(4), (u'', u'a', u'b', u'c'))
+        self.assertEqual(objmap.objectid_for((u'', u'a', u'b')), 3)
+        self.assertEqual(objmap.objectid_for(abc), 4)
+        self.assertEqual(objmap.objectid_for((u'', u'nope')), None)
+        self.assertEqual(sorted(objmap.pathlookup(a)), [2, 3, 4])
+        self.assertEqual(sorted(objmap.pathlookup((u'', u'nope'))), [])
+        self.assertEqual(
+            objmap.navgen(root, 1),
+            [{'path':(u'', u'a'), 'name':u'a', 'children':[]},
+             {'path':(u'', u'z'), 'name':u'z', 'children':[]}]
+            )
+
+        self.assertEqual(objmap.remove((u'', u'nope')), set())
+        self.assertEqual(objmap.remove(ab), set([3, 4]))
+        self.assertEqual(sorted(objmap.pathlookup(root)), [1, 2, 5])
+        self.assertEqual(
+            list(objmap.pathindex.keys()),
+            [(1,), (1, 2), (1, 5)]
+            )
+
+    def test_intern_paths(self):
+        objmap = self._makeOne()
+        objmap._v_nextid = 1
+
+        root = resource('/')
+        a = resource('/a')
+        ab = resource('/a/b')
+        z = resource('/z')
+
+        for thing in root, a, ab, z:
+            objmap.add(thing, thing.path_tuple)
+
+        before = sorted(objmap.pathlookup(root, depth=1))
+        objmap.intern_paths()
+
+        self.assertEqual(
+            dict(objmap.path_to_objectid),
+            {(1,):1, (1, 2):2, (1, 2, 3):3, (1, 4):4}
+            )
+        self.assertEqual(
+            list(objmap.pathindex.keys()),
+            [(1,), (1, 2), (1, 2, 3), (1, 4)]
+            )
+        self.assertEqual(sorted(objmap.pathlookup(root, depth=1)), before)
+        self.assertEqual(objmap.count_under(root, depth=1), len(before))
+        self._assertCounts(objmap)
+        self.assertEqual(objmap.path_for(3), (u'', u'a', u'b'))
+        self.assertEqual(objmap.objectid_for(z), 4)
+
+        # new adds are interned too
+        ac = resource('/a/c')
+        objmap.add(ac, ac.path_tuple)
+        self.assertEqual(objmap.objectid_to_path[5], (1, 2, 5))
+
+    def test_intern_paths_already_interned(self):
+        objmap = self._makeOne(intern_paths=True)
+        segment_ids = objmap.segment_ids
+        objmap.intern_paths()
+        self.assertTrue(objmap.segment_ids is segment_ids)
+
     def test__refids_for_source_missing(self):
         inst = self._makeOne()
         self.assertRaises(ValueError, inst._refids_for, 1, 2)
@@ -543,6 +1109,51 @@ class TestObjectMap(unittest.TestCase):
         inst.disconnect(1, 2, 'ref')
         self.assertTrue('ref' not in inst.referencemap)
 
+    def test_connect_many(self):
+        inst = self._makeOne()
+        for oid in (1, 2, 3):
+            inst.objectid_to_path[oid] = (u'', unicode(oid))
+        three = testing.DummyResource(__objectid__=3)
+        inst.connect_many(1, [2, three], 'ref')
+        self.assertEqual(list(inst.targetids(1, 'ref')), [2, 3])
+        self.assertEqual(inst.count_targets(1, 'ref'), 2)
+        self.assertEqual(list(inst.sourceids(3, 'ref')), [1])
+        inst.disconnect_many(1, [three], 'ref')
+        self.assertEqual(list(inst.targetids(1, 'ref')), [2])
+        self.assertEqual(list(inst.sourceids(3, 'ref')), [])
+
+    def test_connect_many_sources(self):
+        inst = self._makeOne()
+        for oid in (1, 2, 3):
+            inst.objectid_to_path[oid] = (u'', unicode(oid))
+        inst.connect_many_sources([1, 2], 3, 'ref')
+        self.assertEqual(list(inst.sourceids(3, 'ref')), [1, 2])
+        self.assertEqual(inst.count_sources(3, 'ref'), 2)
+        self.assertEqual(list(inst.targetids(2, 'ref')), [3])
+        inst.disconnect_many_sources([1, 2], 3, 'ref')
+        self.assertEqual(list(inst.sourceids(3, 'ref')), [])
+        self.assertEqual(inst.count_sources(3, 'ref'), 0)
+
+    def test_connect_many_missing_target(self):
+        inst = self._makeOne()
+        inst.objectid_to_path[1] = (u'',)
+        inst.objectid_to_path[2] = (u'', u'a')
+        self.assertRaises(ValueError, inst.connect_many, 1, [2, 3], 'ref')
+        # nothing is connected if any target is missing
+        self.assertEqual(list(inst.targetids(1, 'ref')), [])
+
+    def test_connect_many_missing_source(self):
+        inst = self._makeOne()
+        inst.objectid_to_path[2] = (u'', u'a')
+        self.assertRaises(ValueError, inst.connect_many, 1, [2], 'ref')
+
+    def test_connect_many_ignore_missing(self):
+        inst = self._makeOne()
+        inst.objectid_to_path[1] = (u'',)
+        inst.objectid_to_path[2] = (u'', u'a')
+        inst.connect_many_sources([2, 3], 1, 'ref', ignore_missing=True)
+        self.assertEqual(list(inst.sourceids(1, 'ref')), [2])
+
     def test_disconnect_with_objects(self):
         one = testing.DummyResource(__objectid__=1)
         two = testing.DummyResource(__objectid__=2)
@@ -566,6 +1177,192 @@ class TestObjectMap(unittest.TestCase):
         inst.referencemap = DummyReferenceMap(targetids=[2])
         self.assertEqual(list(inst.targetids(1, 'ref')), [2])
 
+    def _makeResourceTree(self, inst):
+        from zope.interface import directlyProvides
+        from pyramid.interfaces import ILocation
+        root = testing.DummyResource()
+        directlyProvides(root, ILocation)
+        inst.root = root
+        inst._v_nextid = 1
+        inst.add(root, (u'',))
+        for name in (u'a', u'b'):
+            folder = root[name] = testing.DummyResource()
+            inst.add(folder, (u'', name))
+            for childname in (u'x', u'y'):
+                child = folder[childname] = testing.DummyResource()
+                inst.add(child, (u'', name, childname))
+        return root
+
+    def test_objects_for(self):
+        inst = self._makeOne()
+        root = self._makeResourceTree(inst)
+        # 1: /, 2: /a, 3: /a/x, 4: /a/y, 5: /b, 6: /b/x, 7: /b/y
+        result = list(inst.objects_for([7, 3, 1, 4, 2, 6]))
+        self.assertEqual(
+            result,
+            [root['b']['y'], root['a']['x'], root, root['a']['y'], root['a'],
+             root['b']['x']])
+
+    def test_objects_for_traverses_each_parent_once(self):
+        from pyramid.traversal import find_resource
+        inst = self._makeOne()
+        self._makeResourceTree(inst)
+        traversed = []
+        def _find_resource(context, path_tuple):
+            traversed.append(path_tuple)
+            return find_resource(inst.root, path_tuple)
+        inst._find_resource = _find_resource
+        list(inst.objects_for([3, 6, 4, 7, 3]))
+        self.assertEqual(traversed, [(u'', u'a'), (u'', u'b')])
+
+    def test_objects_for_forgets_parents(self):
+        from pyramid.traversal import find_resource
+        inst = self._makeOne()
+        self._makeResourceTree(inst)
+        inst._objects_for_max_parents = 1
+        traversed = []
+        def _find_resource(context, path_tuple):
+            traversed.append(path_tuple)
+            return find_resource(inst.root, path_tuple)
+        inst._find_resource = _find_resource
+        list(inst.objects_for([3, 6, 4]))
+        self.assertEqual(traversed, [(u'', u'a'), (u'', u'b'), (u'', u'a')])
+
+    def test_objects_for_missing(self):
+        inst = self._makeOne()
+        root = self._makeResourceTree(inst)
+        del root['a']['x']
+        root['b'].subs[u'x'] = object()
+        inst.add(Dummy(), (u'', u'b', u'x', u'z')) # 8: parent isnt a folder
+        inst.add(Dummy(), (u'', u'c', u'z')) # 9: parent is missing
+        inst.add(Dummy(), (u'', u'b', u'z')) # 10: not in its parent
+        result = list(inst.objects_for([3, 4, 100, 8, 9, 10]))
+        self.assertEqual(result,
+                         [None, root['a']['y'], None, None, None, None])
+
+    def _makeCounting(self, inst):
+        from pyramid.traversal import find_resource
+        traversed = []
+        def _find_resource(context, path_tuple):
+            traversed.append(path_tuple)
+            return find_resource(inst.root, path_tuple)
+        inst._find_resource = _find_resource
+        return traversed
+
+    def test_object_for_cached(self):
+        inst = self._makeOne()
+        root = self._makeResourceTree(inst)
+        traversed = self._makeCounting(inst)
+        self.assertEqual(inst.object_for(3), root['a']['x'])
+        self.assertEqual(inst.object_for(3), root['a']['x'])
+        self.assertEqual(list(inst.objects_for([3])), [root['a']['x']])
+        self.assertEqual(traversed, [(u'', u'a', u'x')])
+        self.assertEqual(
+            inst.resolved_cache_stats(),
+            {'hits':2, 'misses':1, 'size':1, 'maxsize':1000})
+
+    def test_object_for_cached_by_objects_for(self):
+        inst = self._makeOne()
+        root = self._makeResourceTree(inst)
+        traversed = self._makeCounting(inst)
+        list(inst.objects_for([3, 4]))
+        self.assertEqual(inst.object_for(4), root['a']['y'])
+        self.assertEqual(traversed, [(u'', u'a')])
+
+    def test_object_for_not_cached_with_context(self):
+        inst = self._makeOne()
+        root = self._makeResourceTree(inst)
+        traversed = self._makeCounting(inst)
+        inst.object_for(3, root)
+        inst.object_for(3, root)
+        self.assertEqual(len(traversed), 2)
+        self.assertEqual(inst.resolved_cache_stats()['size'], 0)
+
+    def test_object_for_missing_not_cached(self):
+        inst = self._makeOne()
+        root = self._makeResourceTree(inst)
+        del root['a']['x']
+        traversed = self._makeCounting(inst)
+        self.assertEqual(inst.object_for(3), None)
+        self.assertEqual(inst.object_for(3), None)
+        self.assertEqual(len(traversed), 2)
+
+    def test_object_for_cache_disabled(self):
+        inst = self._makeOne()
+        self._makeResourceTree(inst)
+        inst.resolved_cache_size = 0
+        traversed = self._makeCounting(inst)
+        inst.object_for(3)
+        list(inst.objects_for([3]))
+        self.assertEqual(len(traversed), 2)
+        self.assertEqual(
+            inst.resolved_cache_stats(),
+            {'hits':0, 'misses':0, 'size':0, 'maxsize':0})
+
+    def test_object_for_cache_invalidated_by_remove(self):
+        inst = self._makeOne()
+        root = self._makeResourceTree(inst)
+        inst.object_for(3)
+        inst.object_for(4)
+        inst.remove(3)
+        del root['a']['x']
+        self.assertEqual(inst.object_for(3), None)
+        self.assertEqual(inst.resolved_cache_stats()['size'], 1)
+
+    def test_object_for_cache_invalidated_by_move(self):
+        inst = self._makeOne()
+        root = self._makeResourceTree(inst)
+        inst.object_for(3)
+        inst.move((u'', u'a'), (u'', u'c'))
+        root['c'] = root['a']
+        del root['a']
+        self.assertEqual(inst.resolved_cache_stats()['size'], 0)
+        self.assertEqual(inst.object_for(3), root['c']['x'])
+
+    def test_object_for_cache_invalidated_by_add(self):
+        inst = self._makeOne()
+        self._makeResourceTree(inst)
+        inst.resolved_cache_stats()
+        inst._v_resolved.put(100, Dummy())
+        inst._v_resolved.put(101, Dummy())
+        one, two = Dummy(), Dummy()
+        one.__objectid__ = 100
+        two.__objectid__ = 101
+        inst.add(one, (u'', u'c'))
+        self.assertEqual(inst._v_resolved.get(100), None)
+        inst.add_many([(two, (u'', u'd'))])
+        self.assertEqual(inst._v_resolved.get(101), None)
+
+    def test_object_for_cache_scoped_to_transaction(self):
+        inst = self._makeOne()
+        self._makeResourceTree(inst)
+        jar = DummyJar()
+        inst._p_jar = jar
+        traversed = self._makeCounting(inst)
+        inst.object_for(3)
+        inst.object_for(3)
+        self.assertEqual(len(traversed), 1)
+        jar.transaction_manager.txn = object()
+        inst.object_for(3)
+        self.assertEqual(len(traversed), 2)
+
+    def test_count_sources(self):
+        inst = self._makeOne()
+        inst.objectid_to_path[1] = (u'',)
+        inst.referencemap = DummyReferenceMap(sourceids=[2, 3])
+        self.assertEqual(inst.count_sources(1, 'ref'), 2)
+
+    def test_count_targets(self):
+        inst = self._makeOne()
+        inst.objectid_to_path[1] = (u'',)
+        inst.referencemap = DummyReferenceMap(targetids=[2])
+        self.assertEqual(inst.count_targets(1, 'ref'), 1)
+
+    def test_count_not_in_objectmap(self):
+        inst = self._makeOne()
+        self.assertRaises(ValueError, inst.count_sources, 1, 'ref')
+        self.assertRaises(ValueError, inst.count_targets, 1, 'ref')
+
     def test_sources(self):
         inst = self._makeOne()
         inst.objectid_to_path[1] = (u'',)
@@ -573,7 +1370,8 @@ class TestObjectMap(unittest.TestCase):
         inst.objectid_to_path[3] = (u'', u'b')
         inst.referencemap = DummyReferenceMap(sourceids=[2, 3])
         obj = object()
-        inst._find_resource = lambda *arg: obj
+        root = {u'a':obj, u'b':obj}
+        inst._find_resource = lambda *arg: root
         self.assertEqual(list(inst.sources(1, 'ref')), [obj, obj])
         
     def test_targets(self):
@@ -583,9 +1381,271 @@ class TestObjectMap(unittest.TestCase):
         inst.objectid_to_path[3] = (u'', u'b')
         inst.referencemap = DummyReferenceMap(targetids=[2, 3])
         obj = object()
-        inst._find_resource = lambda *arg: obj
+        root = {u'a':obj, u'b':obj}
+        inst._find_resource = lambda *arg: root
         self.assertEqual(list(inst.targets(1, 'ref')), [obj, obj])
         
+class TestConcurrentWriters(unittest.TestCase):
+    # Two connections change the same object map without seeing each
+    # other's changes; the second commit must resolve the conflict rather
+    # than raise a ConflictError.
+    def setUp(self):
+        import os
+        import tempfile
+        from ZODB.DB import DB
+        from ZODB.FileStorage import FileStorage
+        self.tempdir = tempfile.mkdtemp()
+        self.db = DB(FileStorage(os.path.join(self.tempdir, 'Data.fs')))
+
+    def tearDown(self):
+        import shutil
+        self.db.close()
+        shutil.rmtree(self.tempdir)
+
+    def _open(self):
+        import transaction
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        return tm, conn, conn.root().get('objectmap')
+
+    def _setUpObjectMap(self):
+        from . import ObjectMap
+        tm, conn, ignored = self._open()
+        objectmap = ObjectMap(Dummy())
+        objectmap._v_nextid = 1
+        for path in ('/', '/parent', '/parent/a', '/parent/b'):
+            objectmap.add(Dummy(), split(path))
+        conn.root()['objectmap'] = objectmap
+        tm.commit()
+        conn.close()
+
+    def test_add_distinct_children(self):
+        self._setUpObjectMap()
+        tm1, conn1, objectmap1 = self._open()
+        tm2, conn2, objectmap2 = self._open()
+        objectmap1._v_nextid = 100
+        objectmap1.add(Dummy(), (u'', u'parent', u'c'))
+        objectmap2._v_nextid = 200
+        objectmap2.add(Dummy(), (u'', u'parent', u'd'))
+        tm1.commit()
+        tm2.commit()
+        conn1.close()
+        conn2.close()
+        tm, conn, objectmap = self._open()
+        self.assertEqual(
+            sorted(objectmap.pathlookup((u'', u'parent'), depth=1,
+                                        include_origin=False)),
+            [3, 4, 100, 200])
+        self.assertEqual(sorted(objectmap.pathlookup((u'',))),
+                         [1, 2, 3, 4, 100, 200])
+        conn.close()
+
+    def test_add_and_remove_distinct_children(self):
+        self._setUpObjectMap()
+        tm1, conn1, objectmap1 = self._open()
+        tm2, conn2, objectmap2 = self._open()
+        objectmap1._v_nextid = 100
+        objectmap1.add(Dummy(), (u'', u'parent', u'c'))
+        # BTrees refuse to merge a change which removes the first member of
+        # a bucket, so remove the last one
+        objectmap2.remove((u'', u'parent', u'b'))
+        tm1.commit()
+        tm2.commit()
+        conn1.close()
+        conn2.close()
+        tm, conn, objectmap = self._open()
+        self.assertEqual(sorted(objectmap.pathlookup((u'',))),
+                         [1, 2, 3, 100])
+        conn.close()
+
+    def test_connect_distinct_sources(self):
+        self._setUpObjectMap()
+        tm, conn, objectmap = self._open()
+        objectmap.connect(3, 2, 'ref')
+        tm.commit()
+        conn.close()
+        tm1, conn1, objectmap1 = self._open()
+        tm2, conn2, objectmap2 = self._open()
+        objectmap1.connect(1, 2, 'ref')
+        objectmap2.connect(4, 2, 'ref')
+        tm1.commit()
+        tm2.commit()
+        conn1.close()
+        conn2.close()
+        tm, conn, objectmap = self._open()
+        self.assertEqual(list(objectmap.sourceids(2, 'ref')), [1, 3, 4])
+        conn.close()
+
+class TestResolvedObjectCache(unittest.TestCase):
+    def _makeOne(self, size=2):
+        from . import ResolvedObjectCache
+        return ResolvedObjectCache(size)
+
+    def test_get_put(self):
+        inst = self._makeOne()
+        ob = Dummy()
+        self.assertEqual(inst.get(1), None)
+        inst.put(1, ob)
+        self.assertEqual(inst.get(1), ob)
+        self.assertEqual(inst.stats(),
+                         {'hits':1, 'misses':1, 'size':1, 'maxsize':2})
+
+    def test_put_None(self):
+        inst = self._makeOne()
+        inst.put(1, None)
+        self.assertEqual(inst.stats()['size'], 0)
+
+    def test_bounded(self):
+        inst = self._makeOne()
+        for oid in (1, 2, 3):
+            inst.put(oid, Dummy())
+        self.assertEqual(inst.stats()['size'], 2)
+        self.assertEqual(inst.get(1), None)
+
+    def test_invalidate(self):
+        inst = self._makeOne()
+        inst.put(1, Dummy())
+        inst.put(2, Dummy())
+        inst.invalidate([1, 3])
+        self.assertEqual(inst.get(1), None)
+        self.assertNotEqual(inst.get(2), None)
+
+    def test_scope(self):
+        inst = self._makeOne()
+        txn1, txn2 = object(), object()
+        inst.scope(txn1)
+        inst.put(1, Dummy())
+        inst.scope(txn1)
+        self.assertNotEqual(inst.get(1), None)
+        inst.scope(txn2)
+        self.assertEqual(inst.get(1), None)
+        self.assertEqual(inst.hits, 1)
+        self.assertEqual(inst.misses, 1)
+
+class TestBlockObjectidAllocator(unittest.TestCase):
+    def _makeOne(self, block_size=3, start=1):
+        from . import BlockObjectidAllocator
+        return BlockObjectidAllocator(block_size=block_size, start=start)
+
+    def _makeObjectMap(self):
+        from . import ObjectMap
+        return ObjectMap(DummyRoot())
+
+    def test_reserve(self):
+        inst = self._makeOne()
+        self.assertEqual(inst.reserve(), (1, 4))
+        self.assertEqual(inst.reserve(), (4, 7))
+        self.assertEqual(inst.next_block, 7)
+
+    def test_new_objectid_contiguous(self):
+        inst = self._makeOne()
+        objectmap = self._makeObjectMap()
+        result = [inst.new_objectid(objectmap) for x in range(7)]
+        self.assertEqual(result, [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(inst.next_block, 10)
+
+    def test_new_objectid_skips_used(self):
+        inst = self._makeOne()
+        objectmap = self._makeObjectMap()
+        objectmap.objectid_to_path[2] = (u'',)
+        result = [inst.new_objectid(objectmap) for x in range(3)]
+        self.assertEqual(result, [1, 3, 4])
+
+    def test_new_objectid_skips_zero(self):
+        inst = self._makeOne(start=0)
+        objectmap = self._makeObjectMap()
+        self.assertEqual(inst.new_objectid(objectmap), 1)
+
+    def test_new_objectid_exhausted(self):
+        objectmap = self._makeObjectMap()
+        inst = self._makeOne(start=objectmap.family.maxint + 1)
+        self.assertRaises(ValueError, inst.new_objectid, objectmap)
+
+    def test_used_by_objectmap(self):
+        from . import ObjectMap
+        inst = self._makeOne()
+        objectmap = ObjectMap(DummyRoot(), objectid_allocator=inst)
+        objectmap.add(Dummy(), (u'',))
+        objectmap.add(Dummy(), (u'', u'a'))
+        self.assertEqual(sorted(objectmap.objectid_to_path.keys()), [1, 2])
+
+class TestBlockObjectidAllocatorStored(unittest.TestCase):
+    # the allocator stored in a database and used by several connections
+    def setUp(self):
+        from ZODB.DB import DB
+        from ZODB.MappingStorage import MappingStorage
+        from . import BlockObjectidAllocator
+        self.db = DB(MappingStorage())
+        tm, conn = self._open()
+        conn.root()['allocator'] = BlockObjectidAllocator(block_size=3)
+        tm.commit()
+        conn.close()
+        self.objectmap = self._makeObjectMap()
+
+    def tearDown(self):
+        self.db.close()
+
+    def _open(self):
+        import transaction
+        tm = transaction.TransactionManager()
+        return tm, self.db.open(transaction_manager=tm)
+
+    def _makeObjectMap(self):
+        from . import ObjectMap
+        return ObjectMap(DummyRoot())
+
+    def _allocator(self, conn):
+        return conn.root()['allocator']
+
+    def test_block_not_shared_before_commit(self):
+        tm1, conn1 = self._open()
+        tm2, conn2 = self._open()
+        inst1, inst2 = self._allocator(conn1), self._allocator(conn2)
+        self.assertEqual(inst1.new_objectid(self.objectmap), 1)
+        # the block reserved by the first transaction isn't committed yet,
+        # so the second one reserves the same block for itself; only one
+        # of them can commit
+        self.assertEqual(inst2.new_objectid(self.objectmap), 1)
+        tm1.commit()
+        from ZODB.POSException import ConflictError
+        self.assertRaises(ConflictError, tm2.commit)
+        tm2.abort()
+        # the committed block is then shared
+        self.assertEqual(inst2.new_objectid(self.objectmap), 2)
+        self.assertEqual(inst1.new_objectid(self.objectmap), 3)
+        conn1.close()
+        conn2.close()
+
+    def test_aborted_block_dropped(self):
+        tm, conn = self._open()
+        inst = self._allocator(conn)
+        self.assertEqual(inst.new_objectid(self.objectmap), 1)
+        tm.abort()
+        self.assertEqual(inst.new_objectid(self.objectmap), 1)
+        tm.commit()
+        self.assertEqual(inst.new_objectid(self.objectmap), 2)
+        conn.close()
+
+    def test_same_transaction_uses_pending_block(self):
+        tm, conn = self._open()
+        inst = self._allocator(conn)
+        result = [inst.new_objectid(self.objectmap) for x in range(4)]
+        self.assertEqual(result, [1, 2, 3, 4])
+        tm.commit()
+        self.assertEqual(inst.new_objectid(self.objectmap), 5)
+        self.assertEqual(inst.next_block, 7)
+        conn.close()
+
+    def test_other_process(self):
+        tm, conn = self._open()
+        inst = self._allocator(conn)
+        self.assertEqual(inst.new_objectid(self.objectmap), 1)
+        tm.commit()
+        with mock.patch('os.getpid', return_value=-1):
+            self.assertEqual(inst.new_objectid(self.objectmap), 4)
+        tm.abort()
+        conn.close()
+
 class TestReferenceSet(unittest.TestCase):
     def _makeOne(self):
         from . import ReferenceSet
@@ -635,6 +1695,46 @@ class TestReferenceSet(unittest.TestCase):
         self.assertEqual(list(refset.src2target[1]), [])
         self.assertEqual(list(refset.target2src[2]), [])
 
+    def test_connect_many(self):
+        refset = self._makeOne()
+        refset.connect(1, 2)
+        refset.connect_many(1, [2, 3, 4])
+        self.assertEqual(list(refset.src2target[1]), [2, 3, 4])
+        self.assertEqual(list(refset.target2src[4]), [1])
+        self.assertEqual(refset.count_targets(1), 3)
+        self.assertEqual(refset.count_sources(2), 1)
+
+    def test_connect_many_empty(self):
+        refset = self._makeOne()
+        refset.connect_many(1, [])
+        refset.connect_many_sources([], 1)
+        self.assertEqual(list(refset.src2target.keys()), [])
+        self.assertEqual(list(refset.target2src.keys()), [])
+
+    def test_connect_many_sources(self):
+        refset = self._makeOne()
+        refset.connect(2, 1)
+        refset.connect_many_sources([2, 3, 4], 1)
+        self.assertEqual(list(refset.target2src[1]), [2, 3, 4])
+        self.assertEqual(list(refset.src2target[3]), [1])
+        self.assertEqual(refset.count_sources(1), 3)
+        self.assertEqual(refset.count_targets(2), 1)
+
+    def test_disconnect_many(self):
+        refset = self._makeOne()
+        refset.connect_many(1, [2, 3, 4])
+        refset.disconnect_many(1, [2, 4, 5])
+        self.assertEqual(list(refset.src2target[1]), [3])
+        self.assertEqual(refset.count_targets(1), 1)
+        self.assertEqual(refset.count_sources(2), 0)
+
+    def test_disconnect_many_sources(self):
+        refset = self._makeOne()
+        refset.connect_many_sources([2, 3], 1)
+        refset.disconnect_many_sources([3], 1)
+        self.assertEqual(list(refset.target2src[1]), [2])
+        self.assertEqual(refset.count_sources(1), 1)
+
     def test_targetids(self):
         refset = self._makeOne()
         dummyset = DummyTreeSet([1])
@@ -677,6 +1777,59 @@ class TestReferenceSet(unittest.TestCase):
             {5:DummyTreeSet([3])}
             )
 
+    def test_count_targets_and_sources(self):
+        refset = self._makeOne()
+        refset.connect(1, 2)
+        refset.connect(1, 2)
+        refset.connect(1, 3)
+        refset.connect(4, 3)
+        self.assertEqual(refset.count_targets(1), 2)
+        self.assertEqual(refset.count_targets(4), 1)
+        self.assertEqual(refset.count_targets(2), 0)
+        self.assertEqual(refset.count_sources(3), 2)
+        self.assertEqual(refset.count_sources(2), 1)
+        self.assertEqual(refset.count_sources(1), 0)
+        self.assertEqual(refset.targetcounts[1].__class__.__name__, 'Length')
+
+    def test_count_after_disconnect(self):
+        refset = self._makeOne()
+        refset.connect(1, 2)
+        refset.connect(1, 3)
+        refset.disconnect(1, 2)
+        refset.disconnect(1, 2)
+        self.assertEqual(refset.count_targets(1), 1)
+        self.assertEqual(refset.count_sources(2), 0)
+        self.assertEqual(refset.count_sources(3), 1)
+
+    def test_count_after_remove(self):
+        refset = self._makeOne()
+        refset.connect(1, 2)
+        refset.connect(1, 3)
+        refset.connect(4, 1)
+        refset.connect(4, 3)
+        refset.remove([1])
+        self.assertEqual(refset.count_targets(1), 0)
+        self.assertEqual(refset.count_sources(1), 0)
+        self.assertEqual(refset.count_sources(2), 0)
+        self.assertEqual(refset.count_sources(3), 1)
+        self.assertEqual(refset.count_targets(4), 1)
+        self.assertFalse(1 in refset.targetcounts)
+        self.assertFalse(2 in refset.sourcecounts)
+
+    def test_count_without_counts(self):
+        # a reference set created before counts were kept
+        refset = self._makeOne()
+        del refset.targetcounts
+        del refset.sourcecounts
+        refset.connect(1, 2)
+        refset.connect(1, 3)
+        refset.disconnect(1, 3)
+        self.assertEqual(refset.count_targets(1), 1)
+        self.assertEqual(refset.count_sources(2), 1)
+        self.assertEqual(refset.count_sources(5), 0)
+        refset.remove([2])
+        self.assertEqual(refset.count_targets(1), 0)
+
 class TestReferenceMap(unittest.TestCase):
     def _makeOne(self, map=None):
         from . import ReferenceMap
@@ -685,6 +1838,92 @@ class TestReferenceMap(unittest.TestCase):
     def test_ctor(self):
         refs = self._makeOne()
         self.assertEqual(refs.refmap.__class__.__name__, 'OOBTree')
+        self.assertEqual(refs.reftypes.__class__.__name__, 'LOBTree')
+
+    def test_ctor_with_map(self):
+        refs = self._makeOne({})
+        self.assertEqual(refs.reftypes, None)
+
+    def test_connect_indexes_reftypes(self):
+        refs = self._makeOne()
+        refs.connect(1, 2, 'a')
+        refs.connect(1, 3, 'b')
+        self.assertEqual(list(refs.reftypes[1]), ['a', 'b'])
+        self.assertEqual(list(refs.reftypes[2]), ['a'])
+        self.assertEqual(list(refs.reftypes[3]), ['b'])
+
+    def test_disconnect_unindexes_reftypes(self):
+        refs = self._makeOne()
+        refs.connect(1, 2, 'a')
+        refs.connect(1, 3, 'a')
+        refs.connect(1, 3, 'b')
+        refs.disconnect(1, 2, 'a')
+        self.assertEqual(list(refs.reftypes[1]), ['a', 'b'])
+        self.assertFalse(2 in refs.reftypes)
+        refs.disconnect(1, 3, 'a')
+        self.assertEqual(list(refs.reftypes[1]), ['b'])
+        self.assertEqual(list(refs.reftypes[3]), ['b'])
+
+    def test_disconnect_unindexed_oid(self):
+        refs = self._makeOne()
+        refs.connect(1, 2, 'a')
+        del refs.reftypes[2]
+        refs.reftypes[1].remove('a')
+        refs.disconnect(1, 2, 'a')
+        self.assertFalse(1 in refs.reftypes)
+        self.assertFalse(2 in refs.reftypes)
+
+    def test_connect_many_indexes_reftypes(self):
+        refs = self._makeOne()
+        refs.connect_many(1, [2, 3], 'a')
+        refs.connect_many_sources([4], 1, 'b')
+        self.assertEqual(list(refs.reftypes[1]), ['a', 'b'])
+        self.assertEqual(list(refs.reftypes[3]), ['a'])
+        self.assertEqual(list(refs.reftypes[4]), ['b'])
+        self.assertEqual(list(refs.targetids(1, 'a')), [2, 3])
+        self.assertEqual(list(refs.sourceids(1, 'b')), [4])
+
+    def test_disconnect_many_unindexes_reftypes(self):
+        refs = self._makeOne()
+        refs.connect_many(1, [2, 3], 'a')
+        refs.connect_many_sources([4], 1, 'b')
+        refs.disconnect_many(1, [2, 3], 'a')
+        self.assertEqual(list(refs.reftypes[1]), ['b'])
+        self.assertFalse(2 in refs.reftypes)
+        refs.disconnect_many_sources([4], 1, 'b')
+        self.assertFalse(1 in refs.reftypes)
+        self.assertFalse(4 in refs.reftypes)
+
+    def test_disconnect_many_no_refset(self):
+        refs = self._makeOne()
+        refs.disconnect_many(1, [2], 'a')
+        refs.disconnect_many_sources([2], 1, 'a')
+        self.assertEqual(list(refs.reftypes.keys()), [])
+
+    def test_index_reftypes(self):
+        refs = self._makeOne()
+        refs.connect(1, 2, 'a')
+        refs.connect(3, 1, 'b')
+        refs.reftypes = None
+        refs.index_reftypes()
+        self.assertEqual(list(refs.reftypes[1]), ['a', 'b'])
+        self.assertEqual(list(refs.reftypes[2]), ['a'])
+        self.assertEqual(list(refs.reftypes[3]), ['b'])
+
+    def test_count_targets_no_refset(self):
+        refs = self._makeOne()
+        self.assertEqual(refs.count_targets(1, 'reftype'), 0)
+
+    def test_count_sources_no_refset(self):
+        refs = self._makeOne()
+        self.assertEqual(refs.count_sources(1, 'reftype'), 0)
+
+    def test_count_targets_and_sources(self):
+        refs = self._makeOne()
+        refs.connect(1, 2, 'reftype')
+        refs.connect(1, 3, 'reftype')
+        self.assertEqual(refs.count_targets(1, 'reftype'), 2)
+        self.assertEqual(refs.count_sources(3, 'reftype'), 1)
 
     def test_connect(self):
         refset = DummyReferenceSet()
@@ -731,6 +1970,24 @@ class TestReferenceMap(unittest.TestCase):
         refs.remove([1,2])
         self.assertEqual(L, [[1,2], [1,2]])
 
+    def test_remove_with_reftypes_index(self):
+        L = []
+        refs = self._makeOne()
+        refs.connect(1, 2, 'a')
+        refs.connect(3, 4, 'b')
+        refs.connect(5, 6, 'c')
+        for reftype, refset in refs.refmap.items():
+            def remove(oids, reftype=reftype, remove=refset.remove):
+                L.append((reftype, sorted(oids)))
+                return remove(oids)
+            refset.remove = remove
+        refs.remove([1, 4, 2, 7])
+        self.assertEqual(sorted(L), [('a', [1, 2]), ('b', [4])])
+        self.assertEqual(list(refs.targetids(1, 'a')), [])
+        self.assertEqual(list(refs.sourceids(4, 'b')), [])
+        self.assertEqual(list(refs.targetids(5, 'c')), [6])
+        self.assertEqual(sorted(refs.reftypes.keys()), [3, 5, 6])
+
 class Test_object_will_be_added(unittest.TestCase):
     def _callFUT(self, event):
         from . import object_will_be_added
@@ -789,6 +2046,38 @@ class Test_object_will_be_added(unittest.TestCase):
             [(two, ('', 'inter', 'one', 'two')), (one, ('', 'inter', 'one'))]
             )
         
+    def test_duplicating(self):
+        objectmap = DummyObjectMap()
+        site = _makeSite(objectmap=objectmap)
+        one = testing.DummyModel()
+        event = DummyEvent(one, site, duplicating=True)
+        event.name = 'one'
+        self._callFUT(event)
+        self.assertEqual(objectmap.added, [(one, ('', 'one'))])
+        self.assertTrue(objectmap.replace_oid)
+
+    def test_moving(self):
+        from ..interfaces import IFolder
+        objectmap = DummyObjectMap(paths={1:('', 'old')})
+        site = _makeSite(objectmap=objectmap)
+        one = testing.DummyModel(__provides__=IFolder, __objectid__=1)
+        event = DummyEvent(one, site, moving=True)
+        event.name = 'new'
+        self._callFUT(event)
+        self.assertEqual(objectmap.moved, [(('', 'old'), ('', 'new'))])
+        self.assertEqual(objectmap.added, [])
+
+    def test_moving_not_in_objectmap(self):
+        from ..interfaces import IFolder
+        objectmap = DummyObjectMap()
+        site = _makeSite(objectmap=objectmap)
+        one = testing.DummyModel(__provides__=IFolder)
+        event = DummyEvent(one, site, moving=True)
+        event.name = 'new'
+        self._callFUT(event)
+        self.assertEqual(objectmap.moved, [])
+        self.assertEqual(objectmap.added, [(one, ('', 'new'))])
+
     def test_object_has_a_parent(self):
         from ..interfaces import IFolder
         from pyramid.traversal import resource_path_tuple
@@ -836,6 +2125,16 @@ class Test_object_removed(unittest.TestCase):
         self.assertEqual(objectmap.removed, [1])
         self.assertFalse(objectmap.references_removed)
 
+    def test_moving_by_folder_move(self):
+        model = testing.DummyResource()
+        model.__objectid__ = 1
+        objectmap = DummyObjectMap()
+        site = _makeSite(objectmap=objectmap)
+        event = DummyEvent(model, site, moving=True)
+        event.moving_to = (site, 'b')
+        self._callFUT(event)
+        self.assertEqual(objectmap.removed, [])
+
 class Test_reference_sourceid_property(unittest.TestCase):
     def setUp(self):
         from substanced.interfaces import IFolder
@@ -1700,6 +2999,10 @@ class Test_multireference_target_property(unittest.TestCase):
         self.assertEqual(objectmap.disconnected, [])
 
 class TestMultireference(unittest.TestCase):
+    def _makeSet(self, oids):
+        import BTrees
+        return BTrees.family64.IF.Set(oids)
+
     def _makeOne(
         self,
         context,
@@ -1753,7 +3056,16 @@ class TestMultireference(unittest.TestCase):
     def test___contains___withresolve_True(self):
         objectmap = DummyObjectMap(result=object)
         inst = self._makeOne(None, [1], objectmap, resolve=True)
-        self.assertTrue(inst.__contains__(object))
+        obj = testing.DummyResource(__objectid__=1)
+        self.assertTrue(inst.__contains__(obj))
+
+    def test___contains___doesnt_resolve(self):
+        objectmap = DummyObjectMap()
+        objectmap.object_for = None
+        inst = self._makeOne(None, self._makeSet([1, 2]), objectmap, resolve=True)
+        self.assertTrue(inst.__contains__(2))
+        self.assertFalse(inst.__contains__(3))
+        self.assertFalse(inst.__contains__(testing.DummyResource()))
         
     def test___contains___withresolve_False_empty(self):
         objectmap = DummyObjectMap(result=object)
@@ -1778,6 +3090,60 @@ class TestMultireference(unittest.TestCase):
         inst = self._makeOne(None, [1], None)
         self.assertEqual(len(inst), 1)
 
+    def test___len__lazy_counts(self):
+        objectmap = DummyObjectMap(targetids=None)
+        objectmap.count_targets = lambda context, reftype: 3
+        inst = self._makeOne(None, None, objectmap)
+        self.assertEqual(len(inst), 3)
+        self.assertTrue(inst)
+
+    def test___len__lazy_counts_target(self):
+        objectmap = DummyObjectMap(sourceids=None)
+        objectmap.count_sources = lambda context, reftype: 0
+        inst = self._makeOne(None, None, objectmap, orientation='target')
+        self.assertEqual(len(inst), 0)
+        self.assertFalse(inst)
+
+    def test_oids_lazy(self):
+        objectmap = DummyObjectMap(targetids=self._makeSet([1, 2]),
+                                   sourceids=self._makeSet([3]))
+        inst = self._makeOne(None, None, objectmap)
+        self.assertEqual(list(inst.oids), [1, 2])
+        self.assertTrue(inst.oids is objectmap._targetids)
+        self.assertEqual(len(inst), 2)
+        inst = self._makeOne(None, None, objectmap, orientation='target')
+        self.assertEqual(list(inst.oids), [3])
+
+    def test_oids_lazy_refetched_after_change(self):
+        objectmap = DummyObjectMap(targetids=self._makeSet([1]))
+        context = self._makeContext()
+        inst = self._makeOne(context, None, objectmap)
+        self.assertEqual(list(inst), [1])
+        objectmap._targetids = self._makeSet([1, 2])
+        inst.connect([2])
+        self.assertEqual(list(inst), [1, 2])
+        objectmap._targetids = self._makeSet([2])
+        inst.disconnect([1])
+        self.assertEqual(list(inst), [2])
+
+    def test___getitem___slice(self):
+        inst = self._makeOne(None, self._makeSet([1, 2, 3, 4]), None)
+        self.assertEqual(inst[1:3], [2, 3])
+        self.assertEqual(inst[::2], [1, 3])
+        self.assertEqual(inst[-1], 4)
+
+    def test___getitem___slice_with_resolve(self):
+        objectmap = DummyObjectMap(result=object)
+        resolved = []
+        def objects_for(oids):
+            resolved.extend(oids)
+            return iter([object for oid in oids])
+        objectmap.objects_for = objects_for
+        inst = self._makeOne(None, self._makeSet([1, 2, 3, 4]), objectmap,
+                             resolve=True)
+        self.assertEqual(inst[2:10], [object, object])
+        self.assertEqual(resolved, [3, 4])
+
     def test_connect_zero(self):
         objectmap = DummyObjectMap()
         context = self._makeContext()
@@ -1898,9 +3264,181 @@ class Test_find_objectmap(unittest.TestCase):
         inst = Dummy()
         self.assertEqual(self._callFUT(inst), None)
 
+class Test_check_objectmap(unittest.TestCase):
+    def _callFUT(self, objectmap, root, **kw):
+        from .check import check_objectmap
+        return check_objectmap(objectmap, root, **kw)
+
+    def _makeTree(self):
+        from . import ObjectMap
+        from ..interfaces import IFolder
+        root = testing.DummyResource(__provides__=IFolder)
+        a = testing.DummyResource(__provides__=IFolder)
+        root['a'] = a
+        a['b'] = testing.DummyResource()
+        a['c'] = testing.DummyResource()
+        root['z'] = testing.DummyResource()
+        objectmap = ObjectMap(root)
+        objectmap._v_nextid = 1
+        for obj in (root, a, a['b'], a['c'], root['z']):
+            objectmap.add(obj, resource_path_tuple(obj))
+        return objectmap, root
+
+    def _assertRepaired(self, objectmap, root, **kw):
+        problems = self._callFUT(objectmap, root, repair=True, **kw)
+        self.assertTrue(problems)
+        self.assertEqual(self._callFUT(objectmap, root, **kw), [])
+        return problems
+
+    def test_consistent(self):
+        objectmap, root = self._makeTree()
+        self.assertEqual(self._callFUT(objectmap, root), [])
+        self.assertEqual(self._callFUT(objectmap, root, max_size=1), [])
+
+    def test_stale(self):
+        objectmap, root = self._makeTree()
+        objectmap.add(Dummy(), (u'', u'a', u'gone'))
+        problems = self._callFUT(objectmap, root)
+        self.assertEqual(
+            problems,
+            [('stale', (u'', u'a', u'gone'), 6),
+             ('pathindex', (u'', u'a'), None),
+             ('pathindex', (u'', u'a', u'gone'), None),
+             ('pathindex', (u'',), None)])
+        self._assertRepaired(objectmap, root)
+        self.assertEqual(objectmap.objectid_for((u'', u'a', u'gone')), None)
+        self.assertEqual(objectmap.count_under((u'',)), 5)
+
+    def test_stale_subtree_at_top(self):
+        objectmap, root = self._makeTree()
+        objectmap.add(Dummy(), (u'', u'gone'))
+        problems = self._callFUT(objectmap, root)
+        self.assertEqual(
+            problems,
+            [('stale', (u'', u'gone'), 6),
+             ('pathindex', (u'', u'gone'), None),
+             ('pathindex', (u'',), None)])
+        self._assertRepaired(objectmap, root)
+        self.assertEqual(sorted(objectmap.pathlookup((u'',))),
+                         [1, 2, 3, 4, 5])
+
+    def test_unregistered(self):
+        objectmap, root = self._makeTree()
+        root['a']['new'] = testing.DummyResource()
+        problems = self._callFUT(objectmap, root)
+        self.assertEqual(problems[0], ('unregistered', (u'', u'a', u'new'),
+                                       None))
+        self._assertRepaired(objectmap, root, max_size=2)
+        objectid = root['a']['new'].__objectid__
+        self.assertEqual(objectmap.path_for(objectid), (u'', u'a', u'new'))
+        self.assertEqual(objectmap.count_under((u'', u'a')), 4)
+
+    def test_moved(self):
+        objectmap, root = self._makeTree()
+        z = root['z']
+        del root['z']
+        root['y'] = z
+        problems = self._callFUT(objectmap, root)
+        self.assertEqual(
+            sorted(problems),
+            [('moved', (u'', u'y'), 5),
+             ('pathindex', (u'', u'y'), None),
+             ('pathindex', (u'', u'z'), None),
+             ('stale', (u'', u'z'), 5)])
+        self._assertRepaired(objectmap, root)
+        self.assertEqual(objectmap.path_for(5), (u'', u'y'))
+        self.assertEqual(objectmap.objectid_for((u'', u'z')), None)
+
+    def test_path_mapped_to_other_objectid(self):
+        objectmap, root = self._makeTree()
+        objectmap.path_to_objectid[(u'', u'a', u'b')] = 4
+        problems = self._callFUT(objectmap, root)
+        self.assertEqual(problems, [('path', (u'', u'a', u'b'), 3)])
+        self._assertRepaired(objectmap, root)
+
+    def test_pathindex_in_subtree(self):
+        objectmap, root = self._makeTree()
+        objectmap.pathindex[(u'', u'a')][1].remove(3)
+        problems = self._callFUT(objectmap, root)
+        self.assertEqual(problems, [('pathindex', (u'', u'a'), None)])
+        self._assertRepaired(objectmap, root)
+        self.assertEqual(list(objectmap.pathindex[(u'', u'a')][1]), [3, 4])
+
+    def test_pathindex_ancestor_missing_member(self):
+        objectmap, root = self._makeTree()
+        objectmap.pathindex[(u'',)][2].remove(3)
+        problems = self._callFUT(objectmap, root)
+        self.assertEqual(
+            problems,
+            [('pathindex', (u'',), 3), ('pathindex', (u'',), None)])
+        self._assertRepaired(objectmap, root)
+        self.assertEqual(list(objectmap.pathindex[(u'',)][2]), [3, 4])
+
+    def test_pathindex_ancestor_extra_member(self):
+        objectmap, root = self._makeTree()
+        objectmap.pathindex[(u'',)][2].insert(99)
+        problems = self._callFUT(objectmap, root, max_size=1)
+        self.assertEqual(problems, [('pathindex', (u'',), None)])
+        self._assertRepaired(objectmap, root, max_size=1)
+        self.assertEqual(objectmap.count_under((u'',), depth=2), 5)
+
+    def test_pathcounts(self):
+        objectmap, root = self._makeTree()
+        objectmap.pathcounts[(u'', u'a')][1].change(1)
+        problems = self._callFUT(objectmap, root)
+        self.assertEqual(problems, [('pathindex', (u'', u'a'), None)])
+        self._assertRepaired(objectmap, root)
+        self.assertEqual(objectmap.count_under((u'', u'a')), 3)
+
+    def test_mapper(self):
+        from .check import check_subtree
+        objectmap, root = self._makeTree()
+        mapped = []
+        def mapper(paths):
+            mapped.extend(paths)
+            return [check_subtree(objectmap, root, path) for path in paths]
+        self.assertEqual(
+            self._callFUT(objectmap, root, max_size=2, mapper=mapper), [])
+        self.assertEqual(mapped, [(u'', u'z'), (u'', u'a', u'b'),
+                                  (u'', u'a', u'c')])
+
+    def test_describe(self):
+        from .check import describe
+        self.assertEqual(describe(('stale', (u'', u'a'), 1)),
+                         '/a: path in the object map has no object '
+                         '(objectid 1)')
+        self.assertEqual(describe(('pathindex', (u'',), None)),
+                         '/: pathindex entry is wrong')
+
 class Dummy(object):
     pass
 
+class DummyTransactionManager(object):
+    def __init__(self):
+        self.txn = object()
+
+    def get(self):
+        return self.txn
+
+class DummyJar(object):
+    def __init__(self):
+        self.transaction_manager = DummyTransactionManager()
+        self.prefetched = []
+
+    def prefetch(self, objects):
+        self.prefetched.append(objects)
+
+    def register(self, obj):
+        pass
+
+class DummyAllocator(object):
+    def __init__(self):
+        self.objectmaps = []
+
+    def new_objectid(self, objectmap):
+        self.objectmaps.append(objectmap)
+        return 42
+
 def resource(path):
     path_tuple = split(path)
     parent = None
@@ -1917,9 +3455,12 @@ def split(s):
     return (u'',) + tuple(filter(None, s.split(u'/')))
 
 class DummyObjectMap(object):
-    def __init__(self, targetids=(), sourceids=(), result=None, toraise=None):
+    def __init__(self, targetids=(), sourceids=(), result=None, toraise=None,
+                 paths=None):
         self.added = []
         self.removed = []
+        self.moved = []
+        self.paths = paths or {}
         self.connected = []
         self.disconnected = []
         self._targetids = targetids
@@ -1935,14 +3476,27 @@ class DummyObjectMap(object):
             obj.__objectid__ = objectid
         return objectid
 
+    def add_many(self, nodes, replace_oid=False):
+        self.replace_oid = replace_oid
+        return [self.add(obj, path) for obj, path in nodes]
+
     def remove(self, objectid, references=True):
         self.references_removed = references
         self.removed.append(objectid)
         return [objectid]
 
+    def move(self, old_path_tuple, new_path_tuple):
+        self.moved.append((old_path_tuple, new_path_tuple))
+
+    def path_for(self, objectid):
+        return self.paths.get(objectid)
+
     def object_for(self, objectid):
         return self.result
 
+    def objects_for(self, objectids):
+        return iter([self.object_for(oid) for oid in objectids])
+
     def targetids(self, context, reftype):
         return self._targetids
 
@@ -1959,6 +3513,24 @@ class DummyObjectMap(object):
             raise self.toraise
         self.connected.append((source, target, reftype))
 
+    def connect_many(self, source, targets, reftype, ignore_missing=False):
+        for target in targets:
+            self.connect(source, target, reftype)
+
+    def connect_many_sources(self, sources, target, reftype,
+                             ignore_missing=False):
+        for source in sources:
+            self.connect(source, target, reftype)
+
+    def disconnect_many(self, source, targets, reftype, ignore_missing=False):
+        for target in targets:
+            self.disconnect(source, target, reftype)
+
+    def disconnect_many_sources(self, sources, target, reftype,
+                                ignore_missing=False):
+        for source in sources:
+            self.disconnect(source, target, reftype)
+
 
 class DummyEvent(object):
     def __init__(self, object, parent, moving=False, duplicating=False):
@@ -1969,7 +3541,10 @@ class DummyEvent(object):
 
 class DummyTreeSet(set):
     def insert(self, val):
+        if val in self:
+            return 0
         self.add(val)
+        return 1
 
 class DummyReferenceSet(object):
     def __init__(self, result=True):
@@ -2006,6 +3581,12 @@ class DummyReferenceMap(dict):
     def targetids(self, oid, reftype):
         return self._targetids
 
+    def count_sources(self, oid, reftype):
+        return len(self._sourceids)
+
+    def count_targets(self, oid, reftype):
+        return len(self._targetids)
+
 def _makeSite(objectmap):
     from ..interfaces import IFolder
     from zope.interface import alsoProvides
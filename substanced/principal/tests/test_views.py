@@ -37,7 +37,7 @@ class TestAddUserView(unittest.TestCase):
         resp = inst.add_success({'login':'name', 'groups':(1,)})
         self.assertEqual(context['name'], resource)
         self.assertEqual(resp.location, 'http://example.com')
-        self.assertEqual(resource.connected, (1,))
+        self.assertEqual(resource.groupids.connected, (1,))
 
 class TestAddGroupView(unittest.TestCase):
     def _makeOne(self, context, request):
@@ -59,6 +59,7 @@ class TestAddGroupView(unittest.TestCase):
         resp = inst.add_success({'name':'name', 'members':(1,)})
         self.assertEqual(context['name'], resource)
         self.assertEqual(resp.location, 'http://example.com')
+        self.assertEqual(resource.memberids.connected, (1,))
 
 class Test_password_validator(unittest.TestCase):
     def _makeOne(self, node, kw):
@@ -176,9 +177,14 @@ class Test_login_validator(unittest.TestCase):
         inst = self._makeOne(None, dict(request=request, context=site))
         self.assertEqual(inst(None, 'fred'), None)
 
+class DummyMultireference(object):
+    def connect(self, objects):
+        self.connected = objects
+
 class DummyPrincipal(object):
-    def connect(self, *args):
-        self.connected = args
+    def __init__(self):
+        self.groupids = DummyMultireference()
+        self.memberids = DummyMultireference()
 
     def set_password(self, password):
         self.password = password
@@ -7,7 +7,6 @@ from ..form import FormView
 from ..sdi import mgmt_view
 from ..schema import Schema
 from ..content import find_service
-from ..objectmap import find_objectmap
 
 from ..interfaces import (
     IUsers,
@@ -19,7 +18,6 @@ from ..interfaces import (
 from . import (
     UserSchema,
     GroupSchema,
-    UserToGroup,
     )
 
 class AddUserSchema(UserSchema):
@@ -57,10 +55,8 @@ class AddUserView(FormView):
         groups = appstruct.pop('groups')
         user = registry.content.create('User', **appstruct)
         self.context[name] = user
-        objectmap = find_objectmap(self.context)
         if groups:
-            for group_id in groups:
-                objectmap.connect(user, group_id, UserToGroup)
+            user.groupids.connect(groups)
         return HTTPFound(self.request.mgmt_path(self.context))
 
 @mgmt_view(
@@ -81,10 +77,8 @@ class AddGroupView(FormView):
         members = appstruct.pop('members')
         group = registry.content.create('Group', **appstruct)
         self.context[name] = group
-        objectmap = find_objectmap(self.context)
         if members:
-            for member_id in members:
-                objectmap.connect(group, member_id, UserToGroup)
+            group.memberids.connect(members)
         return HTTPFound(self.request.mgmt_path(self.context))
 
 @colander.deferred
@@ -93,6 +93,8 @@ class PropertySheetsView(FormView):
         appstruct = self.active_sheet.get()
         return {'form':form.render(appstruct=appstruct, readonly=readonly)}
 
+_marker = object()
+
 @implementer(IPropertySheet)
 class PropertySheet(object):
     """ Convenience base class for concrete property sheet implementations """
@@ -103,6 +105,9 @@ class PropertySheet(object):
         ('change', 'sdi.edit-properties'),
         )
 
+    # the names of the attributes changed by ``set``, if it knows them
+    changed = None
+
     def __init__(self, context, request):
         self.context = context
         self.request = request
@@ -115,11 +120,15 @@ class PropertySheet(object):
         return dict(context.__dict__)
 
     def set(self, struct):
+        changed = []
         for k in struct:
+            if getattr(self.context, k, _marker) != struct[k]:
+                changed.append(k)
             setattr(self.context, k, struct[k])
+        self.changed = changed
 
     def after_set(self):
-        event = ObjectModified(self.context)
+        event = ObjectModified(self.context, self.changed)
         self.request.registry.subscribers((self.context, event), None)
         self.request.flash_with_undo('Updated properties', 'success')
 
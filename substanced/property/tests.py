@@ -179,6 +179,15 @@ class TestPropertySheet(unittest.TestCase):
         inst.set(dict(title='t', description='d'))
         self.assertEqual(context.title, 't')
         self.assertEqual(context.description, 'd')
+        self.assertEqual(sorted(inst.changed), ['description', 'title'])
+
+    def test_set_unchanged(self):
+        context = testing.DummyResource()
+        request = testing.DummyRequest()
+        inst = self._makeOne(context, request)
+        context.title = 'title'
+        inst.set(dict(title='title', description='d'))
+        self.assertEqual(inst.changed, ['description'])
 
     def test_after_set(self):
         request = testing.DummyRequest()
@@ -190,8 +199,11 @@ class TestPropertySheet(unittest.TestCase):
         request.flash_with_undo = flash_with_undo
         context = testing.DummyResource()
         inst = self._makeOne(context, request)
+        inst.changed = ['title']
         inst.after_set()
         self.assertTrue(request.registry.subscribed)
+        event = request.registry.subscribed[0][0][1]
+        self.assertEqual(event.attributes, ['title'])
         self.assertTrue(context.flashed)
 
 class Test_has_permission_to_view_any_propertysheet(unittest.TestCase):
@@ -14,7 +14,10 @@ from ..content import content
 from ..property import PropertySheet
 from ..interfaces import IRoot
 from ..util import oid_of
-from ..objectmap import ObjectMap
+from ..objectmap import (
+    ObjectMap,
+    BlockObjectidAllocator,
+    )
 
 class RootSchema(Schema):
     """ The schema representing site properties. """
@@ -49,6 +52,12 @@ class Root(Folder):
     a member of an ``admins`` group.  The ``admins`` group will be granted
     the ``ALL_PERMISSIONS`` special permission in the root.
 
+    If the ``substanced.objectid_allocator`` deployment setting is
+    ``block``, the object map will hand out objectids using a
+    :class:`substanced.objectmap.BlockObjectidAllocator` with blocks of
+    ``substanced.objectid_block_size`` (default ``1000``) objectids instead of
+    choosing them randomly.
+
     If this class is created by hand, its ``after_create`` method
     must be called manually to set up the services, user, and group.
     """
@@ -69,6 +78,17 @@ class Root(Folder):
                 )
         login = settings.get('substanced.initial_login', 'admin')
         email = settings.get('substanced.initial_email', 'admin@example.com')
+        allocator = settings.get('substanced.objectid_allocator', 'random')
+        if allocator == 'block':
+            block_size = int(
+                settings.get('substanced.objectid_block_size', 1000))
+            self.__objectmap__.objectid_allocator = BlockObjectidAllocator(
+                block_size=block_size)
+        elif allocator != 'random':
+            raise ConfigurationError(
+                'substanced.objectid_allocator must be "random" or "block", '
+                'not %r' % (allocator,)
+                )
         # side effect of ObjectMap constructor: it sets the ``__objectmap__``
         # attribute of the argument you pass it.
         principals = registry.content.create('Principals')
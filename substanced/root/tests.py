@@ -57,6 +57,30 @@ class TestRoot(unittest.TestCase):
         self.assertTrue(inst.__acl__)
         self.assertFalse(registry.created.__sd_deletable__)
 
+    def test_after_create_block_allocator(self):
+        from ..objectmap import BlockObjectidAllocator
+        settings = {
+            'substanced.initial_password':'pass',
+            'substanced.objectid_allocator':'block',
+            'substanced.objectid_block_size':'10',
+            }
+        registry = self._makeRegistry(settings)
+        inst = self._makeOne()
+        inst.after_create(inst, registry)
+        allocator = inst.__objectmap__.objectid_allocator
+        self.assertEqual(allocator.__class__, BlockObjectidAllocator)
+        self.assertEqual(allocator.block_size, 10)
+
+    def test_after_create_bad_allocator(self):
+        from pyramid.exceptions import ConfigurationError
+        settings = {
+            'substanced.initial_password':'pass',
+            'substanced.objectid_allocator':'wrong',
+            }
+        registry = self._makeRegistry(settings)
+        inst = self._makeOne()
+        self.assertRaises(ConfigurationError, inst.after_create, inst, registry)
+
     def test_after_create_without_password(self):
         from pyramid.exceptions import ConfigurationError
         settings = {}
@@ -56,13 +56,18 @@ class DocumentPropertySheet(PropertySheet):
 
     def set(self, struct):
         context = self.context
+        changed = []
         newname = struct['name']
         oldname = context.__name__
         if newname != oldname:
             parent = context.__parent__
             parent.rename(oldname, newname)
-        context.body = struct['body']
-        context.title = struct['title']
+            changed.append('__name__')
+        for name in ('body', 'title'):
+            if getattr(context, name) != struct[name]:
+                setattr(context, name, struct[name])
+                changed.append(name)
+        self.changed = changed
 
 @content(
     'Document',
@@ -72,6 +77,13 @@ class DocumentPropertySheet(PropertySheet):
         ('Basic', DocumentPropertySheet),
         ),
     catalog=True,
+    index_dependencies={
+        'name':('__name__',),
+        'title':('title',),
+        'texts':('title', 'body'),
+        'interfaces':(),
+        'path':(),
+        },
     )
 class Document(Persistent):
     def __init__(self, title, body):
@@ -0,0 +1,117 @@
+""" Compare the object map with the resource tree and report (or repair) any
+differences """
+
+import multiprocessing
+import sys
+from optparse import OptionParser
+
+import transaction
+from ZODB.POSException import ConflictError
+
+from pyramid.paster import (
+    setup_logging,
+    bootstrap,
+    )
+
+from substanced.objectmap import find_objectmap
+from substanced.objectmap.check import (
+    check_objectmap,
+    check_subtree,
+    describe,
+    )
+
+# the root of the resource tree in a worker process
+_worker = {}
+
+def _init_worker(config_uri):
+    env = bootstrap(config_uri)
+    _worker['root'] = env['root']
+
+def _check_subtree(args, attempts=3):
+    # Check (and maybe repair) one subtree in a worker process, using the
+    # worker's own database connection
+    path_tuple, repair = args
+    root = _worker['root']
+    for attempt in range(attempts):
+        transaction.begin()
+        objectmap = find_objectmap(root)
+        result = check_subtree(objectmap, root, path_tuple, repair)
+        if not (repair and result[0]):
+            transaction.abort()
+            return result
+        try:
+            transaction.commit()
+            return result
+        except ConflictError:
+            transaction.abort()
+            if attempt == attempts - 1:
+                raise
+
+def main(argv=sys.argv):
+    parser = OptionParser(description=__doc__)
+    parser.add_option('-r', '--repair', dest='repair',
+        action="store_true", default=False,
+        help="Make the object map agree with the resource tree")
+    parser.add_option('-j', '--processes', dest='processes',
+        action="store", default=1,
+        help="Check subtrees in N worker processes, each with its own "
+             "database connection (requires a storage which can be opened "
+             "by several processes, such as ZEO or RelStorage)")
+    parser.add_option('-m', '--max-size', dest='max_size',
+        action="store", default=10000,
+        help="Divide subtrees of more than N objects among worker processes")
+
+    options, args = parser.parse_args(argv[1:])
+
+    if args:
+        config_uri = args[0]
+    else:
+        parser.error("Requires a config_uri as an argument")
+
+    processes = int(options.processes)
+    repair = options.repair
+
+    setup_logging(config_uri)
+    env = bootstrap(config_uri)
+    root = env['root']
+    objectmap = find_objectmap(root)
+
+    if objectmap is None:
+        parser.error('No object map found in the database')
+
+    mapper = None
+
+    if processes > 1:
+        def mapper(paths):
+            pool = multiprocessing.Pool(
+                processes, _init_worker, (config_uri,))
+            try:
+                results = pool.map(
+                    _check_subtree, [(path, repair) for path in paths],
+                    chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+            # see the repairs committed by the workers
+            transaction.begin()
+            return results
+
+    problems = check_objectmap(
+        objectmap, root, repair=repair, max_size=int(options.max_size),
+        mapper=mapper)
+
+    for problem in problems:
+        print describe(problem)
+
+    if repair and problems:
+        transaction.commit()
+        print '%s problem(s) repaired' % len(problems)
+    else:
+        transaction.abort()
+        print '%s problem(s) found' % len(problems)
+
+    if problems and not repair:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
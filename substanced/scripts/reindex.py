@@ -1,8 +1,11 @@
 """ Reindex the catalog  """
 
+import multiprocessing
 import re
 from optparse import OptionParser
 
+import transaction
+
 from pyramid.paster import (
     setup_logging,
     bootstrap,
@@ -13,8 +16,30 @@ from pyramid.traversal import (
     resource_path,
     )
 
+from substanced.catalog import compute_reindex_values
 from substanced.content import find_service
 
+# the catalog in a worker process
+_worker = {}
+
+def _init_worker(config_uri, site_path):
+    env = bootstrap(config_uri)
+    site = env['root']
+    if site_path:
+        site = traverse(site, site_path)['context']
+    _worker['catalog'] = find_service(site, 'catalog')
+
+def _compute_shard(args):
+    # Compute the index values for one shard of objectids in a worker
+    # process, using the worker's own database connection
+    shard, indexes, path_re = args
+    transaction.begin()
+    try:
+        return compute_reindex_values(
+            _worker['catalog'], shard, indexes, path_re)
+    finally:
+        transaction.abort()
+
 def main():
     parser = OptionParser(description=__doc__)
     parser.add_option('-d', '--dry-run', dest='dry_run',
@@ -30,6 +55,18 @@ def main():
         action="append", help="Reindex only the given index (can be repeated)")
     parser.add_option('-s', '--site', dest='site',
         action="store", default=None, metavar='PATH')
+    parser.add_option('-r', '--resume', dest='resume',
+        action="store_true", default=False,
+        help="Continue an interrupted reindex from its last commit")
+    parser.add_option('-m', '--max-memory', dest='max_memory',
+        action="store", default=None, metavar='MB',
+        help="Shrink the database cache whenever the process uses more "
+             "than MB megabytes")
+    parser.add_option('-j', '--processes', dest='processes',
+        action="store", default=1,
+        help="Compute index values in N worker processes, each with its own "
+             "database connection (requires a storage which can be opened "
+             "by several processes, such as ZEO or RelStorage)")
 
     options, args = parser.parse_args()
 
@@ -45,6 +82,8 @@ def main():
         path_re = None
 
     kw = {}
+    if options.max_memory:
+        kw['max_memory'] = int(options.max_memory)
     if options.indexes:
         kw['indexes'] = options.indexes
 
@@ -52,15 +91,31 @@ def main():
     env = bootstrap(config_uri)
     site = env['root']
     if options.site:
-        site = traverse(site, options.site)
+        site = traverse(site, options.site)['context']
 
     catalog = find_service(site, 'catalog')
 
     if catalog is None:
         raise KeyError('No catalog service found at ' % resource_path(site))
 
+    processes = int(options.processes)
+
+    if processes > 1:
+        def mapper(shards, indexes, path_re):
+            pool = multiprocessing.Pool(
+                processes, _init_worker, (config_uri, options.site))
+            try:
+                for batch in pool.imap(
+                    _compute_shard,
+                    [(shard, indexes, path_re) for shard in shards]):
+                    yield batch
+            finally:
+                pool.close()
+                pool.join()
+        kw['mapper'] = mapper
+
     catalog.reindex(path_re=path_re, commit_interval=commit_interval,
-                    dry_run=options.dry_run, **kw)
+                    dry_run=options.dry_run, resume=options.resume, **kw)
 
 if __name__ == '__main__':
     main()
@@ -159,7 +159,18 @@ class Batch(object):
 
       The text to display on the multi-column/single column toggle.
 
-    The ``seq`` passed must define ``__len__`` and ``__slice__`` methods.
+    ``complete``
+
+      ``True`` if ``last`` is the number of the last batch, ``False`` if it
+      is only the number of the last batch known so far (see below).
+
+    The ``seq`` passed must define ``__len__`` and ``__slice__`` methods,
+    unless ``seqlen`` is passed or ``seq`` is a lazy sequence with an
+    ``at_least`` method and an ``exhausted`` attribute such as
+    :class:`substanced.catalog.PermittedResults`.  A lazy sequence is only
+    asked whether it has at least one more item than the current batch
+    needs; if it isn't exhausted afterwards, ``last`` is the number of the
+    last batch known so far and ``last_url`` is ``None``.
 
     ``make_columns``
 
@@ -198,6 +209,12 @@ class Batch(object):
 
         start = num * size
         end = start + size
+        complete = True
+        if seqlen is None and hasattr(seq, 'at_least'):
+            # a lazy sequence; it only needs to tell whether there's a next
+            # batch
+            seqlen = seq.at_least(end + 1)
+            complete = seq.exhausted
         items = list(itertools.islice(seq, start, end))
         length = len(items)
         if seqlen is None:
@@ -217,7 +234,7 @@ class Batch(object):
             prev_url = merge_url_qs(url, batch_size=size, batch_num=num-1)
         if seqlen > end:
             next_url = merge_url_qs(url, batch_size=size, batch_num=num+1)
-        if size and (num < last):
+        if size and (num < last) and complete:
             last_url = merge_url_qs(url, batch_size=size, batch_num=last)
 
         if prev_url or next_url:
@@ -241,6 +258,7 @@ class Batch(object):
         self.next_url = next_url
         self.last_url = last_url
         self.last = last
+        self.complete = complete
 
     def make_columns(self, column_size=10, num_columns=4):
         """ Break ``self.items`` into a nested list representing columns."""
@@ -116,6 +116,38 @@ class TestBatch(unittest.TestCase):
         self.assertEqual(inst.last_url,
                          'http://example.com?batch_num=2&batch_size=3')
 
+    def test_it_first_batch_of_3_lazy(self):
+        seq = DummyLazySequence([1,2,3,4,5,6,7])
+        request = testing.DummyRequest()
+        request.params['batch_num'] = 0
+        request.params['batch_size'] = 3
+        request.url = 'http://example.com'
+        inst = self._makeOne(seq, request)
+        self.assertEqual(seq.asked, [4])
+        self.assertEqual(inst.items, [1,2,3])
+        self.assertEqual(inst.length, 3)
+        self.assertEqual(inst.last, 1)
+        self.assertEqual(inst.complete, False)
+        self.assertEqual(inst.required, True)
+        self.assertEqual(inst.next_url,
+                         'http://example.com?batch_num=1&batch_size=3')
+        self.assertEqual(inst.last_url, None)
+
+    def test_it_last_batch_of_3_lazy(self):
+        seq = DummyLazySequence([1,2,3,4,5,6,7])
+        request = testing.DummyRequest()
+        request.params['batch_num'] = 2
+        request.params['batch_size'] = 3
+        request.url = 'http://example.com'
+        inst = self._makeOne(seq, request)
+        self.assertEqual(seq.asked, [10])
+        self.assertEqual(inst.items, [7])
+        self.assertEqual(inst.last, 2)
+        self.assertEqual(inst.complete, True)
+        self.assertEqual(inst.next_url, None)
+        self.assertEqual(inst.prev_url,
+                         'http://example.com?batch_num=1&batch_size=3')
+
     def test_it_second_batch_of_3(self):
         seq = [1,2,3,4,5,6,7]
         request = testing.DummyRequest()
@@ -378,6 +410,22 @@ class Test_acquire(unittest.TestCase):
         inst.abc = '123'
         self.assertEqual(self._callFUT(inst, 'abc'), '123')
 
+class DummyLazySequence(object):
+    exhausted = False
+    def __init__(self, items):
+        self.items = items
+        self.asked = []
+
+    def at_least(self, n):
+        self.asked.append(n)
+        if n >= len(self.items):
+            self.exhausted = True
+            return len(self.items)
+        return n
+
+    def __iter__(self):
+        return iter(self.items)
+
 class DummyContent(object):
     def __init__(self, result):
         self.result = result
@@ -11,12 +11,20 @@ from ..interfaces import (
     IWorkflow,
     IDefaultWorkflow,
     )
+from ..catalog import reindex_permissions
 from ..content import get_content_type
 from ..event import subscribe_added
 
 
 STATE_ATTR = '__workflow_state__'
 
+def _acl_of(content):
+    # a copy, as the ACL may be changed in place
+    acl = getattr(content, '__acl__', None)
+    if acl is None:
+        return None
+    return list(acl)
+
 class WorkflowError(Exception):
     """Exception raised for anything related to :mod:`substanced.workflow`.
     """
@@ -142,6 +150,7 @@ class Workflow(object):
         callback = getattr(new_state, '__call__', None)
         if callback is None:
             callback = self._states[state].get('callback')
+        acl = _acl_of(content)
         if callback is not None:
             msg = callback(content,
                            request=request,
@@ -149,6 +158,9 @@ class Workflow(object):
                            workflow=self,
                           )
         states[self.type] = state
+        if _acl_of(content) != acl:
+            # keep the catalog's permission indexes current
+            reindex_permissions(content)
         return state, msg
 
     def state_of(self, content):
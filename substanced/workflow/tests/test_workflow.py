@@ -332,6 +332,27 @@ class WorkflowTests(unittest.TestCase):
                           'name': 'publish'})
         self.assertEqual(ob.info['workflow'], sm)
 
+    def test__transition_with_state_callback_changing_acl(self):
+        def dummy(content, **kw):
+            content.__acl__.append(('Allow', 'bob', 'view'))
+        sm = self._makePopulated(state_callback=dummy)
+        ob = DummyContent()
+        ob.__acl__ = []
+        ob.__workflow_state__ = {'basic': 'pending'}
+        with mock.patch('substanced.workflow.reindex_permissions') as reindex:
+            sm._transition(ob, 'publish')
+        reindex.assert_called_once_with(ob)
+
+    def test__transition_with_state_callback_not_changing_acl(self):
+        def dummy(content, **kw):
+            content.info = kw
+        sm = self._makePopulated(state_callback=dummy)
+        ob = DummyContent()
+        ob.__workflow_state__ = {'basic': 'pending'}
+        with mock.patch('substanced.workflow.reindex_permissions') as reindex:
+            sm._transition(ob, 'publish')
+        self.assertFalse(reindex.called)
+
     def test__transition_with_custom_state_callback(self):
         class _State(dict):
             _called = None